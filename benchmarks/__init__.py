@@ -0,0 +1,247 @@
+"""Benchmark suite for the hot paths of pyvat.
+
+Benchmarks are registered by :func:`benchmark` and measure the time per
+operation in seconds. Results are reported in a stable, versioned JSON
+format so they can be compared between pyvat versions by :func:`compare`.
+"""
+
+import collections
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import pyvat
+
+
+FORMAT_VERSION = 1
+"""Version of the results format.
+
+Results of different format versions cannot be compared.
+"""
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), 'fixtures')
+"""Path of the directory of benchmark fixtures."""
+
+BENCHMARKS = collections.OrderedDict()
+"""Registered benchmarks by name."""
+
+
+def benchmark(name):
+    """Register a benchmark.
+
+    The decorated function is a generator function, which performs any
+    setup, yields the operation to measure as a function taking no
+    arguments, and performs any teardown after the measurement.
+
+    :param name: Unique name of the benchmark.
+    """
+
+    def register(function):
+        if name in BENCHMARKS:
+            raise ValueError('benchmark %s is already registered' % (name))
+        BENCHMARKS[name] = contextlib.contextmanager(function)
+        return function
+    return register
+
+
+def load_fixture(name):
+    """Load a JSON fixture.
+
+    :param name: File name of the fixture.
+    :returns: the decoded fixture.
+    """
+
+    with open(os.path.join(FIXTURES_PATH, name)) as f:
+        return json.load(f, object_pairs_hook=collections.OrderedDict)
+
+
+def _time(operation, loops):
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started_at = time.perf_counter()
+        for _ in range(loops):
+            operation()
+        return time.perf_counter() - started_at
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def measure(operation, repeat=5, min_time=0.2):
+    """Measure the time an operation takes.
+
+    The operation is looped enough times for each sample to take at least
+    the minimum time, after which the given number of samples is taken.
+
+    :param operation: Function taking no arguments.
+    :param repeat: Number of samples to take.
+    :param min_time: Minimum time in seconds of each sample.
+    :returns:
+        a :class:`dict` of the number of loops per sample, the samples and
+        their minimum, median, mean and standard deviation in seconds per
+        operation.
+    """
+
+    # Calibrate the number of loops like timeit, which also warms up.
+    loops = 1
+    while True:
+        for factor in (1, 2, 5):
+            if _time(operation, loops * factor) >= min_time:
+                loops *= factor
+                break
+        else:
+            loops *= 10
+            continue
+        break
+
+    samples = [_time(operation, loops) / loops for _ in range(repeat)]
+    return collections.OrderedDict((
+        ('loops', loops),
+        ('repeat', repeat),
+        ('min', min(samples)),
+        ('median', statistics.median(samples)),
+        ('mean', statistics.mean(samples)),
+        ('stdev', statistics.stdev(samples) if repeat > 1 else 0.0),
+        ('samples', samples),
+    ))
+
+
+def get_environment():
+    """Describe the environment benchmarks are run in.
+
+    :returns: a :class:`dict` describing the environment.
+    """
+
+    return collections.OrderedDict((
+        ('pyvat', pyvat.__version__),
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('platform', platform.platform()),
+        ('machine', platform.machine()),
+        ('processor', platform.processor()),
+    ))
+
+
+def run(names=None, repeat=5, min_time=0.2, progress=None):
+    """Run benchmarks.
+
+    :param names:
+        Optional names of the benchmarks to run. Default ``None`` running
+        all registered benchmarks.
+    :param repeat: Number of samples to take per benchmark.
+    :param min_time: Minimum time in seconds of each sample.
+    :param progress:
+        Optional function called with the name and result of each benchmark
+        as it completes.
+    :returns: the results in the results format.
+    """
+
+    if names is None:
+        names = list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError('unknown benchmarks: %s' % (', '.join(unknown)))
+
+    benchmarks = collections.OrderedDict()
+    for name in names:
+        with BENCHMARKS[name]() as operation:
+            benchmarks[name] = measure(operation, repeat, min_time)
+        if progress is not None:
+            progress(name, benchmarks[name])
+
+    return collections.OrderedDict((
+        ('format_version', FORMAT_VERSION),
+        ('created_at', datetime.datetime.utcnow().strftime(
+            '%Y-%m-%dT%H:%M:%SZ'
+        )),
+        ('environment', get_environment()),
+        ('unit', 'seconds per operation'),
+        ('benchmarks', benchmarks),
+    ))
+
+
+def compare(baseline, results, threshold=0.1):
+    """Compare benchmark results to a baseline.
+
+    Benchmarks are compared on their median time per operation.
+
+    :param baseline: Baseline results in the results format.
+    :param results: Results in the results format.
+    :param threshold:
+        Relative slowdown from which a benchmark is considered to have
+        regressed. Default ``0.1`` for 10 %.
+    :returns:
+        a :class:`list` of :class:`tuple` of the name, baseline median,
+        median, relative change and whether the benchmark regressed for each
+        benchmark in both results.
+    :raises ValueError: if the results formats differ.
+    """
+
+    if baseline.get('format_version') != results.get('format_version'):
+        raise ValueError('cannot compare results of format version %r to '
+                         'results of format version %r' %
+                         (baseline.get('format_version'),
+                          results.get('format_version')))
+
+    comparison = []
+    for name, result in results['benchmarks'].items():
+        baseline_result = baseline['benchmarks'].get(name)
+        if baseline_result is None:
+            continue
+        change = result['median'] / baseline_result['median'] - 1
+        comparison.append((name,
+                           baseline_result['median'],
+                           result['median'],
+                           change,
+                           change > threshold))
+    return comparison
+
+
+def load_benchmarks():
+    """Import the modules registering the benchmarks of the suite.
+    """
+
+    from . import bench_registries  # noqa: F401
+    from . import bench_sale_vat_charge  # noqa: F401
+    from . import bench_validators  # noqa: F401
+
+
+def format_duration(seconds):
+    """Format a duration with a suitable unit.
+
+    :param seconds: Duration in seconds.
+    :returns: the formatted duration.
+    """
+
+    for unit, factor in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * factor >= 1:
+            return '%.3f %s' % (seconds * factor, unit)
+    return '%.1f ns' % (seconds * 1e9)
+
+
+def write_results(results, f=sys.stdout):
+    """Write results in the results format.
+
+    :param results: Results.
+    :param f: File to write to.
+    """
+
+    json.dump(results, f, indent=2)
+    f.write('\n')
+
+
+__all__ = (
+    'FORMAT_VERSION',
+    'benchmark',
+    'compare',
+    'load_fixture',
+    'measure',
+    'run',
+)
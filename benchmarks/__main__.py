@@ -0,0 +1,99 @@
+import argparse
+import fnmatch
+import json
+import sys
+
+from . import (
+    BENCHMARKS,
+    compare,
+    format_duration,
+    load_benchmarks,
+    run,
+    write_results,
+)
+
+
+def main(argv=None):
+    """Run the benchmark suite.
+
+    :param argv: Optional command line arguments.
+    :returns: the exit status, which is ``1`` if any benchmark regressed.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Run the pyvat benchmark suite.',
+    )
+    parser.add_argument('patterns',
+                        nargs='*',
+                        metavar='PATTERN',
+                        help='shell-style patterns of the benchmarks to run, '
+                             'for example "parse_response.*"')
+    parser.add_argument('-o', '--output',
+                        metavar='PATH',
+                        help='write results to a JSON file')
+    parser.add_argument('-c', '--compare',
+                        metavar='PATH',
+                        help='compare results to baseline results from a '
+                             'JSON file')
+    parser.add_argument('--threshold',
+                        type=float,
+                        default=0.1,
+                        help='relative slowdown considered a regression '
+                             '(default: 0.1)')
+    parser.add_argument('-r', '--repeat',
+                        type=int,
+                        default=5,
+                        help='number of samples per benchmark (default: 5)')
+    parser.add_argument('--min-time',
+                        type=float,
+                        default=0.2,
+                        help='minimum seconds per sample (default: 0.2)')
+    parser.add_argument('-l', '--list',
+                        action='store_true',
+                        help='list the benchmarks and exit')
+    args = parser.parse_args(argv)
+
+    load_benchmarks()
+    names = [name for name in BENCHMARKS
+             if not args.patterns or
+             any(fnmatch.fnmatchcase(name, pattern)
+                 for pattern in args.patterns)]
+    if args.list:
+        for name in names:
+            print(name)
+        return 0
+
+    def progress(name, result):
+        print('%-40s %12s +- %s' % (name,
+                                    format_duration(result['median']),
+                                    format_duration(result['stdev'])),
+              file=sys.stderr)
+
+    results = run(names, args.repeat, args.min_time, progress)
+    if args.output:
+        with open(args.output, 'w') as f:
+            write_results(results, f)
+
+    if not args.compare:
+        return 0
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    regressed = False
+    print(file=sys.stderr)
+    for name, baseline_median, median, change, is_regression in \
+            compare(baseline, results, args.threshold):
+        print('%-40s %12s -> %12s %+7.1f %%%s' % (
+            name,
+            format_duration(baseline_median),
+            format_duration(median),
+            change * 100,
+            ' REGRESSED' if is_regression else '',
+        ), file=sys.stderr)
+        regressed = regressed or is_regression
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
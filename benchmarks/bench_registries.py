@@ -0,0 +1,94 @@
+import os
+
+import pyvat
+from pyvat.registries import HMRCRegistry, ViesRegistry, ViesRestRegistry
+from pyvat.testing import StandInServer
+
+from . import FIXTURES_PATH, benchmark, load_fixture
+
+
+RECORDINGS_PATH = os.path.join(FIXTURES_PATH, 'recordings.json')
+"""Path of the recorded registry responses.
+
+The recordings are in the format of
+:meth:`pyvat.testing.StandInServer.save_recordings`.
+"""
+
+
+def _register_vies_parsing(name, registry_class, key):
+    @benchmark(name)
+    def parse_vies_response():
+        registry = registry_class()
+        recording = load_fixture('recordings.json')[key]
+        content = recording['body'].encode('utf-8')
+        response_tags = registry._get_response_tags(None)
+
+        def operation():
+            registry._process_response(registry.create_result(),
+                                       recording['status'],
+                                       recording['content_type'],
+                                       content,
+                                       response_tags)
+
+        yield operation
+
+
+def _register_hmrc_parsing(name, key):
+    @benchmark(name)
+    def parse_hmrc_response():
+        registry = HMRCRegistry()
+        recording = load_fixture('recordings.json')[key]
+
+        def operation():
+            registry._process_response(registry.create_result(),
+                                       recording['status'],
+                                       recording['content_type'],
+                                       recording['body'],
+                                       None)
+
+        yield operation
+
+
+_register_vies_parsing('parse_response.vies.valid',
+                       ViesRegistry,
+                       'vies:DK54562519')
+_register_vies_parsing('parse_response.vies.invalid',
+                       ViesRegistry,
+                       'vies:DK12345678')
+_register_vies_parsing('parse_response.vies_rest.valid',
+                       ViesRestRegistry,
+                       'vies-rest:DK54562519')
+_register_vies_parsing('parse_response.vies_rest.invalid',
+                       ViesRestRegistry,
+                       'vies-rest:DK12345678')
+_register_hmrc_parsing('parse_response.hmrc.valid', 'hmrc:GB553557881')
+_register_hmrc_parsing('parse_response.hmrc.invalid', 'hmrc:GB123456789')
+
+
+def _register_check(name, registry_class, vat_number):
+    @benchmark(name)
+    def check_against_stand_in():
+        # Replay recorded responses from a local stand-in, so the
+        # measurement covers the client side of a check over loopback.
+        server = StandInServer(default_response=False)
+        server.load_recordings(RECORDINGS_PATH)
+        registries = dict(pyvat.VAT_REGISTRIES)
+        cache = pyvat.VAT_RESULT_CACHE
+
+        with server:
+            registry = server.configure(registry_class())
+            registry.warm_up()
+            pyvat.VAT_REGISTRIES[vat_number[:2]] = registry
+            pyvat.VAT_RESULT_CACHE = None
+            try:
+                yield lambda: pyvat.check_vat_number(vat_number)
+            finally:
+                pyvat.VAT_REGISTRIES.clear()
+                pyvat.VAT_REGISTRIES.update(registries)
+                pyvat.VAT_RESULT_CACHE = cache
+                registry.close()
+
+
+_register_check('check_vat_number.vies', ViesRegistry, 'DK54562519')
+_register_check('check_vat_number.vies_rest', ViesRestRegistry, 'DK54562519')
+_register_check('check_vat_number.hmrc', HMRCRegistry, 'GB553557881')
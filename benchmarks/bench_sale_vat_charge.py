@@ -0,0 +1,43 @@
+import datetime
+
+from pyvat import ItemType, Party, get_sale_vat_charge
+from pyvat.vat_rules import VAT_RULES
+
+from . import benchmark
+
+
+DATES = (datetime.date(2014, 12, 15), datetime.date(2021, 7, 1))
+"""Sale dates before and after the 2015 and 2021 place of supply changes."""
+
+
+@benchmark('get_sale_vat_charge')
+def sale_vat_charge_matrix():
+    # Sales between all countries with VAT rules and a country without, of
+    # all item types supported, to consumers and businesses. Combinations
+    # for which no VAT charge can be determined are left out, so exceptions
+    # do not dominate the measurement.
+    country_codes = sorted(VAT_RULES) + ['US']
+    item_types = [item_type for item_type in ItemType
+                  if item_type.is_electronic_service or
+                  item_type.is_telecommunications_service or
+                  item_type.is_broadcasting_service]
+
+    sales = []
+    for seller_country_code in sorted(VAT_RULES):
+        seller = Party(seller_country_code, True)
+        for buyer_country_code in country_codes:
+            for buyer_is_business in (False, True):
+                buyer = Party(buyer_country_code, buyer_is_business)
+                for item_type in item_types:
+                    for date in DATES:
+                        try:
+                            get_sale_vat_charge(date, item_type, buyer, seller)
+                        except NotImplementedError:
+                            continue
+                        sales.append((date, item_type, buyer, seller))
+
+    def operation():
+        for date, item_type, buyer, seller in sales:
+            get_sale_vat_charge(date, item_type, buyer, seller)
+
+    yield operation
@@ -0,0 +1,64 @@
+import pyvat
+from pyvat import decompose_vat_number, is_vat_number_format_valid
+from pyvat.vectorized import validate_formats
+
+from . import benchmark, load_fixture
+
+
+def _load_vat_numbers():
+    cases = load_fixture('vat_numbers.json')
+    missing = set(pyvat.VAT_NUMBER_EXPRESSIONS) - set(cases)
+    if missing:
+        raise ValueError('no VAT number fixtures for %s' %
+                         (', '.join(sorted(missing))))
+    return [(vat_number, country_code)
+            for country_cases in cases.values()
+            for vat_number, country_code, _ in country_cases]
+
+
+@benchmark('decompose_vat_number')
+def decompose_all_countries():
+    vat_numbers = _load_vat_numbers()
+
+    def operation():
+        for vat_number, country_code in vat_numbers:
+            decompose_vat_number(vat_number, country_code)
+
+    yield operation
+
+
+@benchmark('decompose_vat_number.non_vies_prefix')
+def decompose_non_vies_prefix():
+    # Prefixes without a registry are looked up in the country code index.
+    vat_numbers = ['NO123456789MVA', 'CHE123456789', 'US123456789',
+                   'ZZ123456789']
+
+    def operation():
+        for vat_number in vat_numbers:
+            decompose_vat_number(vat_number)
+
+    yield operation
+
+
+@benchmark('is_vat_number_format_valid')
+def format_valid_all_countries():
+    vat_numbers = _load_vat_numbers()
+
+    def operation():
+        for vat_number, country_code in vat_numbers:
+            is_vat_number_format_valid(vat_number, country_code)
+
+    yield operation
+
+
+@benchmark('validate_formats')
+def validate_formats_all_countries():
+    # The same VAT numbers as is_vat_number_format_valid, validated at once.
+    vat_numbers = _load_vat_numbers()
+    country_codes = [country_code for _, country_code in vat_numbers]
+    vat_numbers = [vat_number for vat_number, _ in vat_numbers]
+
+    def operation():
+        validate_formats(vat_numbers, country_codes)
+
+    yield operation
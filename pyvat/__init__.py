@@ -1,14 +1,19 @@
+import collections
 import re
-import pycountry
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from .countries import ISO_3166_COUNTRY_CODES
 from .item_type import ItemType
+from .metrics import INVALID_FORMAT, NO_REGISTRY, UNDECOMPOSABLE
 from .party import Party
 from .registries import ViesRegistry, HMRCRegistry
-from .result import VatNumberCheckResult
+from .result import BUSINESS_FIELDS, LOG_SUMMARY, VatNumberCheckResult
+from .single_flight import SingleFlight
 from .vat_charge import VatCharge, VatChargeAction
 from .vat_rules import VAT_RULES
 
 
-__version__ = '1.3.18'
+__version__ = '1.4.0'
 
 
 WHITESPACE_EXPRESSION = re.compile(r'[\s\-]+')
@@ -102,6 +107,28 @@ Mapping from ISO 3166-1-alpha-2 country codes to the VAT registry capable of
 validating the VAT number.
 """
 
+_REGISTRY_CHECKS = SingleFlight()
+"""In-flight registry checks.
+
+Concurrent registry checks of the same VAT number are coalesced into one.
+"""
+
+VAT_RESULT_CACHE = None
+"""VAT number check result cache.
+
+Optional :class:`pyvat.cache.ResultCache` instance consulted before checking
+a VAT number against a registry. Default ``None`` disabling caching. Checks
+against test registries are never cached.
+"""
+
+VAT_METRICS = None
+"""VAT number check metrics.
+
+Optional :class:`pyvat.metrics.Metrics` instance recording result cache
+lookups, checks concluded by format pre-validation and the duration of checks
+against registries. Default ``None`` disabling check level metrics.
+"""
+
 
 def decompose_vat_number(vat_number, country_code=None):
     """Decompose a VAT number and an optional country code.
@@ -130,13 +157,9 @@ def decompose_vat_number(vat_number, country_code=None):
         if country_code == 'EL':
             country_code = 'GR'
 
-        if country_code not in VAT_REGISTRIES:
-            try:
-                if not pycountry.countries.get(alpha_2=country_code):
-                    return (vat_number, None)
-            except KeyError:
-                # country code not found
-                return (vat_number, None)
+        if country_code not in VAT_REGISTRIES and \
+                country_code not in ISO_3166_COUNTRY_CODES:
+            return (vat_number, None)
         vat_number = vat_number[2:]
     elif vat_number[0:2] == country_code:
         vat_number = vat_number[2:]
@@ -175,27 +198,30 @@ def is_vat_number_format_valid(vat_number, country_code=None):
     return True
 
 
-def check_vat_number(vat_number, country_code=None, test=False):
-    """Check if a VAT number is valid.
+def _record_check_skipped(reason):
+    """Record a check concluded without consulting a registry, if enabled.
+    """
 
-    If possible, the VAT number will be checked against available registries.
+    if VAT_METRICS is not None:
+        VAT_METRICS.record_check_skipped(reason)
+
+
+def _check_vat_number_format(vat_number, country_code):
+    """Decompose and validate the format of a VAT number prior to a check.
 
     :param vat_number: VAT number to validate.
-    :param country_code:
-        Optional country code. Should be supplied if known, as there is no
-        guarantee that naively entered VAT numbers contain the correct alpha-2
-        country code prefix for EU countries just as not all non-EU countries
-        have a reliable country code prefix. Default ``None`` prompting
-        detection.
+    :param country_code: Optional country code.
     :returns:
-        a :class:`VatNumberCheckResult` instance containing the result for
-        the full VAT number check.
+        a :class:`tuple` of the decomposed VAT number, country code and a
+        :class:`VatNumberCheckResult` if the check can be concluded without
+        consulting a registry or ``None`` otherwise.
     """
 
     # Decompose the VAT number.
     vat_number, country_code = decompose_vat_number(vat_number, country_code)
     if not vat_number or not country_code:
-        return VatNumberCheckResult(False, [
+        _record_check_skipped(UNDECOMPOSABLE)
+        return vat_number, country_code, VatNumberCheckResult(False, [
             '> Unable to decompose VAT number, resulted in %r and %r' %
             (vat_number, country_code)
         ])
@@ -203,16 +229,391 @@ def check_vat_number(vat_number, country_code=None, test=False):
     # Test the VAT number format.
     format_result = is_vat_number_format_valid(vat_number, country_code)
     if format_result is not True:
-        return VatNumberCheckResult(format_result, [
+        _record_check_skipped(INVALID_FORMAT)
+        return vat_number, country_code, VatNumberCheckResult(format_result, [
             '> VAT number validation failed: %r' % (format_result)
         ])
 
     # Attempt to check the VAT number against a registry.
     if country_code not in VAT_REGISTRIES:
-        return VatNumberCheckResult()
+        _record_check_skipped(NO_REGISTRY)
+        return vat_number, country_code, VatNumberCheckResult()
 
-    return VAT_REGISTRIES[country_code].check_vat_number(vat_number,
-                                                         country_code, test)
+    return vat_number, country_code, None
+
+
+def _get_fields(fields):
+    """Validate the business fields asked for by a check.
+
+    :param fields: Optional iterable of business field names.
+    :returns: a :class:`frozenset` of field names or ``None`` for all fields.
+    :raises ValueError: if any of the field names is unknown.
+    """
+
+    if fields is None:
+        return None
+
+    fields = frozenset(fields)
+    unknown_fields = fields - BUSINESS_FIELDS
+    if unknown_fields:
+        raise ValueError('unknown business fields: %s' %
+                         (', '.join(sorted(unknown_fields))))
+    return fields
+
+
+def check_vat_number(vat_number, country_code=None, test=False, fields=None):
+    """Check if a VAT number is valid.
+
+    If possible, the VAT number will be checked against available registries.
+
+    :param vat_number: VAT number to validate.
+    :param country_code:
+        Optional country code. Should be supplied if known, as there is no
+        guarantee that naively entered VAT numbers contain the correct alpha-2
+        country code prefix for EU countries just as not all non-EU countries
+        have a reliable country code prefix. Default ``None`` prompting
+        detection.
+    :param fields:
+        Optional iterable of the names of the business fields to retrieve
+        from the registry, see :data:`pyvat.result.BUSINESS_FIELDS`. Pass an
+        empty iterable to only check validity. Default ``None`` retrieving
+        all fields.
+    :returns:
+        a :class:`VatNumberCheckResult` instance containing the result for
+        the full VAT number check.
+    """
+
+    fields = _get_fields(fields)
+    vat_number, country_code, result = _check_vat_number_format(vat_number,
+                                                                country_code)
+    if result is not None:
+        return result
+
+    return _check_vat_number_registry(vat_number, country_code, test, fields)
+
+
+def _get_cached_result(cache, vat_number, country_code, fields):
+    """Get a cached result limited to the business fields asked for.
+
+    Cache hits are reported to the hooks of the registry for the country.
+    Results due for revalidation are revalidated in the background.
+
+    :returns: a :class:`VatNumberCheckResult` instance or ``None``.
+    """
+
+    started_at = time.monotonic()
+    result, due = cache.lookup(vat_number, country_code)
+    if VAT_METRICS is not None:
+        VAT_METRICS.record_cache_lookup(result is not None)
+    if result is None:
+        return None
+
+    registry = VAT_REGISTRIES[country_code]
+    registry.notify_cache_hit(vat_number,
+                              country_code,
+                              result,
+                              time.monotonic() - started_at)
+
+    if due:
+        def check():
+            # Share the check with a concurrent check in the foreground.
+            return _REGISTRY_CHECKS.do(
+                (country_code, vat_number, False, None),
+                _check_registry,
+                registry,
+                vat_number,
+                country_code,
+                False,
+                None
+            )[0]
+
+        if cache.revalidate(vat_number, country_code, check):
+            result.log(LOG_SUMMARY,
+                       '> Result is due for revalidation, revalidating in '
+                       'the background')
+    if fields is not None:
+        result = result.project(fields)
+    return result
+
+
+def _check_registry(registry, vat_number, country_code, test, fields):
+    """Check a decomposed VAT number against a registry.
+
+    The fields are only passed to the registry if given.
+
+    :returns: a :class:`VatNumberCheckResult` instance.
+    """
+
+    if fields is None:
+        return registry.check_vat_number(vat_number, country_code, test)
+    return registry.check_vat_number(vat_number, country_code, test, fields)
+
+
+def _check_vat_number_registry(vat_number, country_code, test, fields=None):
+    """Check a decomposed VAT number against the registry for its country.
+
+    Only results with all business fields are cached.
+
+    :param vat_number: VAT number without country code prefix.
+    :param country_code: ISO 3166-1-alpha-2 country code.
+    :param test: Boolean to identify if test or not.
+    :param fields:
+        Names of the business fields to retrieve or ``None`` for all.
+    :returns: a :class:`VatNumberCheckResult` instance.
+    """
+
+    cache = None if test else VAT_RESULT_CACHE
+    if cache is not None:
+        result = _get_cached_result(cache, vat_number, country_code, fields)
+        if result is not None:
+            return result
+
+    metrics = VAT_METRICS
+    started_at = time.monotonic()
+
+    def check():
+        result = _check_registry(VAT_REGISTRIES[country_code],
+                                 vat_number,
+                                 country_code,
+                                 test,
+                                 fields)
+
+        if cache is not None and fields is None:
+            cache.set(vat_number, country_code, result)
+
+        return result
+
+    # Share the result of a concurrent check of the same VAT number, if any.
+    try:
+        result, shared = _REGISTRY_CHECKS.do(
+            (country_code, vat_number, test, fields),
+            check
+        )
+    finally:
+        if metrics is not None:
+            metrics.record_check(VAT_REGISTRIES[country_code].name,
+                                 country_code,
+                                 time.monotonic() - started_at)
+
+    if shared:
+        result = result.copy()
+        result.log(LOG_SUMMARY,
+                   '> Result shared from concurrent check of the same VAT '
+                   'number')
+
+    return result
+
+
+async def check_vat_number_async(vat_number,
+                                 country_code=None,
+                                 test=False,
+                                 fields=None):
+    """Check if a VAT number is valid without blocking the event loop.
+
+    Asynchronous counterpart of :func:`check_vat_number`. Registry requests
+    share one non-blocking connection pool per event loop, see
+    :func:`pyvat.aio.get_client_session`.
+
+    :param vat_number: VAT number to validate.
+    :param country_code:
+        Optional country code. Should be supplied if known. Default ``None``
+        prompting detection.
+    :param fields:
+        Optional iterable of the names of the business fields to retrieve.
+        Default ``None`` retrieving all fields.
+    :returns:
+        a :class:`VatNumberCheckResult` instance containing the result for
+        the full VAT number check.
+    """
+
+    fields = _get_fields(fields)
+    vat_number, country_code, result = _check_vat_number_format(vat_number,
+                                                                country_code)
+    if result is not None:
+        return result
+
+    cache = None if test else VAT_RESULT_CACHE
+    if cache is not None:
+        result = _get_cached_result(cache, vat_number, country_code, fields)
+        if result is not None:
+            return result
+
+    metrics = VAT_METRICS
+    started_at = time.monotonic()
+    registry = VAT_REGISTRIES[country_code]
+    try:
+        if fields is None:
+            result = await registry.check_vat_number_async(vat_number,
+                                                           country_code,
+                                                           test)
+        else:
+            result = await registry.check_vat_number_async(vat_number,
+                                                           country_code,
+                                                           test,
+                                                           fields)
+    finally:
+        if metrics is not None:
+            metrics.record_check(registry.name,
+                                 country_code,
+                                 time.monotonic() - started_at)
+
+    if cache is not None and fields is None:
+        cache.set(vat_number, country_code, result)
+
+    return result
+
+
+def check_vat_numbers(vat_numbers,
+                      test=False,
+                      ordered=True,
+                      executor=None,
+                      concurrency=None,
+                      fields=None):
+    """Check if a number of VAT numbers are valid.
+
+    All VAT numbers are decomposed and format checked up front. Each unique
+    VAT number passing the format check is then checked against its registry
+    exactly once, fanning the registry checks out over a worker pool while
+    never running more than the concurrency cap of each registry at once.
+    Duplicate VAT numbers are each yielded their own copy of the result.
+
+    Unlike :func:`check_vat_number`, failing registry checks do not raise but
+    result in a nondeterministic :class:`VatNumberCheckResult` describing the
+    failure in its log lines.
+
+    :param vat_numbers:
+        Iterable of VAT numbers or :class:`tuple` instances of VAT numbers and
+        country codes.
+    :param test: Boolean to identify if test or not.
+    :param ordered:
+        Whether results should be yielded in input order or as soon as they
+        are available. Default ``True``.
+    :param executor:
+        Optional :class:`concurrent.futures.Executor` on which registry checks
+        are run. Default ``None`` running the checks on a thread pool sized to
+        the sum of the concurrency caps, which is shut down when done.
+    :param concurrency:
+        Optional mapping from :class:`~pyvat.registries.Registry` instances to
+        the maximum number of concurrent checks against the registry,
+        overriding the registry's ``batch_concurrency``.
+    :param fields:
+        Optional iterable of the names of the business fields to retrieve.
+        Default ``None`` retrieving all fields.
+    :returns:
+        a generator of :class:`tuple` instances of the VAT number or
+        VAT number and country code tuple as passed and the
+        :class:`VatNumberCheckResult` for it.
+    :raises ValueError:
+        if the concurrency cap of a registry to be checked is less than
+        ``1``.
+    """
+
+    concurrency = concurrency or {}
+    fields = _get_fields(fields)
+
+    # Decompose and format check all VAT numbers, grouping unique registry
+    # checks by registry.
+    items = []
+    results = {}
+    keys_items = collections.defaultdict(list)
+    registry_queues = collections.OrderedDict()
+
+    for index, item in enumerate(vat_numbers):
+        if isinstance(item, tuple):
+            vat_number, country_code = item
+        else:
+            vat_number, country_code = item, None
+
+        vat_number, country_code, result = _check_vat_number_format(
+            vat_number, country_code
+        )
+        key = (vat_number, country_code) if result is None else index
+        if result is not None:
+            results[key] = result
+        elif key not in keys_items:
+            registry = VAT_REGISTRIES[country_code]
+            registry_queues.setdefault(registry, collections.deque()) \
+                .append(key)
+        items.append((item, key))
+        keys_items[key].append(item)
+
+    caps = dict((registry, concurrency.get(registry,
+                                           registry.batch_concurrency))
+                for registry in registry_queues)
+    for registry, cap in caps.items():
+        if cap < 1:
+            raise ValueError('concurrency cap of registry %s must be at '
+                             'least 1, got %r' % (registry.name, cap))
+    owns_executor = executor is None
+    if owns_executor and caps:
+        executor = ThreadPoolExecutor(max_workers=sum(caps.values()))
+
+    def check(key):
+        vat_number, country_code = key
+        try:
+            return _check_vat_number_registry(vat_number,
+                                              country_code,
+                                              test,
+                                              fields)
+        except Exception as exception:
+            return VatNumberCheckResult(None, [
+                '< Registry check failed with exception: %r' % (exception)
+            ])
+
+    # Duplicate VAT numbers share a registry check, but each is yielded its
+    # own copy of the result.
+    yielded_keys = set()
+
+    def get_result(key):
+        if key in yielded_keys:
+            return results[key].copy()
+        yielded_keys.add(key)
+        return results[key]
+
+    # Results concluded without a registry check are yielded right away
+    # unless ordered.
+    next_index = 0
+    if not ordered:
+        for item, key in items:
+            if key in results:
+                yield item, get_result(key)
+
+    try:
+        futures = {}
+
+        def submit():
+            for registry, queue in registry_queues.items():
+                while queue and caps[registry] > 0:
+                    key = queue.popleft()
+                    caps[registry] -= 1
+                    futures[executor.submit(check, key)] = (registry, key)
+
+        submit()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                registry, key = futures.pop(future)
+                caps[registry] += 1
+                results[key] = future.result()
+
+                if not ordered:
+                    for item in keys_items[key]:
+                        yield item, get_result(key)
+            submit()
+
+            if ordered:
+                while next_index < len(items) and \
+                        items[next_index][1] in results:
+                    item, key = items[next_index]
+                    yield item, get_result(key)
+                    next_index += 1
+    finally:
+        if owns_executor and executor is not None:
+            executor.shutdown(wait=False)
+
+    if ordered:
+        for item, key in items[next_index:]:
+            yield item, get_result(key)
 
 
 def get_sale_vat_charge(date,
@@ -281,6 +682,8 @@ def get_sale_vat_charge(date,
 
 __all__ = (
     'check_vat_number',
+    'check_vat_number_async',
+    'check_vat_numbers',
     'get_sale_vat_charge',
     'is_vat_number_format_valid',
     ItemType.__name__,
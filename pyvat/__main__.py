@@ -0,0 +1,207 @@
+import argparse
+import os
+import sys
+
+import pyvat
+from .bulk import (
+    CSV,
+    FORMATS,
+    detect_format,
+    load_checkpoint,
+    read_records,
+    validate,
+)
+from .cache import MemoryResultCache
+from .rate_limit import RateLimiter
+
+
+def _parse_country_rate(value):
+    country_code, _, rate = value.partition('=')
+    return country_code.upper(), float(rate)
+
+
+def _validate(parser, args):
+    input_format = args.format
+    if input_format is None:
+        input_format = detect_format(args.input) if args.input != '-' \
+            else None
+    input_format = input_format or CSV
+
+    checkpoint_path = args.checkpoint
+    if checkpoint_path is None and args.output is not None:
+        checkpoint_path = args.output + '.checkpoint'
+    if checkpoint_path is not None and args.output is None:
+        parser.error('checkpoints require an output file')
+
+    f = open(args.input, newline='', encoding='utf-8') if args.input != '-' \
+        else sys.stdin
+
+    # Resume from the checkpoint of an interrupted run, discarding any
+    # output written after it.
+    input_name = os.path.abspath(args.input) if args.input != '-' else '-'
+    checkpoint = None
+    if checkpoint_path is not None and not args.restart:
+        checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint is not None:
+        if checkpoint.get('input') != input_name:
+            parser.error('checkpoint %s belongs to input %s, use --restart '
+                         'to start over' %
+                         (checkpoint_path, checkpoint.get('input')))
+
+        # Start over if the output checkpointed is gone.
+        try:
+            output_size = os.path.getsize(args.output)
+        except FileNotFoundError:
+            output_size = -1
+        if output_size < checkpoint['output_size']:
+            if not args.quiet:
+                sys.stderr.write('Output %s is missing results of checkpoint '
+                                 '%s, starting over\n' %
+                                 (args.output, checkpoint_path))
+            checkpoint = None
+    if checkpoint is not None:
+        os.truncate(args.output, checkpoint['output_size'])
+        output = open(args.output, 'ab')
+        if not args.quiet:
+            sys.stderr.write('Resuming after %d records\n' %
+                             (checkpoint['records']))
+    else:
+        checkpoint = {'input': input_name}
+        output = open(args.output, 'wb') if args.output is not None \
+            else sys.stdout.buffer
+
+    registries = set(pyvat.VAT_REGISTRIES.values())
+    if args.rate or args.country_rate:
+        for registry in registries:
+            registry.rate_limiter = RateLimiter(
+                rate=args.rate,
+                key_rates=dict(args.country_rate)
+            )
+    concurrency = None
+    if args.concurrency:
+        concurrency = dict((registry, args.concurrency)
+                           for registry in registries)
+
+    # Check VAT numbers repeated across chunks only once.
+    cache = pyvat.VAT_RESULT_CACHE
+    if cache is None and not args.test:
+        pyvat.VAT_RESULT_CACHE = MemoryResultCache()
+
+    try:
+        state = validate(
+            read_records(f, input_format, args.column, args.country_column),
+            output,
+            checkpoint=checkpoint,
+            checkpoint_path=checkpoint_path,
+            checkpoint_interval=args.checkpoint_interval,
+            chunk_size=args.chunk_size,
+            include_log=args.log,
+            test=args.test,
+            concurrency=concurrency,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        pyvat.VAT_RESULT_CACHE = cache
+        if f is not sys.stdin:
+            f.close()
+        if output is not sys.stdout.buffer:
+            output.close()
+
+    if not args.quiet:
+        sys.stderr.write('Validated %d records: %d valid, %d invalid, %d '
+                         'nondeterministic\n' % (state['records'],
+                                                 state['valid'],
+                                                 state['invalid'],
+                                                 state['nondeterministic']))
+    return 0
+
+
+def main(argv=None):
+    """Run the pyvat command line interface.
+
+    :param argv: Optional command line arguments.
+    :returns: the exit status.
+    """
+
+    parser = argparse.ArgumentParser(prog='python -m pyvat')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+
+    validate_parser = commands.add_parser(
+        'validate',
+        help='validate VAT numbers in bulk',
+        description='Validate VAT numbers read from CSV or JSON Lines input, '
+                    'writing results as JSON Lines. Interrupted runs resume '
+                    'from their last checkpoint.',
+    )
+    validate_parser.add_argument('input',
+                                 metavar='INPUT',
+                                 help='path of the input file, or - for '
+                                      'standard input')
+    validate_parser.add_argument('-o', '--output',
+                                 metavar='PATH',
+                                 help='write results to a file rather than '
+                                      'standard output')
+    validate_parser.add_argument('--format',
+                                 choices=FORMATS,
+                                 help='input format (default: detected from '
+                                      'the file extension, or csv)')
+    validate_parser.add_argument('--column',
+                                 default='vat_number',
+                                 help='column or key holding the VAT number '
+                                      '(default: vat_number)')
+    validate_parser.add_argument('--country-column',
+                                 metavar='COLUMN',
+                                 help='column or key holding the country '
+                                      'code, if any')
+    validate_parser.add_argument('--checkpoint',
+                                 metavar='PATH',
+                                 help='checkpoint file (default: the output '
+                                      'path suffixed with .checkpoint)')
+    validate_parser.add_argument('--checkpoint-interval',
+                                 type=float,
+                                 default=60,
+                                 metavar='SECONDS',
+                                 help='minimum seconds between checkpoints '
+                                      '(default: 60)')
+    validate_parser.add_argument('--restart',
+                                 action='store_true',
+                                 help='ignore any checkpoint and start over')
+    validate_parser.add_argument('--chunk-size',
+                                 type=int,
+                                 default=1000,
+                                 help='number of records validated at once '
+                                      '(default: 1000)')
+    validate_parser.add_argument('--concurrency',
+                                 type=int,
+                                 help='maximum number of concurrent checks '
+                                      'per registry')
+    validate_parser.add_argument('--rate',
+                                 type=float,
+                                 help='maximum number of requests per second '
+                                      'per registry')
+    validate_parser.add_argument('--country-rate',
+                                 action='append',
+                                 type=_parse_country_rate,
+                                 default=[],
+                                 metavar='COUNTRY=RATE',
+                                 help='maximum number of requests per second '
+                                      'for a country code, for example DE=2')
+    validate_parser.add_argument('--test',
+                                 action='store_true',
+                                 help='check against test registries')
+    validate_parser.add_argument('--log',
+                                 action='store_true',
+                                 help='include the log lines of results')
+    validate_parser.add_argument('-q', '--quiet',
+                                 action='store_true',
+                                 help='do not report a summary')
+    validate_parser.set_defaults(handler=_validate)
+
+    args = parser.parse_args(argv)
+    return args.handler(validate_parser, args)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import asyncio
+
+
+CONNECTION_LIMIT = 100
+"""Maximum number of simultaneous connections per event loop.
+"""
+
+CONNECTION_LIMIT_PER_HOST = 0
+"""Maximum number of simultaneous connections per host and event loop.
+
+``0`` imposes no per-host limit beyond :data:`CONNECTION_LIMIT`.
+"""
+
+KEEPALIVE_TIMEOUT = 15
+"""Number of seconds idle connections are kept alive.
+"""
+
+_client_sessions = {}
+"""Mapping from event loops to their shared client session.
+
+Sessions reference their event loop, so entries of closed event loops are
+evicted explicitly rather than relying on weak references.
+"""
+
+
+def get_client_session():
+    """Get the client session shared by all registries on the current loop.
+
+    The session, and thereby its non-blocking connection pool, is created on
+    first use within an event loop and reused by all asynchronous checks
+    performed on the same loop. Sessions left behind by event loops closed
+    without awaiting :func:`close_client_session` are discarded.
+
+    Requires `aiohttp <https://docs.aiohttp.org/>`_, which can be installed
+    along with ``pyvat`` as the ``async`` extra.
+
+    :rtype: aiohttp.ClientSession
+    """
+
+    import aiohttp
+
+    loop = asyncio.get_event_loop()
+    for other_loop in list(_client_sessions):
+        if other_loop.is_closed():
+            _client_sessions.pop(other_loop, None)
+
+    session = _client_sessions.get(loop)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=CONNECTION_LIMIT,
+                limit_per_host=CONNECTION_LIMIT_PER_HOST,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ),
+        )
+        _client_sessions[loop] = session
+    return session
+
+
+async def close_client_session():
+    """Close the client session shared on the current event loop, if any.
+
+    Should be awaited before closing the event loop.
+    """
+
+    session = _client_sessions.pop(asyncio.get_event_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+async def request(method, url, connect_timeout, read_timeout, **kwargs):
+    """Perform an HTTP request using the shared client session.
+
+    :param method: HTTP method.
+    :param url: Request URL.
+    :param connect_timeout: Timeout in seconds for establishing a connection.
+    :param read_timeout: Timeout in seconds for reading the response.
+    :returns:
+        a :class:`tuple` of the status code, content type and body of the
+        response as bytes.
+    :raises asyncio.TimeoutError: if the request timed out.
+    """
+
+    import aiohttp
+
+    timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout,
+                                    sock_read=read_timeout)
+    async with get_client_session().request(method,
+                                            url,
+                                            timeout=timeout,
+                                            **kwargs) as response:
+        content = await response.read()
+        return (response.status,
+                response.headers.get('Content-Type', ''),
+                content)
+
+
+__all__ = ('get_client_session', 'close_client_session', )
@@ -0,0 +1,371 @@
+"""Streaming bulk validation of VAT numbers.
+
+Input records are read one at a time and validated in chunks by
+:func:`pyvat.check_vat_numbers`, so inputs of any size are validated in
+constant memory. Results are written as JSON Lines, and progress can be
+checkpointed so interrupted runs resume where they left off.
+
+Format validation alone is CPU bound, so :func:`check_vat_number_formats`
+spreads it over a process pool instead.
+"""
+
+import collections
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+import time
+
+from . import check_vat_numbers
+from .vectorized import validate_formats
+
+
+CSV = 'csv'
+"""CSV input format, with a header row naming the columns."""
+
+JSON_LINES = 'jsonl'
+"""JSON Lines input format, with a JSON object or string per line."""
+
+FORMATS = (CSV, JSON_LINES)
+"""Supported input formats."""
+
+CHECKPOINT_VERSION = 1
+"""Version of the checkpoint format."""
+
+DEFAULT_FORMAT_CHUNK_SIZE = 10000
+"""Default number of VAT numbers per chunk of format validation."""
+
+_SEPARATOR = u'\0'
+
+_EXTENSIONS = {
+    '.csv': CSV,
+    '.jsonl': JSON_LINES,
+    '.ndjson': JSON_LINES,
+}
+
+
+def detect_format(path):
+    """Detect the input format of a file from its extension.
+
+    :param path: Path of the file.
+    :returns: :data:`CSV`, :data:`JSON_LINES` or ``None`` if unknown.
+    """
+
+    return _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def read_records(f, input_format, column='vat_number', country_column=None):
+    """Read VAT numbers from input, one record at a time.
+
+    Blank JSON Lines are skipped. Records without a VAT number yield an
+    empty VAT number, which fails the format check.
+
+    :param f: Text file to read.
+    :param input_format: :data:`CSV` or :data:`JSON_LINES`.
+    :param column: Name of the column or key holding the VAT number.
+    :param country_column:
+        Optional name of the column or key holding the country code.
+    :returns:
+        a generator of :class:`tuple` instances of the VAT number and the
+        country code or ``None``.
+    :raises ValueError:
+        if the CSV header lacks the VAT number column or a JSON line is
+        neither an object nor a string.
+    """
+
+    if input_format == CSV:
+        reader = csv.DictReader(f)
+        if reader.fieldnames is not None and column not in reader.fieldnames:
+            raise ValueError('column %s not found in CSV header' % (column))
+        for row in reader:
+            yield (row.get(column) or '',
+                   row.get(country_column) or None if country_column else None)
+        return
+
+    for line in f:
+        if not line.strip():
+            continue
+        value = json.loads(line)
+        if isinstance(value, str):
+            yield value, None
+        elif isinstance(value, dict):
+            vat_number = value.get(column)
+            yield (str(vat_number) if vat_number is not None else '',
+                   value.get(country_column) or None
+                   if country_column else None)
+        else:
+            raise ValueError('expected JSON line to be an object or string')
+
+
+def _pack(values):
+    """Pack text values into a buffer for a worker process.
+
+    Separators within values are replaced, which cannot turn an invalid VAT
+    number into a valid one.
+    """
+
+    return _SEPARATOR.join(value.replace(_SEPARATOR, u'\ufffd')
+                           for value in values).encode('utf-8')
+
+
+def _unpack(buffer):
+    return buffer.decode('utf-8').split(_SEPARATOR)
+
+
+def _check_packed_formats(vat_numbers, country_codes):
+    """Validate the format of packed VAT numbers in a worker process.
+
+    :param vat_numbers: Buffer of packed VAT numbers.
+    :param country_codes:
+        Buffer of packed country codes, empty for unknown country codes.
+    :returns: a :class:`bytes` of ``1`` or ``0`` per VAT number.
+    """
+
+    valid, _ = validate_formats(_unpack(vat_numbers), _unpack(country_codes))
+    return bytes(bytearray(valid))
+
+
+def check_vat_number_formats(vat_numbers,
+                             executor=None,
+                             processes=None,
+                             chunk_size=None,
+                             max_pending=None):
+    """Test if the formats of a number of VAT numbers are valid.
+
+    Counterpart of :func:`pyvat.is_vat_number_format_valid` for very large
+    numbers of VAT numbers. VAT numbers are read in chunks, which are
+    validated in parallel on a process pool, and results are yielded in
+    input order. Chunks are sent to worker processes as packed buffers of
+    text, and results are returned as a byte per VAT number, keeping
+    inter-process traffic to a minimum. At most ``max_pending`` chunks are
+    read ahead, so inputs of any size are validated in constant memory.
+
+    :param vat_numbers:
+        Iterable of VAT numbers or :class:`tuple` instances of VAT numbers and
+        country codes.
+    :param executor:
+        Optional :class:`concurrent.futures.Executor` on which chunks are
+        validated. Default ``None`` validating chunks on a process pool,
+        which is shut down when done.
+    :param processes:
+        Optional number of worker processes of the default process pool.
+        Default ``None`` using one per CPU.
+    :param chunk_size:
+        Optional number of VAT numbers per chunk. Default ``None`` using
+        :data:`DEFAULT_FORMAT_CHUNK_SIZE`.
+    :param max_pending:
+        Optional maximum number of chunks being validated at once. Default
+        ``None`` using twice the number of processes.
+    :returns:
+        a generator of :class:`tuple` instances of the VAT number or VAT
+        number and country code tuple as passed and whether its format is
+        valid.
+    :raises TypeError:
+        if a VAT number or country code is neither text nor, for country
+        codes, ``None``.
+    """
+
+    chunk_size = chunk_size or DEFAULT_FORMAT_CHUNK_SIZE
+    max_pending = max_pending or 2 * (processes or os.cpu_count() or 1)
+    owns_executor = executor is None
+    if owns_executor:
+        executor = concurrent.futures.ProcessPoolExecutor(processes)
+
+    items = iter(vat_numbers)
+    pending = collections.deque()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < max_pending:
+                chunk = list(itertools.islice(items, chunk_size))
+                if not chunk:
+                    exhausted = True
+                    break
+
+                chunk_vat_numbers = []
+                chunk_country_codes = []
+                for item in chunk:
+                    if isinstance(item, tuple):
+                        vat_number, country_code = item
+                    else:
+                        vat_number, country_code = item, None
+
+                    # Reject what is_vat_number_format_valid() fails on
+                    # rather than failing in a worker process.
+                    if not isinstance(vat_number, str) or \
+                            not isinstance(country_code, (str, type(None))):
+                        raise TypeError('expected VAT number and country '
+                                        'code to be text, got %r' % (item, ))
+                    chunk_vat_numbers.append(vat_number)
+                    chunk_country_codes.append(country_code or u'')
+
+                pending.append((chunk, executor.submit(
+                    _check_packed_formats,
+                    _pack(chunk_vat_numbers),
+                    _pack(chunk_country_codes)
+                )))
+
+            if not pending:
+                break
+
+            chunk, future = pending.popleft()
+            for item, valid in zip(chunk, future.result()):
+                yield item, valid == 1
+    finally:
+        for _, future in pending:
+            future.cancel()
+        if owns_executor:
+            executor.shutdown(wait=False)
+
+
+def load_checkpoint(path):
+    """Load a checkpoint.
+
+    :param path: Path of the checkpoint file.
+    :returns: the checkpoint :class:`dict` or ``None`` if it does not exist.
+    :raises ValueError: if the checkpoint format is not supported.
+    """
+
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    if checkpoint.get('version') != CHECKPOINT_VERSION:
+        raise ValueError('unsupported checkpoint version %r' %
+                         (checkpoint.get('version')))
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """Save a checkpoint atomically.
+
+    :param path: Path of the checkpoint file.
+    :param checkpoint: Checkpoint :class:`dict`.
+    """
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+
+def _format_result(record, vat_number, country_code, result, include_log):
+    values = {
+        'record': record,
+        'vat_number': vat_number,
+        'country_code': country_code,
+        'is_valid': result.is_valid,
+        'business_name': result.business_name,
+        'business_address': result.business_address,
+        'business_country_code': result.business_country_code,
+    }
+    if include_log:
+        values['log_lines'] = result.log_lines
+    return (json.dumps(values, ensure_ascii=False, sort_keys=True) +
+            '\n').encode('utf-8')
+
+
+def validate(records,
+             output,
+             checkpoint=None,
+             checkpoint_path=None,
+             checkpoint_interval=60,
+             chunk_size=1000,
+             include_log=False,
+             progress=None,
+             **kwargs):
+    """Validate a stream of VAT numbers, writing results as JSON Lines.
+
+    Records are validated in chunks by :func:`pyvat.check_vat_numbers`,
+    checking each unique VAT number of a chunk once. After each chunk, once
+    the checkpoint interval has passed, the output is synced to disk and the
+    number of records and output size are saved to the checkpoint file. The
+    checkpoint file is removed once all records have been validated.
+
+    :param records:
+        Iterable of :class:`tuple` instances of VAT numbers and country
+        codes or ``None``, such as :func:`read_records` returns.
+    :param output: Binary file to write results to.
+    :param checkpoint:
+        Optional checkpoint :class:`dict` to resume from, in which case the
+        output must have been truncated to the checkpointed output size.
+        Keys other than those of the checkpoint format are saved as is.
+    :param checkpoint_path: Optional path of the checkpoint file.
+    :param checkpoint_interval: Minimum seconds between checkpoints.
+    :param chunk_size: Number of records validated at once.
+    :param include_log: Whether to include the log lines of the results.
+    :param progress:
+        Optional function called with the checkpoint :class:`dict` after
+        each chunk.
+    :param kwargs: Keyword arguments for :func:`pyvat.check_vat_numbers`.
+    :returns: the final checkpoint :class:`dict`.
+    """
+
+    state = {
+        'version': CHECKPOINT_VERSION,
+        'records': 0,
+        'output_size': 0,
+        'valid': 0,
+        'invalid': 0,
+        'nondeterministic': 0,
+    }
+    state.update(checkpoint or {})
+    records = itertools.islice(iter(records), state['records'], None)
+    checkpointed_at = time.monotonic()
+
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            break
+
+        for (vat_number, country_code), result in check_vat_numbers(
+            chunk, ordered=True, **kwargs
+        ):
+            output.write(_format_result(state['records'],
+                                        vat_number,
+                                        country_code,
+                                        result,
+                                        include_log))
+            state['records'] += 1
+            if result.is_valid is None:
+                state['nondeterministic'] += 1
+            else:
+                state['valid' if result.is_valid else 'invalid'] += 1
+
+        if checkpoint_path is not None and \
+                time.monotonic() - checkpointed_at >= checkpoint_interval:
+            output.flush()
+            os.fsync(output.fileno())
+            state['output_size'] = output.tell()
+            save_checkpoint(checkpoint_path, state)
+            checkpointed_at = time.monotonic()
+
+        if progress is not None:
+            progress(state)
+
+    output.flush()
+    if checkpoint_path is not None:
+        state['output_size'] = output.tell()
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    return state
+
+
+__all__ = (
+    'CHECKPOINT_VERSION',
+    'CSV',
+    'DEFAULT_FORMAT_CHUNK_SIZE',
+    'FORMATS',
+    'JSON_LINES',
+    'check_vat_number_formats',
+    'detect_format',
+    'load_checkpoint',
+    'read_records',
+    'save_checkpoint',
+    'validate',
+)
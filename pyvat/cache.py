@@ -0,0 +1,819 @@
+import collections
+import concurrent.futures
+import datetime
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from .result import VatNumberCheckResult
+
+
+class CacheEntry(object):
+    """Cached VAT number check result.
+
+    :ivar is_valid: Validity of the VAT number.
+    :ivar business_name: Optional business name.
+    :ivar business_address: Optional business address.
+    :ivar business_country_code: Optional business country code.
+    :ivar checked_at: UNIX timestamp of the registry check.
+    :ivar expires_at: UNIX timestamp after which the entry is expired.
+    """
+
+    __slots__ = ('is_valid',
+                 'business_name',
+                 'business_address',
+                 'business_country_code',
+                 'checked_at',
+                 'expires_at')
+
+    def __init__(self,
+                 is_valid,
+                 business_name,
+                 business_address,
+                 business_country_code,
+                 checked_at,
+                 expires_at):
+        self.is_valid = is_valid
+        self.business_name = business_name
+        self.business_address = business_address
+        self.business_country_code = business_country_code
+        self.checked_at = checked_at
+        self.expires_at = expires_at
+
+    def to_result(self):
+        """Create a check result from the entry.
+
+        :rtype: VatNumberCheckResult
+        """
+
+        checked_at = datetime.datetime.fromtimestamp(self.checked_at,
+                                                     datetime.timezone.utc)
+        return VatNumberCheckResult(
+            self.is_valid,
+            ['> Result retrieved from cache, checked at %s' %
+             (checked_at.isoformat())],
+            business_name=self.business_name,
+            business_address=self.business_address,
+            business_country_code=self.business_country_code,
+        )
+
+
+class ResultCache(object):
+    """Abstract base VAT number check result cache.
+
+    Caches registry check results keyed on the decomposed country code and
+    VAT number, with separate time-to-live for valid, invalid and
+    nondeterministic results. A time-to-live of ``0`` disables caching of the
+    given kind of result.
+
+    Optionally, results read after a ratio of their time-to-live has passed
+    are revalidated ahead of expiry, and expired results are served for a
+    grace period while they are revalidated, see :meth:`lookup` and
+    :meth:`revalidate`. Revalidation happens in the background on a bounded
+    number of worker threads per process.
+
+    Backends implement :meth:`_load`, :meth:`_store`, :meth:`_delete` and
+    :meth:`_clear`.
+
+    :ivar valid_ttl: Time-to-live in seconds of valid results.
+    :ivar invalid_ttl: Time-to-live in seconds of invalid results.
+    :ivar nondeterministic_ttl:
+        Time-to-live in seconds of nondeterministic results.
+    :ivar refresh_ahead:
+        Optional ratio of the time-to-live of a result after which reading it
+        causes it to be revalidated, for example ``0.8``. Default ``None``
+        only revalidating results served stale.
+    :ivar stale_ttl:
+        Seconds after expiry during which a result is still served, while
+        being revalidated. Default ``0``.
+    :ivar max_refreshes:
+        Maximum number of concurrent background revalidations. Further
+        revalidations are skipped until one completes.
+    :ivar refresh_backoff:
+        Seconds after a failed revalidation of a result during which it is
+        not revalidated again.
+    :ivar hits: Number of cache hits.
+    :ivar misses: Number of cache misses.
+    :ivar refreshes: Number of background revalidations started.
+    """
+
+    DEFAULT_VALID_TTL = 24 * 60 * 60
+    """Default time-to-live of valid results."""
+
+    DEFAULT_INVALID_TTL = 60 * 60
+    """Default time-to-live of invalid results."""
+
+    DEFAULT_NONDETERMINISTIC_TTL = 0
+    """Default time-to-live of nondeterministic results."""
+
+    DEFAULT_MAX_REFRESHES = 2
+    """Default maximum number of concurrent background revalidations."""
+
+    DEFAULT_REFRESH_BACKOFF = 60
+    """Default seconds between revalidations of a result after a failure."""
+
+    def __init__(self,
+                 valid_ttl=None,
+                 invalid_ttl=None,
+                 nondeterministic_ttl=None,
+                 refresh_ahead=None,
+                 stale_ttl=0,
+                 max_refreshes=None,
+                 refresh_backoff=None):
+        if refresh_ahead is not None and not 0 < refresh_ahead <= 1:
+            raise ValueError('refresh_ahead must be between 0 and 1')
+
+        self.valid_ttl = self.DEFAULT_VALID_TTL \
+            if valid_ttl is None else valid_ttl
+        self.invalid_ttl = self.DEFAULT_INVALID_TTL \
+            if invalid_ttl is None else invalid_ttl
+        self.nondeterministic_ttl = self.DEFAULT_NONDETERMINISTIC_TTL \
+            if nondeterministic_ttl is None else nondeterministic_ttl
+        self.refresh_ahead = refresh_ahead
+        self.stale_ttl = stale_ttl
+        self.max_refreshes = max_refreshes or self.DEFAULT_MAX_REFRESHES
+        self.refresh_backoff = self.DEFAULT_REFRESH_BACKOFF \
+            if refresh_backoff is None else refresh_backoff
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._stats_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = set()
+        self._refresh_failures = {}
+        self._refresh_executor = None
+        self._refresh_pid = None
+
+    @staticmethod
+    def make_key(vat_number, country_code):
+        """Make the cache key for a decomposed VAT number.
+
+        The non-ISO code used for Greece is treated as its ISO code.
+
+        :param vat_number: VAT number without country code prefix.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :returns: the cache key as text.
+        """
+
+        country_code = country_code.upper()
+        if country_code == 'EL':
+            country_code = 'GR'
+        return country_code + vat_number.upper()
+
+    @property
+    def hit_ratio(self):
+        """Ratio of lookups resulting in a cache hit.
+
+        :returns: the ratio or ``None`` if no lookups have been performed.
+        """
+
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else None
+
+    def get_ttl(self, result):
+        """Get the time-to-live of a result.
+
+        :param result: Check result.
+        :type result: VatNumberCheckResult
+        :returns: the time-to-live in seconds.
+        """
+
+        if result.is_valid is None:
+            return self.nondeterministic_ttl
+        return self.valid_ttl if result.is_valid else self.invalid_ttl
+
+    def get(self, vat_number, country_code):
+        """Get the cached check result for a VAT number.
+
+        :param vat_number: VAT number without country code prefix.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :returns:
+            a new :class:`VatNumberCheckResult` instance or ``None`` if no
+            result is cached or the cached result is past its stale
+            time-to-live.
+        """
+
+        return self.lookup(vat_number, country_code)[0]
+
+    def lookup(self, vat_number, country_code):
+        """Get the cached check result for a VAT number and whether it is due
+        for revalidation.
+
+        Results are due once expired, during their stale time-to-live, or
+        once the refresh-ahead ratio of their time-to-live has passed.
+
+        :param vat_number: VAT number without country code prefix.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :returns:
+            a :class:`tuple` of a new :class:`VatNumberCheckResult` instance
+            or ``None`` if no result is served, and whether the result is due
+            for revalidation.
+        """
+
+        key = self.make_key(vat_number, country_code)
+        entry = self._load(key)
+        now = time.time()
+        if entry is not None and entry.expires_at + self.stale_ttl <= now:
+            self._delete_expired(key, now - self.stale_ttl)
+            entry = None
+
+        with self._stats_lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if entry is None:
+            return None, False
+
+        due = entry.expires_at <= now
+        if not due and self.refresh_ahead is not None:
+            due = now >= entry.checked_at + self.refresh_ahead * \
+                (entry.expires_at - entry.checked_at)
+        return entry.to_result(), due
+
+    def revalidate(self, vat_number, country_code, check):
+        """Revalidate the cached check result for a VAT number in the
+        background.
+
+        The result of the check replaces the cached result unless it is
+        nondeterministic, in which case the cached result is kept until it
+        is past its stale time-to-live, or the cached result was checked
+        after the revalidation started. Revalidations of a VAT number already
+        being revalidated, revalidated unsuccessfully within the refresh
+        backoff, or beyond the maximum number of concurrent revalidations,
+        are skipped.
+
+        :param vat_number: VAT number without country code prefix.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :param check:
+            Function taking no arguments and returning a fresh
+            :class:`VatNumberCheckResult`.
+        :returns: whether a revalidation was started.
+        """
+
+        key = self.make_key(vat_number, country_code)
+        with self._refresh_lock:
+            if key in self._refreshing or \
+                    len(self._refreshing) >= self.max_refreshes:
+                return False
+
+            retry_at = self._refresh_failures.get(key)
+            if retry_at is not None:
+                if time.monotonic() < retry_at:
+                    return False
+                del self._refresh_failures[key]
+
+            # Worker threads do not survive forking, so every process
+            # needs its own executor.
+            if self._refresh_pid != os.getpid():
+                self._refresh_executor = \
+                    concurrent.futures.ThreadPoolExecutor(self.max_refreshes)
+                self._refreshing.clear()
+                self._refresh_pid = os.getpid()
+            self._refreshing.add(key)
+            self.refreshes += 1
+            executor = self._refresh_executor
+
+        executor.submit(self._revalidate, key, vat_number, country_code, check)
+        return True
+
+    def _revalidate(self, key, vat_number, country_code, check):
+        started_at = time.time()
+        failed = True
+        try:
+            result = check()
+            if result.is_valid is None:
+                return
+
+            # Do not replace results checked since the revalidation started.
+            entry = self._load(key)
+            if entry is None or entry.checked_at <= started_at:
+                self.set(vat_number, country_code, result)
+            failed = False
+        except Exception:
+            # Keep serving the stale result.
+            pass
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+                # Back off rather than revalidating on every read.
+                if failed and self.refresh_backoff > 0:
+                    self._refresh_failures[key] = \
+                        time.monotonic() + self.refresh_backoff
+
+    def set(self, vat_number, country_code, result):
+        """Cache the check result for a VAT number.
+
+        :param vat_number: VAT number without country code prefix.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :param result: Check result.
+        :type result: VatNumberCheckResult
+        """
+
+        ttl = self.get_ttl(result)
+        if ttl <= 0:
+            return
+
+        now = time.time()
+        self._store(self.make_key(vat_number, country_code), CacheEntry(
+            result.is_valid,
+            result.business_name,
+            result.business_address,
+            result.business_country_code,
+            now,
+            now + ttl,
+        ))
+
+    def delete(self, vat_number, country_code):
+        """Remove the cached check result for a VAT number, if any.
+
+        :param vat_number: VAT number without country code prefix.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        """
+
+        self._delete(self.make_key(vat_number, country_code))
+
+    def clear(self):
+        """Remove all cached check results.
+        """
+
+        self._clear()
+
+    def _load(self, key):
+        """Load a cache entry.
+
+        :param key: Cache key.
+        :returns: the :class:`CacheEntry` or ``None`` if not cached.
+        """
+
+        raise NotImplementedError()
+
+    def _store(self, key, entry):
+        """Store a cache entry.
+
+        :param key: Cache key.
+        :param entry: Cache entry.
+        :type entry: CacheEntry
+        """
+
+        raise NotImplementedError()
+
+    def _delete(self, key):
+        """Delete a cache entry if it exists.
+
+        :param key: Cache key.
+        """
+
+        raise NotImplementedError()
+
+    def _delete_expired(self, key, expired_at):
+        """Delete a cache entry if it expired at or before a timestamp.
+
+        Backends shared between threads or processes compare and delete
+        atomically, so that entries stored concurrently are kept.
+
+        :param key: Cache key.
+        :param expired_at: UNIX timestamp.
+        """
+
+        entry = self._load(key)
+        if entry is not None and entry.expires_at <= expired_at:
+            self._delete(key)
+
+    def _clear(self):
+        """Delete all cache entries.
+        """
+
+        raise NotImplementedError()
+
+
+class MemoryResultCache(ResultCache):
+    """In-process, thread-safe least recently used result cache.
+
+    :ivar max_size: Maximum number of cached results.
+    """
+
+    DEFAULT_MAX_SIZE = 10000
+    """Default maximum number of cached results."""
+
+    def __init__(self, max_size=None, **kwargs):
+        super(MemoryResultCache, self).__init__(**kwargs)
+        self.max_size = max_size or self.DEFAULT_MAX_SIZE
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def _delete_expired(self, key, expired_at):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= expired_at:
+                del self._entries[key]
+
+    def _clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteResultCache(ResultCache):
+    """Persistent result cache backed by a local SQLite database.
+
+    The database is opened in write-ahead logging mode, allowing any number
+    of threads and processes on the host to read and write the cache
+    concurrently. Each thread of each process uses its own connection.
+
+    Expired results are ignored when read past their stale time-to-live, but
+    only removed from the database by :meth:`compact`, which should be run
+    periodically.
+
+    Database errors, such as the database remaining locked beyond the busy
+    timeout, are treated as cache misses rather than failing checks.
+
+    :ivar path: Path of the SQLite database file.
+    :ivar busy_timeout: Seconds to wait for locks held by other connections.
+    """
+
+    DEFAULT_BUSY_TIMEOUT = 5
+    """Default number of seconds to wait for locks."""
+
+    def __init__(self, path, busy_timeout=None, **kwargs):
+        super(SQLiteResultCache, self).__init__(**kwargs)
+        self.path = path
+        self.busy_timeout = busy_timeout or self.DEFAULT_BUSY_TIMEOUT
+        self._local = threading.local()
+
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS vat_number_check_results ('
+            'key TEXT PRIMARY KEY, '
+            'is_valid INTEGER, '
+            'business_name TEXT, '
+            'business_address TEXT, '
+            'business_country_code TEXT, '
+            'checked_at REAL NOT NULL, '
+            'expires_at REAL NOT NULL)'
+        )
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS '
+            'vat_number_check_results_expires_at '
+            'ON vat_number_check_results (expires_at)'
+        )
+
+    @property
+    def connection(self):
+        """Connection of the current thread and process.
+
+        :rtype: sqlite3.Connection
+        """
+
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path,
+                                     timeout=self.busy_timeout,
+                                     isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def compact(self, vacuum=False):
+        """Remove results past their stale time-to-live from the database.
+
+        :param vacuum:
+            Whether to rebuild the database file afterwards, returning unused
+            space to the file system. Default ``False``.
+        :returns: the number of removed results.
+        """
+
+        cursor = self.connection.execute(
+            'DELETE FROM vat_number_check_results WHERE expires_at <= ?',
+            (time.time() - self.stale_ttl, )
+        )
+        if vacuum:
+            self.connection.execute('VACUUM')
+        return cursor.rowcount
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM vat_number_check_results'
+        ).fetchone()[0]
+
+    def _load(self, key):
+        try:
+            row = self.connection.execute(
+                'SELECT is_valid, business_name, business_address, '
+                'business_country_code, checked_at, expires_at '
+                'FROM vat_number_check_results WHERE key = ?',
+                (key, )
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+
+        if row is None:
+            return None
+
+        is_valid = row[0]
+        return CacheEntry(None if is_valid is None else bool(is_valid),
+                          *row[1:])
+
+    def _store(self, key, entry):
+        try:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO vat_number_check_results (key, '
+                'is_valid, business_name, business_address, '
+                'business_country_code, checked_at, expires_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key,
+                 entry.is_valid,
+                 entry.business_name,
+                 entry.business_address,
+                 entry.business_country_code,
+                 entry.checked_at,
+                 entry.expires_at)
+            )
+        except sqlite3.Error:
+            pass
+
+    def _delete(self, key):
+        try:
+            self.connection.execute(
+                'DELETE FROM vat_number_check_results WHERE key = ?',
+                (key, )
+            )
+        except sqlite3.Error:
+            pass
+
+    def _delete_expired(self, key, expired_at):
+        try:
+            self.connection.execute(
+                'DELETE FROM vat_number_check_results '
+                'WHERE key = ? AND expires_at <= ?',
+                (key, expired_at)
+            )
+        except sqlite3.Error:
+            pass
+
+    def _clear(self):
+        self.connection.execute('DELETE FROM vat_number_check_results')
+
+
+class SharedMemoryResultCache(ResultCache):
+    """Fixed-capacity result cache shared between processes on a host.
+
+    Results are stored as fixed-size records in an open addressing hash table
+    in a memory-mapped file, which all processes using the same path map into
+    their address space, allowing worker processes of pre-forking servers to
+    share results without a separate cache service. Reads hold a shared lock
+    and writes an exclusive lock on the file.
+
+    Probing is bounded, so when all probed slots are taken, the record
+    expiring first is evicted. Results with a VAT number, business name or
+    address too long for the fixed-size record fields are not cached.
+
+    All processes sharing the file must use the same capacity, as the file
+    is reinitialized when opened with a different capacity.
+
+    Only available on platforms supporting :mod:`fcntl`.
+
+    :ivar path: Path of the memory-mapped file.
+    :ivar capacity: Number of record slots.
+    """
+
+    DEFAULT_CAPACITY = 65536
+    """Default number of record slots."""
+
+    MAX_PROBES = 16
+    """Maximum number of slots probed per lookup."""
+
+    HEADER = struct.Struct('<8sII')
+    """Header structure of magic bytes, capacity and record size."""
+
+    MAGIC = b'PYVATSHM'
+    """Magic bytes identifying the file format."""
+
+    RECORD = struct.Struct('<B16sb2sddH128sH256s')
+    """Record structure.
+
+    Slot state, key, validity, business country code, check and expiry
+    timestamps, business name length and bytes and business address length
+    and bytes.
+    """
+
+    _EMPTY, _USED, _DELETED = 0, 1, 2
+
+    def __init__(self, path, capacity=None, **kwargs):
+        if fcntl is None:  # pragma: no cover
+            raise NotImplementedError('shared memory result caching requires '
+                                      'fcntl support')
+        super(SharedMemoryResultCache, self).__init__(**kwargs)
+        self.path = path
+        self.capacity = capacity or self.DEFAULT_CAPACITY
+        self._pid = None
+        self._lock = threading.RLock()
+
+    @property
+    def size(self):
+        """Size of the memory-mapped file in bytes.
+        """
+
+        return self.HEADER.size + self.capacity * self.RECORD.size
+
+    def _open(self):
+        """Open and map the file for the current process if necessary.
+
+        File locks are held per open file, so the file is reopened in forked
+        child processes.
+        """
+
+        if self._pid == os.getpid():
+            return
+
+        # Release the file and mapping inherited from the parent process.
+        if self._pid is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._pid = None
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            header = os.pread(fd, self.HEADER.size, 0)
+            expected = self.HEADER.pack(self.MAGIC,
+                                        self.capacity,
+                                        self.RECORD.size)
+            if header != expected or os.fstat(fd).st_size != self.size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+                os.pwrite(fd, expected, 0)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+        self._fd = fd
+        self._map = mmap.mmap(fd, self.size)
+        self._pid = os.getpid()
+
+    def _locked(self, operation, key=None, entry=None, exclusive=False):
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else
+                        fcntl.LOCK_SH)
+            try:
+                return operation(key, entry)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _slots(self, key):
+        start = zlib.crc32(key) % self.capacity
+        for probe in range(min(self.MAX_PROBES, self.capacity)):
+            slot = (start + probe) % self.capacity
+            yield slot, self.HEADER.size + slot * self.RECORD.size
+
+    def _find(self, key):
+        for slot, offset in self._slots(key):
+            state = self._map[offset]
+            if state == self._EMPTY:
+                return None
+            if state == self._USED and \
+                    self._map[offset + 1:offset + 17] == key:
+                return offset
+        return None
+
+    def _read(self, key, entry):
+        offset = self._find(key)
+        if offset is None:
+            return None
+
+        (_, _, is_valid, country_code, checked_at, expires_at,
+         name_length, name, address_length, address) = \
+            self.RECORD.unpack_from(self._map, offset)
+        return CacheEntry(
+            None if is_valid < 0 else bool(is_valid),
+            name[:name_length].decode('utf-8') if name_length else None,
+            address[:address_length].decode('utf-8')
+            if address_length else None,
+            country_code.rstrip(b'\0').decode('ascii') or None,
+            checked_at,
+            expires_at,
+        )
+
+    def _write(self, key, record):
+        offset = self._find(key)
+        if offset is None:
+            # Use the first free slot, or evict the record expiring first.
+            candidates = []
+            for _, candidate in self._slots(key):
+                if self._map[candidate] != self._USED:
+                    offset = candidate
+                    break
+                candidates.append((self.RECORD.unpack_from(
+                    self._map, candidate)[5], candidate))
+            else:
+                offset = min(candidates)[1]
+        self._map[offset:offset + self.RECORD.size] = record
+
+    def _remove(self, key, entry):
+        offset = self._find(key)
+        if offset is not None:
+            self._map[offset] = self._DELETED
+
+    def _remove_expired(self, key, expired_at):
+        offset = self._find(key)
+        if offset is not None and \
+                self.RECORD.unpack_from(self._map, offset)[5] <= expired_at:
+            self._map[offset] = self._DELETED
+
+    def _reset(self, key, entry):
+        self._map[self.HEADER.size:] = \
+            b'\0' * (self.capacity * self.RECORD.size)
+
+    @staticmethod
+    def _encode_key(key):
+        key = key.encode('utf-8')
+        return key.ljust(16, b'\0') if len(key) <= 16 else None
+
+    def _load(self, key):
+        key = self._encode_key(key)
+        if key is None:
+            return None
+        return self._locked(self._read, key)
+
+    def _store(self, key, entry):
+        key = self._encode_key(key)
+        name = (entry.business_name or u'').encode('utf-8')
+        address = (entry.business_address or u'').encode('utf-8')
+        country_code = (entry.business_country_code or u'').encode('ascii',
+                                                                   'ignore')
+        if key is None or len(name) > 128 or len(address) > 256 or \
+                len(country_code) > 2:
+            return
+
+        record = self.RECORD.pack(
+            self._USED,
+            key,
+            -1 if entry.is_valid is None else int(entry.is_valid),
+            country_code,
+            entry.checked_at,
+            entry.expires_at,
+            len(name),
+            name,
+            len(address),
+            address,
+        )
+        self._locked(self._write, key, record, exclusive=True)
+
+    def _delete(self, key):
+        key = self._encode_key(key)
+        if key is not None:
+            self._locked(self._remove, key, exclusive=True)
+
+    def _delete_expired(self, key, expired_at):
+        key = self._encode_key(key)
+        if key is not None:
+            self._locked(self._remove_expired,
+                         key,
+                         expired_at,
+                         exclusive=True)
+
+    def _clear(self):
+        self._locked(self._reset, exclusive=True)
+
+
+__all__ = (
+    'CacheEntry',
+    'ResultCache',
+    'MemoryResultCache',
+    'SQLiteResultCache',
+    'SharedMemoryResultCache',
+)
@@ -0,0 +1,154 @@
+import threading
+import time
+
+
+class CircuitBreaker(object):
+    """Circuit breaker.
+
+    The breaker is closed while requests succeed. After a number of
+    consecutive failures it opens, rejecting requests until the recovery
+    timeout has passed, after which it is half-open and lets a single trial
+    request through. A successful trial closes the breaker again, while a
+    failed trial reopens it.
+
+    :ivar failure_threshold:
+        Number of consecutive failures after which the breaker opens.
+    :ivar recovery_timeout: Seconds the breaker stays open.
+    """
+
+    CLOSED = 'closed'
+    """Requests are let through."""
+
+    OPEN = 'open'
+    """Requests are rejected."""
+
+    HALF_OPEN = 'half-open'
+    """A single trial request is let through."""
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_until = None
+        self._trial = False
+
+    @property
+    def state(self):
+        """Current state of the breaker.
+        """
+
+        with self._lock:
+            if self._opened_until is None:
+                return self.CLOSED
+            if time.time() < self._opened_until:
+                return self.OPEN
+            return self.HALF_OPEN
+
+    @property
+    def is_degraded(self):
+        """Whether any recent requests failed or the breaker is not closed.
+        """
+
+        return self._failures > 0 or self._opened_until is not None
+
+    def allow_request(self):
+        """Test if a request may be performed.
+
+        Requests which are let through must have their outcome reported
+        through :meth:`record_success` or :meth:`record_failure`, or be
+        released through :meth:`cancel_request` if not performed.
+
+        :returns: ``True`` if the request may be performed.
+        """
+
+        with self._lock:
+            if self._opened_until is None:
+                return True
+            if time.time() < self._opened_until or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def cancel_request(self):
+        """Release a request let through but not performed.
+
+        A trial request of a half-open breaker is released, so that another
+        request may be let through.
+        """
+
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        """Record a successful request, closing the breaker.
+        """
+
+        with self._lock:
+            self._failures = 0
+            self._opened_until = None
+            self._trial = False
+
+    def record_failure(self):
+        """Record a failed request, opening the breaker if necessary.
+        """
+
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_until = time.time() + self.recovery_timeout
+            self._trial = False
+
+    def force_open(self, duration=None):
+        """Open the breaker regardless of the outcome of requests.
+
+        :param duration:
+            Seconds to keep the breaker open. Default ``None`` using the
+            recovery timeout.
+        """
+
+        with self._lock:
+            self._opened_until = time.time() + (
+                self.recovery_timeout if duration is None else duration
+            )
+            self._trial = False
+
+
+class CircuitBreakers(object):
+    """Circuit breakers by key, such as country code.
+
+    Breakers are created on first use with the configuration given.
+    """
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def __getitem__(self, key):
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(key)
+                if breaker is None:
+                    breaker = self._breakers[key] = CircuitBreaker(
+                        self.failure_threshold,
+                        self.recovery_timeout,
+                    )
+        return breaker
+
+    def __contains__(self, key):
+        return key in self._breakers
+
+    def items(self):
+        """Get the breakers created so far.
+
+        :returns: a :class:`list` of :class:`tuple` of keys and breakers.
+        """
+
+        with self._lock:
+            return list(self._breakers.items())
+
+
+__all__ = ('CircuitBreaker', 'CircuitBreakers', )
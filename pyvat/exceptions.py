@@ -2,3 +2,24 @@ class ServerError(Exception):
     def __init__(self, fault_code):
         super(ServerError, self).__init__("ServerError: {}".format(fault_code))
         self.fault_code = fault_code
+
+
+class RateLimitError(Exception):
+    """Rate limit exceeded.
+
+    Raised when a request cannot be performed within the rate limit without
+    waiting longer than allowed.
+    """
+
+    def __init__(self, key=None):
+        super(RateLimitError, self).__init__(
+            "RateLimitError: {}".format(key or 'global')
+        )
+        self.key = key
+
+
+class TokenError(Exception):
+    """Access token could not be obtained.
+    """
+
+    pass
@@ -0,0 +1,125 @@
+import collections
+import math
+import threading
+
+
+class HedgingPolicy(object):
+    """Hedging policy for registry requests.
+
+    A request which has not been answered within a percentile of the recent
+    latency of requests for the same country code is hedged by sending a
+    second, identical request. The first answer wins and the other request
+    is abandoned.
+
+    Hedges are paid for from a budget: every request earns a fraction of a
+    hedge up to a maximum, and every hedge spends one, which caps the extra
+    load on the registry at the budget ratio in the long run.
+
+    :ivar percentile:
+        Percentile of recent latency after which requests are hedged, for
+        example ``0.95``.
+    :ivar initial_delay:
+        Delay in seconds after which requests are hedged while too few
+        latencies have been recorded.
+    :ivar min_delay: Minimum delay in seconds before hedging.
+    :ivar max_delay: Optional maximum delay in seconds before hedging.
+    :ivar window_size: Number of recent latencies kept per country code.
+    :ivar min_samples:
+        Number of latencies required before the percentile is used. Falls
+        back to the latencies of all country codes if too few were recorded
+        for a country code.
+    :ivar budget: Maximum ratio of hedges to requests.
+    :ivar max_tokens: Maximum number of hedges the budget can save up.
+    :ivar requests: Number of requests recorded.
+    :ivar hedges: Number of hedges sent.
+    """
+
+    def __init__(self,
+                 percentile=0.95,
+                 initial_delay=1,
+                 min_delay=0.05,
+                 max_delay=None,
+                 window_size=200,
+                 min_samples=20,
+                 budget=0.05,
+                 max_tokens=10):
+        if not 0 < percentile < 1:
+            raise ValueError('percentile must be between 0 and 1')
+
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.window_size = window_size
+        self.min_samples = min_samples
+        self.budget = budget
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._all_latencies = collections.deque(maxlen=window_size)
+        self._tokens = float(max_tokens)
+        self.requests = 0
+        self.hedges = 0
+
+    def record_latency(self, key, seconds):
+        """Record the latency of an answered request.
+
+        :param key: Key of the request, such as the country code.
+        :param seconds: Latency in seconds.
+        """
+
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = \
+                    collections.deque(maxlen=self.window_size)
+            latencies.append(seconds)
+            self._all_latencies.append(seconds)
+
+    def get_delay(self, key):
+        """Get the delay after which a request is hedged.
+
+        :param key: Key of the request, such as the country code.
+        :returns: the delay in seconds.
+        """
+
+        with self._lock:
+            latencies = self._latencies.get(key, ())
+            if len(latencies) < self.min_samples:
+                latencies = self._all_latencies
+            latencies = sorted(latencies)
+
+        if len(latencies) < self.min_samples:
+            delay = self.initial_delay
+        else:
+            index = int(math.ceil(self.percentile * len(latencies))) - 1
+            delay = latencies[max(index, 0)]
+
+        delay = max(delay, self.min_delay)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return delay
+
+    def record_request(self):
+        """Record a request, earning a fraction of a hedge.
+        """
+
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self._tokens + self.budget, self.max_tokens)
+
+    def reserve_hedge(self):
+        """Reserve a hedge from the budget.
+
+        :returns: ``True`` if the budget allows a hedge.
+        """
+
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.hedges += 1
+            return True
+
+
+__all__ = ('HedgingPolicy', )
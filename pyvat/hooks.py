@@ -0,0 +1,126 @@
+class RegistryEvent(object):
+    """Event describing a phase of a registry check.
+
+    Events are passed to the methods of :class:`RegistryHooks`. Attributes
+    not applicable to an event are ``None``.
+
+    :ivar registry: Name of the registry.
+    :ivar vat_number: VAT number without country code prefix.
+    :ivar country_code: ISO 3166-1-alpha-2 country code.
+    :ivar attempt:
+        Number of the attempt of the check, starting at ``1``, or ``None``
+        for cache hits.
+    :ivar started_at:
+        :func:`time.monotonic` timestamp at which the attempt started.
+    :ivar duration:
+        Seconds spent in the phase concluded by the event: waiting before
+        the request for :meth:`RegistryHooks.on_request_start`, performing
+        the request including connecting and server time for
+        :meth:`RegistryHooks.on_response`, parsing the response for
+        :meth:`RegistryHooks.on_parse_done`, and the failed phase for
+        :meth:`RegistryHooks.on_error`. The cache lookup time for
+        :meth:`RegistryHooks.on_cache_hit`.
+    :ivar elapsed: Seconds since the attempt started.
+    :ivar status_code: HTTP status code of the response.
+    :ivar fault_code: Fault code reported by the registry.
+    :ivar is_valid: Validity concluded from the response or cached result.
+    :ivar error:
+        Exception causing the error, if any, for
+        :meth:`RegistryHooks.on_error`.
+    :ivar reason:
+        Short description of the error for :meth:`RegistryHooks.on_error`,
+        such as ``timeout`` or ``fault MS_UNAVAILABLE``.
+    """
+
+    def __init__(self,
+                 registry,
+                 vat_number,
+                 country_code,
+                 attempt=None,
+                 started_at=None,
+                 duration=None,
+                 elapsed=None,
+                 status_code=None,
+                 fault_code=None,
+                 is_valid=None,
+                 error=None,
+                 reason=None):
+        self.registry = registry
+        self.vat_number = vat_number
+        self.country_code = country_code
+        self.attempt = attempt
+        self.started_at = started_at
+        self.duration = duration
+        self.elapsed = elapsed
+        self.status_code = status_code
+        self.fault_code = fault_code
+        self.is_valid = is_valid
+        self.error = error
+        self.reason = reason
+
+    def __repr__(self):
+        return '<pyvat.hooks.RegistryEvent: registry = %s, country code = ' \
+            '%s, attempt = %r, duration = %r, status code = %r, fault code ' \
+            '= %r, reason = %r>' % (self.registry,
+                                    self.country_code,
+                                    self.attempt,
+                                    self.duration,
+                                    self.status_code,
+                                    self.fault_code,
+                                    self.reason)
+
+
+class RegistryHooks(object):
+    """Base class of hooks instrumenting registry checks.
+
+    Hooks are passed to registries, which call the methods below as checks
+    progress. Every attempt of a check either starts a request, followed by
+    a response and parsing or by an error, or fails before starting a
+    request. Subclasses override the methods of the events they are
+    interested in, for example to feed tracing or profiling.
+
+    Hooks are called synchronously on the thread or event loop performing
+    the check, so they should be quick. Exceptions raised by hooks are
+    ignored, so instrumentation never fails a check.
+    """
+
+    def on_request_start(self, event):
+        """Called when a request to the registry is about to be sent.
+
+        :param event: Event.
+        :type event: RegistryEvent
+        """
+
+    def on_response(self, event):
+        """Called when a response has been received from the registry.
+
+        :param event: Event carrying the status code.
+        :type event: RegistryEvent
+        """
+
+    def on_parse_done(self, event):
+        """Called when a response has been parsed into a result.
+
+        :param event: Event carrying the status code and validity.
+        :type event: RegistryEvent
+        """
+
+    def on_error(self, event):
+        """Called when an attempt failed.
+
+        Attempts fail on timeouts, failed requests, faults, unparseable
+        responses, open circuit breakers and unavailable access tokens.
+
+        :param event: Event carrying the reason and error, if any.
+        :type event: RegistryEvent
+        """
+
+    def on_cache_hit(self, event):
+        """Called when a check is answered from the result cache.
+
+        :param event: Event carrying the cached validity.
+        :type event: RegistryEvent
+        """
+
+
+__all__ = ('RegistryEvent', 'RegistryHooks', )
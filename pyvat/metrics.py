@@ -0,0 +1,404 @@
+import bisect
+import collections
+import threading
+
+from . import retry
+from .hooks import RegistryHooks
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+"""Default upper bounds in seconds of latency histogram buckets."""
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+"""Content type of the text exposition format rendered by
+:meth:`Metrics.render_text`."""
+
+UNDECOMPOSABLE = 'undecomposable'
+"""Reason for skipping the registry check of a VAT number which could not be
+decomposed into a country code and number."""
+
+INVALID_FORMAT = 'invalid_format'
+"""Reason for skipping the registry check of a VAT number of invalid
+format."""
+
+NO_REGISTRY = 'no_registry'
+"""Reason for skipping the registry check of a VAT number of a country
+without a registry."""
+
+
+class Histogram(object):
+    """Histogram of observed values in cumulative buckets.
+
+    :ivar buckets: Sorted upper bounds of the buckets.
+    :ivar counts:
+        Number of observations per bucket, not cumulative, with a final
+        bucket for observations above the largest bound.
+    :ivar count: Number of observations.
+    :ivar sum: Sum of the observations.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Observe a value.
+
+        Not thread-safe, observations are serialized by :class:`Metrics`.
+
+        :param value: Value.
+        """
+
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def get_cumulative_counts(self):
+        """Get the cumulative number of observations per bucket.
+
+        :returns:
+            a :class:`list` of :class:`tuple` of upper bounds, with
+            ``float('inf')`` last, and the number of observations up to them.
+        """
+
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'), ), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def get_quantile(self, quantile):
+        """Estimate a quantile of the observations.
+
+        The quantile is interpolated linearly within its bucket, like
+        Prometheus' ``histogram_quantile``.
+
+        :param quantile: Quantile between ``0`` and ``1``.
+        :returns:
+            the estimated quantile or ``None`` without observations. The
+            largest bound for quantiles above it.
+        """
+
+        if not self.count:
+            return None
+
+        rank = quantile * self.count
+        lower = 0.0
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and total + count >= rank:
+                return lower + (bound - lower) * (rank - total) / count
+            total += count
+            lower = bound
+        return self.buckets[-1] if self.buckets else None
+
+    def copy(self):
+        """Copy the histogram.
+
+        :rtype: Histogram
+        """
+
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.sum = self.sum
+        return histogram
+
+
+# Metric name, type, help text and label names by attribute.
+_METRICS = collections.OrderedDict((
+    ('checks_skipped', (
+        'pyvat_checks_skipped_total',
+        'counter',
+        'VAT number checks concluded without consulting a registry.',
+        ('reason', ),
+    )),
+    ('cache_lookups', (
+        'pyvat_cache_lookups_total',
+        'counter',
+        'Result cache lookups.',
+        ('result', ),
+    )),
+    ('check_duration', (
+        'pyvat_check_duration_seconds',
+        'histogram',
+        'Duration of VAT number checks against registries, including '
+        'retries and time spent in pyvat.',
+        ('registry', 'country_code'),
+    )),
+    ('requests', (
+        'pyvat_registry_requests_total',
+        'counter',
+        'Requests to registries.',
+        ('registry', 'country_code'),
+    )),
+    ('retries', (
+        'pyvat_registry_retries_total',
+        'counter',
+        'Requests to registries retrying a failed attempt.',
+        ('registry', 'country_code'),
+    )),
+    ('outcomes', (
+        'pyvat_registry_outcomes_total',
+        'counter',
+        'Outcomes of attempts of registry checks.',
+        ('registry', 'country_code', 'outcome'),
+    )),
+    ('request_duration', (
+        'pyvat_registry_request_duration_seconds',
+        'histogram',
+        'Duration of requests to registries, including connecting and '
+        'server time.',
+        ('registry', 'country_code'),
+    )),
+    ('parse_duration', (
+        'pyvat_registry_parse_duration_seconds',
+        'histogram',
+        'Duration of parsing registry responses.',
+        ('registry', ),
+    )),
+))
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    labels = list(zip(names, values)) + list(extra)
+    if not labels:
+        return ''
+    return '{%s}' % (','.join('%s="%s"' % (name, _escape_label_value(value))
+                              for name, value in labels))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value)
+
+
+class Metrics(RegistryHooks):
+    """In-process metrics of VAT number checks.
+
+    Registry level metrics, namely request counts, retries, outcomes and
+    request and parsing latency histograms per registry and country code,
+    are recorded by adding the metrics to the hooks of registries. Check
+    level metrics, namely result cache hits and misses, checks skipped by
+    format pre-validation and latency histograms of entire checks, are
+    recorded by setting ``pyvat.VAT_METRICS`` to the metrics.
+
+    Outcomes are ``valid``, ``invalid`` and ``nondeterministic`` for parsed
+    responses, the fault code for faults, and ``timeout``,
+    ``request_failed``, ``circuit_breaker_open``,
+    ``access_token_unavailable`` or ``invalid_response`` for other errors.
+
+    Recording takes a lock, but no I/O, so metrics are cheap enough to
+    keep in production. Metrics can be read through :meth:`snapshot` or
+    rendered in the Prometheus text exposition format by
+    :meth:`render_text`.
+
+    :ivar buckets: Upper bounds in seconds of latency histogram buckets.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = dict((attribute, {}) for attribute in _METRICS)
+
+    def _increment(self, attribute, labels):
+        values = self._values[attribute]
+        with self._lock:
+            values[labels] = values.get(labels, 0) + 1
+
+    def _observe(self, attribute, labels, value):
+        values = self._values[attribute]
+        with self._lock:
+            histogram = values.get(labels)
+            if histogram is None:
+                histogram = values[labels] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        """Discard all recorded metrics.
+        """
+
+        with self._lock:
+            for values in self._values.values():
+                values.clear()
+
+    def record_check_skipped(self, reason):
+        """Record a check concluded without consulting a registry.
+
+        :param reason:
+            :data:`UNDECOMPOSABLE`, :data:`INVALID_FORMAT` or
+            :data:`NO_REGISTRY`.
+        """
+
+        self._increment('checks_skipped', (reason, ))
+
+    def record_cache_lookup(self, hit):
+        """Record a result cache lookup.
+
+        :param hit: Whether a result was found.
+        """
+
+        self._increment('cache_lookups', ('hit' if hit else 'miss', ))
+
+    def record_check(self, registry, country_code, duration):
+        """Record a check against a registry.
+
+        :param registry: Name of the registry.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :param duration: Seconds the check took.
+        """
+
+        self._observe('check_duration', (registry, country_code), duration)
+
+    def on_request_start(self, event):
+        labels = (event.registry, event.country_code)
+        self._increment('requests', labels)
+        if event.attempt is not None and event.attempt > 1:
+            self._increment('retries', labels)
+
+    def on_response(self, event):
+        self._observe('request_duration',
+                      (event.registry, event.country_code),
+                      event.duration)
+
+    def on_parse_done(self, event):
+        if event.is_valid is None:
+            outcome = 'nondeterministic'
+        else:
+            outcome = 'valid' if event.is_valid else 'invalid'
+        self._increment('outcomes',
+                        (event.registry, event.country_code, outcome))
+        self._observe('parse_duration', (event.registry, ), event.duration)
+
+    def on_error(self, event):
+        # Failed requests count towards the request latency, as timeouts
+        # are a prime source of latency.
+        if event.status_code is None and \
+                event.reason in (retry.TIMEOUT, retry.REQUEST_FAILED):
+            self._observe('request_duration',
+                          (event.registry, event.country_code),
+                          event.duration)
+
+        outcome = event.fault_code or (event.reason or 'error') \
+            .replace(' ', '_')
+        self._increment('outcomes',
+                        (event.registry, event.country_code, outcome))
+
+    def snapshot(self):
+        """Take a consistent snapshot of the metrics.
+
+        :returns:
+            a :class:`dict` mapping metric names, such as
+            ``pyvat_registry_requests_total``, to :class:`list` instances of
+            samples. Counter samples are :class:`dict` instances of
+            ``labels`` and ``value``, histogram samples of ``labels``,
+            ``count``, ``sum``, cumulative ``buckets`` and estimated ``p50``,
+            ``p90`` and ``p99`` quantiles. The ``cache_hit_ratio`` key holds
+            the ratio of result cache hits to lookups or ``None`` without
+            lookups.
+        """
+
+        with self._lock:
+            values = dict(
+                (attribute, dict(
+                    (labels, value.copy() if isinstance(value, Histogram)
+                     else value)
+                    for labels, value in metric_values.items()
+                ))
+                for attribute, metric_values in self._values.items()
+            )
+
+        snapshot = collections.OrderedDict()
+        for attribute, (name, kind, _, label_names) in _METRICS.items():
+            samples = []
+            for labels, value in sorted(values[attribute].items()):
+                sample = collections.OrderedDict((
+                    ('labels', dict(zip(label_names, labels))),
+                ))
+                if kind == 'histogram':
+                    sample['count'] = value.count
+                    sample['sum'] = value.sum
+                    sample['buckets'] = value.get_cumulative_counts()
+                    for quantile in (50, 90, 99):
+                        sample['p%d' % (quantile)] = \
+                            value.get_quantile(quantile / 100.0)
+                else:
+                    sample['value'] = value
+                samples.append(sample)
+            snapshot[name] = samples
+
+        lookups = values['cache_lookups']
+        total = sum(lookups.values())
+        snapshot['cache_hit_ratio'] = \
+            lookups.get(('hit', ), 0) / float(total) if total else None
+        return snapshot
+
+    def render_text(self):
+        """Render the metrics in the Prometheus text exposition format.
+
+        :returns: the metrics as text of :data:`CONTENT_TYPE`.
+        """
+
+        with self._lock:
+            values = dict(
+                (attribute, sorted(
+                    (labels, value.copy() if isinstance(value, Histogram)
+                     else value)
+                    for labels, value in metric_values.items()
+                ))
+                for attribute, metric_values in self._values.items()
+            )
+
+        lines = []
+        for attribute, (name, kind, help_text, label_names) in \
+                _METRICS.items():
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in values[attribute]:
+                if kind != 'histogram':
+                    lines.append('%s%s %s' % (
+                        name,
+                        _format_labels(label_names, labels),
+                        _format_value(value),
+                    ))
+                    continue
+
+                for bound, count in value.get_cumulative_counts():
+                    lines.append('%s_bucket%s %d' % (
+                        name,
+                        _format_labels(label_names,
+                                       labels,
+                                       [('le', _format_value(bound))]),
+                        count,
+                    ))
+                lines.append('%s_sum%s %s' % (
+                    name,
+                    _format_labels(label_names, labels),
+                    _format_value(value.sum),
+                ))
+                lines.append('%s_count%s %d' % (
+                    name,
+                    _format_labels(label_names, labels),
+                    value.count,
+                ))
+        return '\n'.join(lines) + '\n'
+
+
+__all__ = (
+    'CONTENT_TYPE',
+    'DEFAULT_BUCKETS',
+    'Histogram',
+    'Metrics',
+    'INVALID_FORMAT',
+    'NO_REGISTRY',
+    'UNDECOMPOSABLE',
+)
@@ -0,0 +1,257 @@
+import asyncio
+import os
+import threading
+import time
+
+import requests
+
+from .exceptions import TokenError
+from .single_flight import SingleFlight
+
+
+class ClientCredentialsTokenManager(object):
+    """OAuth 2.0 client credentials access token manager.
+
+    Access tokens are cached until they expire. Once the cached token is
+    within the refresh margin of expiring, it keeps being handed out while a
+    single background thread obtains a new one, so callers only wait for a
+    token request when no unexpired token is cached at all. Concurrent token
+    requests from multiple threads are coalesced into one.
+
+    To avoid waiting for the first token, and for tokens expiring while
+    unused, tokens can be refreshed ahead of expiry in the background by
+    :meth:`start_refreshing`.
+
+    :ivar token_url: URL of the token endpoint.
+    :ivar client_id: Client ID.
+    :ivar client_secret: Client secret.
+    :ivar scope: Optional space separated scopes to request.
+    :ivar refresh_margin:
+        Seconds before expiry from which a token is refreshed, capped at
+        half of the token's lifetime.
+    :ivar timeout:
+        Connect and read timeout tuple of token requests passed to
+        :mod:`requests`.
+    """
+
+    DEFAULT_EXPIRES_IN = 3600
+    """Lifetime in seconds of tokens for which no lifetime is given."""
+
+    def __init__(self,
+                 token_url,
+                 client_id,
+                 client_secret,
+                 scope=None,
+                 refresh_margin=60,
+                 timeout=(3.05, 8),
+                 session=None):
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self._session = session
+        self._session_pid = None if session is None else os.getpid()
+        self._shared_session = session is not None
+        self._lock = threading.Lock()
+        self._token = (None, 0, 0)
+        self._requests = SingleFlight()
+        self._background_refresh = False
+        self._refreshing = None
+
+    @property
+    def session(self):
+        """HTTP session used to request tokens.
+
+        The session passed to the token manager, if any, or a pooled session
+        created in every process.
+
+        :rtype: requests.Session
+        """
+
+        session = self._session
+        if self._shared_session:
+            return session
+        if session is None or self._session_pid != os.getpid():
+            with self._lock:
+                if self._session is None or \
+                        self._session_pid != os.getpid():
+                    self._session = requests.Session()
+                    self._session_pid = os.getpid()
+                session = self._session
+        return session
+
+    def get_cached_token(self):
+        """Get the cached token without requesting a new one.
+
+        Schedules a background refresh if the token is about to expire.
+
+        :returns: the access token or ``None`` if no unexpired token is
+            cached.
+        """
+
+        token, expires_at, refresh_at = self._token
+        now = time.monotonic()
+        if token is None or now >= expires_at:
+            return None
+        if now >= refresh_at:
+            self._refresh_in_background()
+        return token
+
+    def get_token(self):
+        """Get an access token.
+
+        :returns: the access token.
+        :raises TokenError: if no token could be obtained.
+        """
+
+        token = self.get_cached_token()
+        if token is None:
+            token = self.refresh(force=False)
+        return token
+
+    async def get_token_async(self):
+        """Get an access token without blocking the event loop.
+
+        Asynchronous counterpart of :meth:`get_token`, requesting tokens in
+        the event loop's default executor.
+        """
+
+        token = self.get_cached_token()
+        if token is None:
+            loop = asyncio.get_event_loop()
+            token = await loop.run_in_executor(None, self.refresh, False)
+        return token
+
+    def refresh(self, force=True):
+        """Request a new access token.
+
+        Joins a token request in flight, if any.
+
+        :param force:
+            Whether to request a new token even if the cached token is not
+            yet due for refresh. Default ``True``.
+        :returns: the access token.
+        :raises TokenError: if no token could be obtained.
+        """
+
+        token, _ = self._requests.do(force, self._request_token, force)
+        return token
+
+    def invalidate(self, token):
+        """Discard a cached token, for example after it was rejected.
+
+        :param token: The rejected token. Newer tokens are kept.
+        """
+
+        with self._lock:
+            if self._token[0] == token:
+                self._token = (None, 0, 0)
+
+    def start_refreshing(self):
+        """Start refreshing tokens ahead of expiry in the background.
+        """
+
+        self.stop_refreshing()
+        stopped = threading.Event()
+        thread = threading.Thread(target=self._refresh_periodically,
+                                  args=(stopped, ),
+                                  name='pyvat-oauth-token-refreshing')
+        thread.daemon = True
+        self._refreshing = (thread, stopped)
+        thread.start()
+
+    def stop_refreshing(self):
+        """Stop refreshing tokens in the background, if started.
+        """
+
+        refreshing, self._refreshing = self._refreshing, None
+        if refreshing is not None:
+            thread, stopped = refreshing
+            stopped.set()
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _refresh_periodically(self, stopped):
+        while not stopped.is_set():
+            try:
+                self.refresh(force=False)
+                delay = self._token[2] - time.monotonic()
+            except Exception:
+                delay = min(self.refresh_margin, 10)
+            stopped.wait(max(delay, 1))
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._background_refresh:
+                return
+            self._background_refresh = True
+
+        def refresh():
+            try:
+                self.refresh(force=False)
+            except Exception:
+                pass
+            finally:
+                self._background_refresh = False
+
+        thread = threading.Thread(target=refresh,
+                                  name='pyvat-oauth-token-refresh')
+        thread.daemon = True
+        thread.start()
+
+    def _request_token(self, force):
+        # The token may have been refreshed while waiting to get here.
+        token, _, refresh_at = self._token
+        if not force and token is not None and time.monotonic() < refresh_at:
+            return token
+
+        data = {
+            'grant_type': 'client_credentials',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+        }
+        if self.scope:
+            data['scope'] = self.scope
+
+        requested_at = time.monotonic()
+        try:
+            response = self.session.post(
+                self.token_url,
+                data=data,
+                headers={'Accept': 'application/json'},
+                timeout=self.timeout
+            )
+        except Exception as exception:
+            raise TokenError('token request failed with exception: %r' %
+                             (exception))
+        if response.status_code != 200:
+            raise TokenError('token request failed with status %d' %
+                             (response.status_code))
+
+        # We basically expect the result structure to be as follows.
+        #
+        # {
+        #     "access_token": "48ba62e3c8dbc1a9f4c3a0b8bd1a0a0d",
+        #     "token_type": "bearer",
+        #     "expires_in": 14400
+        # }
+        try:
+            payload = response.json()
+            token = payload['access_token']
+            expires_in = float(payload.get('expires_in',
+                                           self.DEFAULT_EXPIRES_IN))
+        except Exception as exception:
+            raise TokenError('invalid token response: %r' % (exception))
+
+        # Refresh short-lived tokens halfway through their lifetime rather
+        # than immediately.
+        expires_at = requested_at + expires_in
+        refresh_at = expires_at - min(self.refresh_margin, expires_in / 2)
+        with self._lock:
+            self._token = (token, expires_at, refresh_at)
+        return token
+
+
+__all__ = ('ClientCredentialsTokenManager', )
@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+
+from .exceptions import RateLimitError
+
+
+class TokenBucket(object):
+    """Token bucket.
+
+    Tokens are added at a constant rate up to the capacity of the bucket,
+    and each request takes a token. Requests arriving at an empty bucket
+    reserve a future token and wait for it, so waiting requests are served
+    in order of arrival.
+
+    :ivar rate: Number of tokens added per second.
+    :ivar capacity: Maximum number of tokens, bounding bursts.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, timeout=None):
+        """Reserve a token.
+
+        :param timeout:
+            Maximum number of seconds the caller is willing to wait for the
+            token. Default ``None`` waiting as long as necessary.
+        :returns:
+            the number of seconds to wait before the token is available or
+            ``None`` if the token would not be available within the timeout,
+            in which case no token is reserved.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens +
+                               (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                return None
+
+            self._tokens -= 1
+            return wait
+
+    def cancel(self):
+        """Return a reserved token to the bucket.
+        """
+
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class RateLimiter(object):
+    """Rate limiter with a global and per-key token buckets.
+
+    Requests take a token from the global bucket, if any, and from the
+    bucket of their key, such as a country code, if any.
+
+    :ivar timeout:
+        Default maximum number of seconds to wait for tokens. ``None`` blocks
+        as long as necessary, while ``0`` fails fast.
+    """
+
+    def __init__(self, rate=None, capacity=None, key_rates=None,
+                 timeout=None):
+        """Initialize a rate limiter.
+
+        :param rate: Optional global number of requests per second.
+        :param capacity: Optional global burst capacity.
+        :param key_rates:
+            Optional mapping from keys to the number of requests per second
+            or :class:`tuple` instances of the number of requests per second
+            and burst capacity for the key.
+        :param timeout: Default maximum number of seconds to wait for tokens.
+        """
+
+        self.bucket = TokenBucket(rate, capacity) if rate else None
+        self.key_buckets = {}
+        for key, key_rate in (key_rates or {}).items():
+            if not isinstance(key_rate, tuple):
+                key_rate = (key_rate, )
+            self.key_buckets[key] = TokenBucket(*key_rate)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._waiting = {}
+
+    @property
+    def queue_depth(self):
+        """Number of requests currently waiting for tokens.
+        """
+
+        return sum(self._waiting.values())
+
+    def get_queue_depth(self, key):
+        """Get the number of requests for a key currently waiting for tokens.
+
+        :param key: Key, such as a country code.
+        :returns: the number of waiting requests.
+        """
+
+        return self._waiting.get(key, 0)
+
+    def _reserve(self, key, timeout):
+        if timeout is None:
+            timeout = self.timeout
+
+        buckets = [bucket for bucket in (self.key_buckets.get(key),
+                                         self.bucket)
+                   if bucket is not None]
+        reserved = []
+        wait = 0.0
+        for bucket in buckets:
+            bucket_wait = bucket.reserve(timeout)
+            if bucket_wait is None:
+                for reserved_bucket in reserved:
+                    reserved_bucket.cancel()
+                raise RateLimitError(key if bucket is not self.bucket
+                                     else None)
+            reserved.append(bucket)
+            wait = max(wait, bucket_wait)
+        return wait
+
+    def _update_waiting(self, key, delta):
+        with self._lock:
+            self._waiting[key] = self._waiting.get(key, 0) + delta
+
+    def acquire(self, key=None, timeout=None):
+        """Acquire the tokens for a request, blocking until available.
+
+        :param key: Optional key, such as a country code.
+        :param timeout:
+            Optional maximum number of seconds to wait, overriding the default
+            of the rate limiter.
+        :raises RateLimitError:
+            if the tokens would not be available within the timeout.
+        """
+
+        wait = self._reserve(key, timeout)
+        if wait > 0:
+            self._update_waiting(key, 1)
+            try:
+                time.sleep(wait)
+            finally:
+                self._update_waiting(key, -1)
+
+    async def acquire_async(self, key=None, timeout=None):
+        """Acquire the tokens for a request without blocking the event loop.
+
+        Asynchronous counterpart of :meth:`acquire`.
+        """
+
+        wait = self._reserve(key, timeout)
+        if wait > 0:
+            self._update_waiting(key, 1)
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._update_waiting(key, -1)
+
+
+__all__ = ('TokenBucket', 'RateLimiter', )
@@ -1,30 +1,567 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import queue
+import threading
+import time
 import requests
-import xml.dom.minidom
 
 from requests import Timeout
+from requests.adapters import HTTPAdapter
 
-from .result import VatNumberCheckResult
-from .xml_utils import get_first_child_element, get_text, NodeNotFoundError
-from .exceptions import ServerError
+from . import aio, retry
+from .hooks import RegistryEvent
+from .result import LOG_FULL, LOG_SUMMARY, VatNumberCheckResult
+from .xml_utils import parse_soap_response
+from .exceptions import ServerError, TokenError
+
+
+def _call_hooks(hooks, method, event):
+    """Call a method of registry hooks, ignoring any exceptions.
+
+    :param hooks: Iterable of :class:`~pyvat.hooks.RegistryHooks`.
+    :param method: Name of the method to call, such as ``on_error``.
+    :param event: Event to pass.
+    :type event: RegistryEvent
+    """
+
+    for hook in hooks:
+        try:
+            getattr(hook, method)(event)
+        except Exception:
+            pass
+
+
+class _AttemptTrace(object):
+    """Emits the events of an attempt of a check to registry hooks.
+
+    Each event carries the time spent since the previous event of the
+    attempt.
+    """
+
+    def __init__(self, hooks, registry, vat_number, country_code, attempt):
+        self.hooks = hooks
+        self.registry = registry
+        self.vat_number = vat_number
+        self.country_code = country_code
+        self.attempt = attempt
+        self.started_at = self._phase_started_at = time.monotonic()
+
+    def emit(self, method, **kwargs):
+        now = time.monotonic()
+        event = RegistryEvent(self.registry,
+                              self.vat_number,
+                              self.country_code,
+                              attempt=self.attempt,
+                              started_at=self.started_at,
+                              duration=now - self._phase_started_at,
+                              elapsed=now - self.started_at,
+                              **kwargs)
+        self._phase_started_at = now
+        _call_hooks(self.hooks, method, event)
+
+
+class _NullTrace(object):
+    """Stand-in for :class:`_AttemptTrace` for registries without hooks.
+    """
+
+    def emit(self, method, **kwargs):
+        pass
+
+
+_NULL_TRACE = _NullTrace()
+
+
+def _process_traced(process_response, trace, result, status_code, *args):
+    """Process a response, emitting the response and parsing events.
+
+    :param process_response:
+        Method processing the response, taking the result, the status code
+        and the remaining arguments.
+    :param trace: Trace of the attempt.
+    :param result: Result to populate.
+    :param status_code: HTTP status code of the response.
+    :returns: the populated result.
+    """
+
+    trace.emit('on_response', status_code=status_code)
+    try:
+        process_response(result, status_code, *args)
+    except ServerError as e:
+        trace.emit('on_error',
+                   status_code=status_code,
+                   fault_code=e.fault_code,
+                   error=e,
+                   reason=retry.describe_outcome(e))
+        raise
+    except Exception as e:
+        trace.emit('on_error',
+                   status_code=status_code,
+                   error=e,
+                   reason=u'invalid response')
+        raise
+    trace.emit('on_parse_done',
+               status_code=status_code,
+               is_valid=result.is_valid)
+    return result
 
 
 class Registry(object):
     """Abstract base registry.
 
     Defines an explicit interface for accessing arbitary registries.
+
+    Registries communicating over HTTP own a pooled, keep-alive
+    :class:`requests.Session`, which is created lazily on first use and is
+    shared between all threads using the registry instance. A new session is
+    created in forked child processes, so pooled connections are never shared
+    between processes.
+
+    :ivar pool_size: Maximum number of connections kept alive per host.
+    :ivar pool_block:
+        Whether requests should block waiting for a free connection when the
+        pool is exhausted instead of opening a throwaway connection.
+    :ivar keep_alive:
+        Whether connections should be kept alive between requests.
+    :ivar connect_timeout: Timeout in seconds for establishing a connection.
+    :ivar read_timeout: Timeout in seconds for reading the response.
+    :ivar batch_concurrency:
+        Maximum number of concurrent checks against the registry performed by
+        :func:`pyvat.check_vat_numbers`.
+    :ivar retry_policy:
+        Optional :class:`~pyvat.retry.RetryPolicy` applied to checks.
+    :ivar rate_limiter:
+        Optional :class:`~pyvat.rate_limit.RateLimiter` keyed on country code,
+        which every request to the registry must acquire tokens from. Tokens
+        are not waited for past the deadline of the retry policy.
+    :ivar log_level:
+        Level up to which check results record log lines, one of
+        :data:`~pyvat.result.LOG_OFF`, :data:`~pyvat.result.LOG_SUMMARY` and
+        :data:`~pyvat.result.LOG_FULL`, which includes request and response
+        bodies.
+    :ivar max_log_lines: Maximum number of log lines per check result.
+    :ivar max_log_body_size:
+        Maximum size of request and response bodies logged, beyond which
+        bodies are truncated.
+    :ivar hooks:
+        :class:`list` of :class:`~pyvat.hooks.RegistryHooks` instrumenting
+        the checks of the registry.
+    :ivar name: Name of the registry passed to hooks.
     """
 
-    def check_vat_number(self, vat_number, country_code, test):
+    NAME = None
+    """Default name of the registry, falling back to the class name."""
+
+    DEFAULT_TIMEOUT = 8
+    """Timeout for the requests."""
+
+    DEFAULT_CONNECT_TIMEOUT = 3.05
+    """Timeout for establishing connections."""
+
+    DEFAULT_POOL_SIZE = 10
+    """Maximum number of pooled connections per host."""
+
+    DEFAULT_BATCH_CONCURRENCY = 4
+    """Maximum number of concurrent checks in batches."""
+
+    DEFAULT_MAX_LOG_LINES = 50
+    """Maximum number of log lines per check result."""
+
+    DEFAULT_MAX_LOG_BODY_SIZE = 4096
+    """Maximum size of logged request and response bodies."""
+
+    def __init__(self,
+                 pool_size=None,
+                 pool_block=False,
+                 keep_alive=True,
+                 connect_timeout=None,
+                 read_timeout=None,
+                 batch_concurrency=None,
+                 retry_policy=None,
+                 rate_limiter=None,
+                 log_level=LOG_SUMMARY,
+                 max_log_lines=None,
+                 max_log_body_size=None,
+                 hooks=None,
+                 name=None):
+        self.pool_size = pool_size or self.DEFAULT_POOL_SIZE
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.connect_timeout = connect_timeout or self.DEFAULT_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or self.DEFAULT_TIMEOUT
+        self.batch_concurrency = \
+            batch_concurrency or self.DEFAULT_BATCH_CONCURRENCY
+        self.retry_policy = retry_policy
+        self.rate_limiter = rate_limiter
+        self.log_level = log_level
+        self.max_log_lines = max_log_lines or self.DEFAULT_MAX_LOG_LINES
+        self.max_log_body_size = \
+            max_log_body_size or self.DEFAULT_MAX_LOG_BODY_SIZE
+        self.hooks = list(hooks or ())
+        self.name = name or self.NAME or type(self).__name__
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        """Connect and read timeout tuple passed to :mod:`requests`.
+        """
+
+        return (self.connect_timeout, self.read_timeout)
+
+    @property
+    def session(self):
+        """Pooled HTTP session of the registry.
+
+        :rtype: requests.Session
+        """
+
+        session = self._session
+        if session is None or self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or \
+                        self._session_pid != os.getpid():
+                    self._session = self.create_session()
+                    self._session_pid = os.getpid()
+                session = self._session
+        return session
+
+    def create_session(self):
+        """Create the pooled HTTP session used by the registry.
+
+        :rtype: requests.Session
+        """
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size,
+                              pool_maxsize=self.pool_size,
+                              pool_block=self.pool_block)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def close(self):
+        """Close all pooled connections of the registry.
+        """
+
+        with self._session_lock:
+            session, self._session = self._session, None
+            pid, self._session_pid = self._session_pid, None
+        if session is not None and pid == os.getpid():
+            session.close()
+
+    def warm_up(self, connections=1):
+        """Open connections to the registry ahead of the first check.
+
+        Failures are ignored, as warming up is merely an optimization.
+
+        :param connections:
+            Number of connections to open per URL, capped by the pool size.
+        :returns: the number of successful warm-up requests.
+        """
+
+        connections = max(1, min(connections, self.pool_size))
+        successes = []
+
+        def open_connection(url):
+            try:
+                self.session.head(url, timeout=self.timeout)
+            except Exception:
+                return
+            successes.append(url)
+
+        threads = [threading.Thread(target=open_connection, args=(url,))
+                   for url in self.get_warm_up_urls()
+                   for _ in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return len(successes)
+
+    def create_result(self):
+        """Create a check result recording log lines as configured.
+
+        :rtype: VatNumberCheckResult
+        """
+
+        return VatNumberCheckResult(log_level=self.log_level,
+                                    max_log_lines=self.max_log_lines)
+
+    def _trace(self, vat_number, country_code, attempt):
+        """Start tracing an attempt of a check for the registry hooks.
+
+        :param vat_number: VAT number without country code prefix.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :param attempt: Number of the attempt, starting at ``1``.
+        :returns:
+            an object whose ``emit(method, **attributes)`` method passes an
+            event to the hooks.
+        """
+
+        if not self.hooks:
+            return _NULL_TRACE
+        return _AttemptTrace(self.hooks,
+                             self.name,
+                             vat_number,
+                             country_code,
+                             attempt)
+
+    def notify_cache_hit(self, vat_number, country_code, result, duration):
+        """Notify the registry hooks of a check answered from a cache.
+
+        :param vat_number: VAT number without country code prefix.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :param result: Cached result.
+        :type result: VatNumberCheckResult
+        :param duration: Seconds spent looking up the result.
+        """
+
+        if not self.hooks:
+            return
+        _call_hooks(self.hooks, 'on_cache_hit', RegistryEvent(
+            self.name,
+            vat_number,
+            country_code,
+            duration=duration,
+            is_valid=result.is_valid,
+        ))
+
+    def _log_body(self, result, body):
+        """Log a request or response body, truncating it if necessary.
+
+        Bodies are only logged at the :data:`~pyvat.result.LOG_FULL` level.
+
+        :param result: Result to log the body to.
+        :param body: Body as text or bytes.
+        """
+
+        if result.log_level < LOG_FULL:
+            return
+
+        if len(body) <= self.max_log_body_size:
+            result.log(LOG_FULL, u'%s', body)
+        else:
+            result.log(LOG_FULL,
+                       u'%s... (truncated from %d)',
+                       body[:self.max_log_body_size],
+                       len(body))
+
+    def _get_attempt_timeout(self, deadline):
+        """Get the connect and read timeout of an attempt.
+
+        :param deadline:
+            Optional deadline of the check as a :func:`time.monotonic`
+            timestamp, which the timeouts are shortened to honor.
+        :returns: a :class:`tuple` of the connect and read timeout.
+        """
+
+        if deadline is None:
+            return self.timeout
+
+        remaining = max(deadline - time.monotonic(), 0.001)
+        return (min(self.connect_timeout, remaining),
+                min(self.read_timeout, remaining))
+
+    def _get_rate_limit_timeout(self, deadline):
+        """Get the maximum number of seconds to wait for rate limiter tokens.
+
+        :param deadline:
+            Optional deadline of the check as a :func:`time.monotonic`
+            timestamp, past which no tokens are waited for.
+        :returns:
+            the timeout or ``None`` using the default of the rate limiter.
+        """
+
+        if deadline is None:
+            return None
+
+        remaining = max(deadline - time.monotonic(), 0)
+        if self.rate_limiter.timeout is None:
+            return remaining
+        return min(self.rate_limiter.timeout, remaining)
+
+    def _acquire_rate_limit(self, country_code, deadline):
+        """Acquire the rate limiter tokens of a request, if rate limited.
+
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :param deadline: Optional deadline of the check.
+        :raises RateLimitError:
+            if the tokens would not be available within the timeout of the
+            rate limiter or before the deadline.
+        """
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(country_code,
+                                      self._get_rate_limit_timeout(deadline))
+
+    async def _acquire_rate_limit_async(self, country_code, deadline):
+        """Acquire the rate limiter tokens of a request, if rate limited.
+
+        Asynchronous counterpart of :meth:`_acquire_rate_limit`.
+        """
+
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(
+                country_code,
+                self._get_rate_limit_timeout(deadline)
+            )
+
+    def _get_retry_delay(self, result, attempt, outcome, deadline):
+        """Get the delay before retrying an attempt, logging the retry.
+
+        :returns:
+            the delay in seconds or ``None`` if the attempt should not be
+            retried.
+        """
+
+        if self.retry_policy is None or outcome is None:
+            return None
+
+        delay = self.retry_policy.get_delay(attempt, outcome, deadline)
+        if delay is not None:
+            result.log(LOG_SUMMARY,
+                       u'> Attempt %d failed with %s, retrying in %.3f '
+                       u'seconds',
+                       attempt,
+                       retry.describe_outcome(outcome),
+                       delay)
+        return delay
+
+    def _check_with_retries(self, vat_number, country_code, attempt):
+        """Perform attempts of a check according to the retry policy.
+
+        :param vat_number: VAT number without country code prefix.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :param attempt:
+            Function performing a single attempt, taking the trace emitting
+            events to the registry hooks, the :class:`VatNumberCheckResult`
+            to populate, the timeout of the attempt and the deadline of the
+            check or ``None``. Returns the attempt
+            outcome as described by :class:`~pyvat.retry.RetryPolicy` or
+            ``None`` if no request was performed, and raises
+            :class:`~pyvat.exceptions.ServerError` on faults.
+        :returns: the :class:`VatNumberCheckResult` of the last attempt.
+        """
+
+        deadline = self.retry_policy.get_deadline() \
+            if self.retry_policy is not None else None
+        result = self.create_result()
+        number = 1
+
+        while True:
+            try:
+                outcome = attempt(self._trace(vat_number,
+                                              country_code,
+                                              number),
+                                  result,
+                                  self._get_attempt_timeout(deadline),
+                                  deadline)
+            except ServerError as e:
+                outcome = e
+
+            delay = self._get_retry_delay(result, number, outcome, deadline)
+            if delay is None:
+                if isinstance(outcome, ServerError):
+                    raise outcome
+                return result
+
+            time.sleep(delay)
+            result.clear()
+            number += 1
+
+    async def _check_with_retries_async(self,
+                                        vat_number,
+                                        country_code,
+                                        attempt):
+        """Perform asynchronous attempts of a check.
+
+        Asynchronous counterpart of :meth:`_check_with_retries`.
+        """
+
+        deadline = self.retry_policy.get_deadline() \
+            if self.retry_policy is not None else None
+        result = self.create_result()
+        number = 1
+
+        while True:
+            try:
+                outcome = await attempt(self._trace(vat_number,
+                                                    country_code,
+                                                    number),
+                                        result,
+                                        self._get_attempt_timeout(deadline),
+                                        deadline)
+            except ServerError as e:
+                outcome = e
+
+            delay = self._get_retry_delay(result, number, outcome, deadline)
+            if delay is None:
+                if isinstance(outcome, ServerError):
+                    raise outcome
+                return result
+
+            await asyncio.sleep(delay)
+            result.clear()
+            number += 1
+
+    def get_warm_up_urls(self):
+        """Get the URLs to which connections are opened by :meth:`warm_up`.
+
+        :returns: a :class:`tuple` of URLs.
+        """
+
+        return ()
+
+    def check_vat_number(self, vat_number, country_code, test, fields=None):
         """Check if a VAT number is valid according to the registry.
 
         :param vat_number: VAT number without country code prefix.
         :param country_code: ISO 3166-1-alpha-2 country code.
         :param test: Boolean to identify if test or not.
+        :param fields:
+            Optional names of the business fields to retrieve from
+            :data:`pyvat.result.BUSINESS_FIELDS`. Default ``None`` retrieving
+            all fields. Fields not asked for are neither parsed nor stored.
+            Only passed when given, so registries not supporting field
+            projection may omit the argument.
         :returns: a :class:`VatNumberCheckResult` instance.
         """
 
         raise NotImplementedError()
 
+    async def check_vat_number_async(self,
+                                     vat_number,
+                                     country_code,
+                                     test,
+                                     fields=None):
+        """Check if a VAT number is valid according to the registry.
+
+        Asynchronous counterpart of :meth:`check_vat_number`. Registries
+        without native asynchronous support run :meth:`check_vat_number` in
+        the event loop's default executor.
+
+        :param vat_number: VAT number without country code prefix.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :param test: Boolean to identify if test or not.
+        :param fields:
+            Optional names of the business fields to retrieve. Default
+            ``None`` retrieving all fields.
+        :returns: a :class:`VatNumberCheckResult` instance.
+        """
+
+        args = (vat_number, country_code, test)
+        if fields is not None:
+            args += (fields, )
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self.check_vat_number, *args)
+
 
 class ViesRegistry(Registry):
     """VIES registry.
@@ -32,77 +569,587 @@ class ViesRegistry(Registry):
     Uses the European Commision's VIES registry for validating VAT numbers.
     """
 
+    NAME = 'vies'
+    """Default name of the registry."""
+
     CHECK_VAT_SERVICE_URL = 'http://ec.europa.eu/taxation_customs/vies/' \
                             'services/checkVatService'
     """URL for the VAT checking service.
     """
 
-    DEFAULT_TIMEOUT = 8
-    """Timeout for the requests."""
+    CHECK_STATUS_SERVICE_URL = 'https://ec.europa.eu/taxation_customs/vies/' \
+                               'rest-api/check-status'
+    """URL for the member state availability service.
+    """
 
-    def check_vat_number(self, vat_number, country_code, test):
-        # Non-ISO code used for Greece.
-        if country_code == 'GR':
-            country_code = 'EL'
+    REQUEST_CONTENT_TYPE = 'text/xml; charset=utf-8'
+    """Content type of the request payload.
+    """
 
-        # Request information about the VAT number.
-        result = VatNumberCheckResult()
-
-        request_data = (
-                u'<?xml version="1.0" encoding="UTF-8"?><SOAP-ENV:Envelope'
-                u' xmlns:ns0="urn:ec.europa.eu:taxud:vies:services:checkVa'
-                u't:types" xmlns:ns1="http://schemas.xmlsoap.org/soap/enve'
-                u'lope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-insta'
-                u'nce" xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/env'
-                u'elope/"><SOAP-ENV:Header/><ns1:Body><ns0:checkVat><ns0:c'
-                u'ountryCode>%s</ns0:countryCode><ns0:vatNumber>%s</ns0:va'
-                u'tNumber></ns0:checkVat></ns1:Body></SOAP-ENV:Envelope>' %
-                (country_code, vat_number)
-        )
+    RESPONSE_FIELDS = {
+        'business_name': 'name',
+        'business_address': 'address',
+        'business_country_code': 'countryCode',
+    }
+    """Mapping from business fields to the response elements holding them."""
+
+    CIRCUIT_BREAKER_FAULT_CODES = frozenset((
+        'MS_UNAVAILABLE',
+        'MS_MAX_CONCURRENT_REQ',
+        'SERVICE_UNAVAILABLE',
+        'TIMEOUT',
+    ))
+    """Fault codes counting as failures towards a member state's breaker.
+    """
 
-        result.log_lines += [
-            u'> POST %s with payload of content type text/xml, charset UTF-8:',
-            request_data,
-        ]
+    def __init__(self, circuit_breakers=None, hedging_policy=None, **kwargs):
+        """Initialize a VIES registry.
 
-        try:
-            response = requests.post(
+        :param circuit_breakers:
+            Optional :class:`~pyvat.circuit_breaker.CircuitBreakers` keyed on
+            country code. When given, timeouts, failed requests, server error
+            responses and faults indicating member state unavailability count
+            as failures, and checks for a member state whose breaker is open
+            immediately result in a nondeterministic result without
+            consulting the registry. Default ``None``.
+        :param hedging_policy:
+            Optional :class:`~pyvat.hedging.HedgingPolicy`. When given,
+            requests not answered within a percentile of the recent latency
+            for the member state are hedged by a second request, unless the
+            member state's circuit breaker is degraded. Default ``None``.
+        """
+
+        super(ViesRegistry, self).__init__(**kwargs)
+        self.circuit_breakers = circuit_breakers
+        self.hedging_policy = hedging_policy
+        self._status_polling = None
+        self._request_executor = None
+        self._request_executor_pid = None
+
+    def get_warm_up_urls(self):
+        return (self.CHECK_VAT_SERVICE_URL, )
+
+    def start_status_polling(self, interval=60):
+        """Start polling member state availability in the background.
+
+        Member states reported as unavailable by VIES have their circuit
+        breaker forced open until the next poll, so checks for them are not
+        sent to the registry at all. Requires circuit breakers.
+
+        :param interval: Seconds between polls.
+        """
+
+        if self.circuit_breakers is None:
+            raise ValueError('status polling requires circuit breakers')
+
+        self.stop_status_polling()
+        stopped = threading.Event()
+        thread = threading.Thread(target=self._poll_status,
+                                  args=(interval, stopped),
+                                  name='pyvat-vies-status-polling')
+        thread.daemon = True
+        self._status_polling = (thread, stopped)
+        thread.start()
+
+    def stop_status_polling(self):
+        """Stop polling member state availability, if started.
+        """
+
+        status_polling, self._status_polling = self._status_polling, None
+        if status_polling is not None:
+            thread, stopped = status_polling
+            stopped.set()
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def _poll_status(self, interval, stopped):
+        while not stopped.is_set():
+            try:
+                self.update_status(duration=interval)
+            except Exception:
+                pass
+            stopped.wait(interval)
+
+    def update_status(self, duration=60):
+        """Update circuit breakers from the member state availability service.
+
+        :param duration: Seconds to keep breakers of unavailable states open.
+        :returns:
+            a :class:`list` of the country codes of unavailable member states.
+        """
+
+        response = self.session.get(self.CHECK_STATUS_SERVICE_URL,
+                                    timeout=self.timeout)
+        response.raise_for_status()
+
+        # We basically expect the result structure to be as follows.
+        #
+        # {
+        #     "vow": {"available": true},
+        #     "countries": [
+        #         {"countryCode": "AT", "availability": "Available"},
+        #         {"countryCode": "EL", "availability": "Unavailable"}
+        #     ]
+        # }
+        unavailable = []
+        for country in response.json().get('countries', []):
+            if country.get('availability') != 'Unavailable':
+                continue
+
+            # Non-ISO code used for Greece.
+            country_code = country.get('countryCode')
+            if country_code == 'EL':
+                country_code = 'GR'
+
+            self.circuit_breakers[country_code].force_open(duration)
+            unavailable.append(country_code)
+
+        return unavailable
+
+    def _allow_request(self, country_code, trace, result):
+        """Test if a request for a member state may be performed.
+
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :param trace: Trace of the attempt.
+        :param result: Result to log a rejected request to.
+        :returns:
+            a :class:`tuple` of whether the request may be performed and the
+            member state's circuit breaker, if circuit breakers are used.
+        """
+
+        if self.circuit_breakers is None:
+            return True, None
+
+        breaker = self.circuit_breakers[country_code]
+        if not breaker.allow_request():
+            result.log(LOG_SUMMARY,
+                       u'< Request not performed as the circuit breaker for '
+                       u'%s is open',
+                       country_code)
+            trace.emit('on_error', reason=u'circuit breaker open')
+            return False, breaker
+        return True, breaker
+
+    def _report_outcome(self, breaker, failed):
+        """Report the outcome of a request to its circuit breaker, if any.
+
+        :param breaker:
+            Circuit breaker having let the request through or ``None``.
+        :param failed:
+            Whether the request failed, or ``None`` if it was not performed,
+            releasing it.
+        """
+
+        if breaker is None:
+            return
+        if failed is None:
+            breaker.cancel_request()
+        elif failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+    def _post(self, country_code, breaker, result, data, timeout):
+        """Send a check request, hedging it if enabled.
+
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :param breaker: Circuit breaker of the member state or ``None``.
+        :param result: Result to log hedging to.
+        :param data: Request payload as bytes.
+        :param timeout: Connect and read timeout tuple of each request.
+        :returns: the :class:`requests.Response` answered first.
+        :raises Exception:
+            the exception raised by the first request if no request was
+            answered.
+        """
+
+        def post():
+            return self.session.post(
                 self.CHECK_VAT_SERVICE_URL,
-                data=request_data.encode('utf-8'),
+                data=data,
                 headers={
-                    'Content-Type': 'text/xml; charset=utf-8',
+                    'Content-Type': self.REQUEST_CONTENT_TYPE,
                 },
-                timeout=self.DEFAULT_TIMEOUT
+                timeout=timeout
             )
-        except Timeout as e:
-            result.log_lines.append(u'< Request to EU VIEW registry timed out:'
-                                    u' {}'.format(e))
-            return result
-        except Exception as exception:
-            # Do not completely fail problematic requests.
-            result.log_lines.append(u'< Request failed with exception: %r' %
-                                    (exception))
-            return result
+
+        policy = self.hedging_policy
+        if policy is None:
+            return post()
+
+        policy.record_request()
+        answers = queue.Queue()
+
+        def send():
+            started_at = time.monotonic()
+            try:
+                response = post()
+            except Exception as exception:
+                answers.put((None, exception))
+                return
+            policy.record_latency(country_code,
+                                  time.monotonic() - started_at)
+            answers.put((response, None))
+
+        # Hedging a degraded member state would only add to its load.
+        if breaker is not None and breaker.is_degraded:
+            send()
+            response, exception = answers.get()
+            if exception is not None:
+                raise exception
+            return response
+
+        # Abandoned requests are left to complete in the background, which
+        # their timeouts bound.
+        delay = policy.get_delay(country_code)
+        self._submit_request(send)
+        pending = 1
+        try:
+            response, exception = answers.get(timeout=delay)
+        except queue.Empty:
+            if policy.reserve_hedge():
+                result.log(LOG_SUMMARY,
+                           u'> Hedging request unanswered after %.3f seconds',
+                           delay)
+                self._submit_request(send)
+                pending += 1
+            response, exception = answers.get()
+        pending -= 1
+
+        first_exception = exception
+        while response is None and pending:
+            response, exception = answers.get()
+            pending -= 1
+        if response is None:
+            raise first_exception
+        return response
+
+    def _submit_request(self, function):
+        """Submit a hedged request to the executor shared by all checks.
+
+        The executor is created on first use in every process, as worker
+        threads do not survive forking.
+
+        :param function: Function sending the request.
+        """
+
+        executor = self._request_executor
+        if executor is None or self._request_executor_pid != os.getpid():
+            with self._session_lock:
+                if self._request_executor is None or \
+                        self._request_executor_pid != os.getpid():
+                    # Every check occupies at most two workers.
+                    self._request_executor = \
+                        concurrent.futures.ThreadPoolExecutor(
+                            2 * self.pool_size
+                        )
+                    self._request_executor_pid = os.getpid()
+                executor = self._request_executor
+        executor.submit(function)
+
+    def close(self):
+        """Close all pooled connections and request workers of the registry.
+        """
+
+        super(ViesRegistry, self).close()
+
+        with self._session_lock:
+            executor, self._request_executor = self._request_executor, None
+            pid, self._request_executor_pid = \
+                self._request_executor_pid, None
+        if executor is not None and pid == os.getpid():
+            executor.shutdown(wait=False)
+
+    async def _post_async(self, country_code, breaker, result, data, timeout):
+        """Send a check request without blocking, hedging it if enabled.
+
+        Asynchronous counterpart of :meth:`_post`, cancelling the request
+        answered last.
+
+        :returns:
+            a :class:`tuple` of the status code, content type and body of the
+            response answered first.
+        """
+
+        def post():
+            return aio.request(
+                'POST',
+                self.CHECK_VAT_SERVICE_URL,
+                timeout[0],
+                timeout[1],
+                data=data,
+                headers={
+                    'Content-Type': self.REQUEST_CONTENT_TYPE,
+                }
+            )
+
+        policy = self.hedging_policy
+        if policy is None:
+            return await post()
+
+        policy.record_request()
+
+        async def send():
+            started_at = time.monotonic()
+            response = await post()
+            policy.record_latency(country_code,
+                                  time.monotonic() - started_at)
+            return response
+
+        # Hedging a degraded member state would only add to its load.
+        if breaker is not None and breaker.is_degraded:
+            return await send()
+
+        delay = policy.get_delay(country_code)
+        tasks = [asyncio.ensure_future(send())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done and policy.reserve_hedge():
+                result.log(LOG_SUMMARY,
+                           u'> Hedging request unanswered after %.3f seconds',
+                           delay)
+                tasks.append(asyncio.ensure_future(send()))
+
+            pending = set(tasks)
+            failed = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                answered = None
+                for task in tasks:
+                    if task not in done:
+                        continue
+                    if task.exception() is not None:
+                        failed = failed or task
+                    elif answered is None:
+                        answered = task
+                if answered is not None:
+                    return answered.result()
+            return failed.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def check_vat_number(self, vat_number, country_code, test, fields=None):
+        request_data = self._build_request_data(vat_number, country_code)
+        response_tags = self._get_response_tags(fields)
+
+        def attempt(trace, result, timeout, deadline):
+            # Request information about the VAT number.
+            allowed, breaker = self._allow_request(country_code,
+                                                   trace,
+                                                   result)
+            if not allowed:
+                return None
+
+            # Report the outcome to the circuit breaker however the attempt
+            # ends, releasing it if no request was performed.
+            failed = None
+            try:
+                self._acquire_rate_limit(country_code, deadline)
+
+                result.log(LOG_SUMMARY,
+                           u'> POST %s with payload of content type %s',
+                           self.CHECK_VAT_SERVICE_URL,
+                           self.REQUEST_CONTENT_TYPE)
+                self._log_body(result, request_data)
+
+                trace.emit('on_request_start')
+                try:
+                    response = self._post(country_code,
+                                          breaker,
+                                          result,
+                                          request_data.encode('utf-8'),
+                                          timeout)
+                except Timeout as e:
+                    failed = True
+                    result.log(LOG_SUMMARY,
+                               u'< Request to EU VIEW registry timed out: %s',
+                               e)
+                    trace.emit('on_error', error=e, reason=retry.TIMEOUT)
+                    return retry.TIMEOUT
+                except Exception as exception:
+                    failed = True
+                    # Do not completely fail problematic requests.
+                    result.log(LOG_SUMMARY,
+                               u'< Request failed with exception: %r',
+                               exception)
+                    trace.emit('on_error',
+                               error=exception,
+                               reason=retry.REQUEST_FAILED)
+                    return retry.REQUEST_FAILED
+
+                # Malformed responses count as failures.
+                failed = True
+                _process_traced(self._process_response,
+                                trace,
+                                result,
+                                response.status_code,
+                                response.headers.get('Content-Type', ''),
+                                response.content,
+                                response_tags)
+                failed = response.status_code >= 500
+                return response.status_code
+            except ServerError as e:
+                failed = e.fault_code in self.CIRCUIT_BREAKER_FAULT_CODES
+                raise
+            finally:
+                self._report_outcome(breaker, failed)
+
+        return self._check_with_retries(vat_number, country_code, attempt)
+
+    async def check_vat_number_async(self,
+                                     vat_number,
+                                     country_code,
+                                     test,
+                                     fields=None):
+        request_data = self._build_request_data(vat_number, country_code)
+        response_tags = self._get_response_tags(fields)
+
+        async def attempt(trace, result, timeout, deadline):
+            # Request information about the VAT number.
+            allowed, breaker = self._allow_request(country_code,
+                                                   trace,
+                                                   result)
+            if not allowed:
+                return None
+
+            # Report the outcome to the circuit breaker however the attempt
+            # ends, releasing it if no request was performed.
+            failed = None
+            try:
+                await self._acquire_rate_limit_async(country_code, deadline)
+
+                result.log(LOG_SUMMARY,
+                           u'> POST %s with payload of content type %s',
+                           self.CHECK_VAT_SERVICE_URL,
+                           self.REQUEST_CONTENT_TYPE)
+                self._log_body(result, request_data)
+
+                trace.emit('on_request_start')
+                try:
+                    status_code, content_type, content = \
+                        await self._post_async(country_code,
+                                               breaker,
+                                               result,
+                                               request_data.encode('utf-8'),
+                                               timeout)
+                except asyncio.TimeoutError as e:
+                    failed = True
+                    result.log(LOG_SUMMARY,
+                               u'< Request to EU VIEW registry timed out: %s',
+                               e)
+                    trace.emit('on_error', error=e, reason=retry.TIMEOUT)
+                    return retry.TIMEOUT
+                except Exception as exception:
+                    failed = True
+                    # Do not completely fail problematic requests.
+                    result.log(LOG_SUMMARY,
+                               u'< Request failed with exception: %r',
+                               exception)
+                    trace.emit('on_error',
+                               error=exception,
+                               reason=retry.REQUEST_FAILED)
+                    return retry.REQUEST_FAILED
+
+                # Malformed responses count as failures.
+                failed = True
+                _process_traced(self._process_response,
+                                trace,
+                                result,
+                                status_code,
+                                content_type,
+                                content,
+                                response_tags)
+                failed = status_code >= 500
+                return status_code
+            except ServerError as e:
+                failed = e.fault_code in self.CIRCUIT_BREAKER_FAULT_CODES
+                raise
+            finally:
+                self._report_outcome(breaker, failed)
+
+        return await self._check_with_retries_async(vat_number,
+                                                    country_code,
+                                                    attempt)
+
+    def _get_response_tags(self, fields):
+        """Get the names of the response elements to read.
+
+        :param fields:
+            Names of the business fields to retrieve or ``None`` for all.
+        :returns: a :class:`frozenset` of element names.
+        """
+
+        if fields is None:
+            fields = self.RESPONSE_FIELDS
+        return frozenset(['valid'] + [self.RESPONSE_FIELDS[field]
+                                      for field in fields])
+
+    def _build_request_data(self, vat_number, country_code):
+        """Build the SOAP envelope for checking a VAT number.
+
+        :param vat_number: VAT number without country code prefix.
+        :param country_code: ISO 3166-1-alpha-2 country code.
+        :returns: the request payload as text.
+        """
+
+        # Non-ISO code used for Greece.
+        if country_code == 'GR':
+            country_code = 'EL'
+
+        return (
+            u'<?xml version="1.0" encoding="UTF-8"?><SOAP-ENV:Envelope'
+            u' xmlns:ns0="urn:ec.europa.eu:taxud:vies:services:checkVa'
+            u't:types" xmlns:ns1="http://schemas.xmlsoap.org/soap/enve'
+            u'lope/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-insta'
+            u'nce" xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/env'
+            u'elope/"><SOAP-ENV:Header/><ns1:Body><ns0:checkVat><ns0:c'
+            u'ountryCode>%s</ns0:countryCode><ns0:vatNumber>%s</ns0:va'
+            u'tNumber></ns0:checkVat></ns1:Body></SOAP-ENV:Envelope>' %
+            (country_code, vat_number)
+        )
+
+    def _process_response(self,
+                          result,
+                          status_code,
+                          content_type,
+                          content,
+                          response_tags):
+        """Process a response from the VAT checking service.
+
+        :param result: Result to populate.
+        :type result: VatNumberCheckResult
+        :param status_code: HTTP status code of the response.
+        :param content_type: Content type of the response.
+        :param content: Response body as bytes.
+        :param response_tags: Names of the response elements to read.
+        :returns: the populated result.
+        :raises ServerError: if the response is a SOAP fault.
+        """
 
         # Log response information.
-        result.log_lines += [
-            u'< Response with status %d of content type %s:' %
-            (response.status_code, response.headers['Content-Type']),
-            response.text,
-        ]
+        result.log(LOG_SUMMARY,
+                   u'< Response with status %d of content type %s',
+                   status_code,
+                   content_type)
+        self._log_body(result, content)
 
         # Do not completely fail problematic requests.
-        if response.status_code != 200 or \
-                not response.headers['Content-Type'].startswith('text/xml'):
-            result.log_lines.append(u'< Response is nondeterministic due to '
-                                    u'invalid response status code or MIME '
-                                    u'type')
+        if status_code != 200 or not content_type.startswith('text/xml'):
+            result.log(LOG_SUMMARY,
+                       u'< Response is nondeterministic due to invalid '
+                       u'response status code or MIME type')
             return result
 
-        # Parse the DOM and validate as much as we can.
+        # Parse the body and validate as much as we can.
         #
         # We basically expect the result structure to be as follows,
-        # where the address and name nodes might be omitted.
+        # where the address and name nodes might be omitted and any
+        # namespace prefixes might be used.
         #
         # <env:Envelope
         #     xmlns:env="http://schemas.xmlsoap.org/soap/envelope/">
@@ -119,77 +1166,169 @@ class ViesRegistry(Registry):
         #         </ns2:checkVatResponse>
         #     </env:Body>
         # </env:Envelope>
-        result_dom = xml.dom.minidom.parseString(response.text.encode('utf-8'))
-
-        envelope_node = result_dom.documentElement
-        if envelope_node.tagName != 'env:Envelope':
-            raise ValueError(
-                'expected response XML root element to be a SOAP envelope'
-            )
-
-        body_node = get_first_child_element(envelope_node, 'env:Body')
+        fault_string, values = parse_soap_response(
+            content,
+            'checkVatResponse',
+            response_tags
+        )
 
         # Check for server errors
-        try:
-            error_node = get_first_child_element(body_node, 'env:Fault')
-            fault_strings = error_node.getElementsByTagName('faultstring')
-            fault_code = fault_strings[0].firstChild.nodeValue
-            raise ServerError(fault_code)
-        except NodeNotFoundError:
-            pass
+        if fault_string is not None:
+            raise ServerError(fault_string)
 
-        try:
-            check_vat_response_node = get_first_child_element(
-                body_node,
-                'ns2:checkVatResponse'
-            )
-            valid_node = get_first_child_element(
-                check_vat_response_node,
-                'ns2:valid'
-            )
-        except Exception as e:
-            result.log_lines.append(u'< Response is nondeterministic due to '
-                                    u'invalid response body: %r' % (e))
+        if values is None:
+            result.log(LOG_SUMMARY,
+                       u'< Response is nondeterministic due to invalid '
+                       u'response body: no checkVatResponse element was '
+                       u'found')
+            return result
+        if 'valid' not in values:
+            result.log(LOG_SUMMARY,
+                       u'< Response is nondeterministic due to invalid '
+                       u'response body: no valid element was found')
             return result
 
         # Parse the validity of the business.
-        valid_text = get_text(valid_node)
+        valid_text = values['valid']
 
         if valid_text in frozenset(('true', 'false')):
             result.is_valid = valid_text == 'true'
         else:
-            result.log_lines.append(u'< Response is nondeterministic due to '
-                                    u'invalid validity field: %r' %
-                                    (valid_text))
+            result.log(LOG_SUMMARY,
+                       u'< Response is nondeterministic due to invalid '
+                       u'validity field: %r',
+                       valid_text)
 
-        # Parse the business name and address if possible.
-        try:
-            name_node = get_first_child_element(
-                check_vat_response_node,
-                'ns2:name'
-            )
-            result.business_name = get_text(name_node).strip() or None
-        except Exception:
-            pass
+        # Parse the business fields asked for if possible.
+        for field, tag in self.RESPONSE_FIELDS.items():
+            if tag in values:
+                setattr(result, field, values[tag].strip() or None)
 
+        return result
+
+
+class ViesRestRegistry(ViesRegistry):
+    """VIES REST registry.
+
+    Uses the JSON interface of the European Commision's VIES registry for
+    validating VAT numbers. Behaves identically to :class:`ViesRegistry`,
+    with error codes reported by the interface raised as faults.
+    """
+
+    NAME = 'vies-rest'
+    """Default name of the registry."""
+
+    CHECK_VAT_SERVICE_URL = 'https://ec.europa.eu/taxation_customs/vies/' \
+                            'rest-api/check-vat-number'
+    """URL for the VAT checking service.
+    """
+
+    REQUEST_CONTENT_TYPE = 'application/json'
+    """Content type of the request payload.
+    """
+
+    VALIDITY_USER_ERRORS = frozenset(('VALID', 'INVALID'))
+    """User error values not indicating a fault.
+    """
+
+    def _build_request_data(self, vat_number, country_code):
+        # Non-ISO code used for Greece.
+        if country_code == 'GR':
+            country_code = 'EL'
+
+        return json.dumps({
+            'countryCode': country_code,
+            'vatNumber': vat_number,
+        })
+
+    def _process_response(self,
+                          result,
+                          status_code,
+                          content_type,
+                          content,
+                          response_tags):
+        # Log response information.
+        result.log(LOG_SUMMARY,
+                   u'< Response with status %d of content type %s',
+                   status_code,
+                   content_type)
+        self._log_body(result, content)
+
+        if not content_type.startswith('application/json'):
+            result.log(LOG_SUMMARY,
+                       u'< Response is nondeterministic due to invalid '
+                       u'response status code or MIME type')
+            return result
+
+        # Parse the body and validate as much as we can.
+        #
+        # We basically expect the result structure to be as follows,
+        # where the address and name fields might be omitted.
+        #
+        # {
+        #     "countryCode": "DE",
+        #     "vatNumber": "812383453",
+        #     "requestDate": "2022-08-12T10:21:45.482Z",
+        #     "valid": true,
+        #     "name": "---",
+        #     "address": "---",
+        #     "userError": "VALID"
+        # }
+        #
+        # Errors are reported as follows, usually along with an error
+        # status code.
+        #
+        # {
+        #     "actionSucceed": false,
+        #     "errorWrappers": [{"error": "MS_UNAVAILABLE"}]
+        # }
         try:
-            address_node = get_first_child_element(
-                check_vat_response_node,
-                'ns2:address'
-            )
-            result.business_address = get_text(address_node).strip() or None
-        except Exception:
-            pass
-        
-        # Parse the country code if possible.
-        try:
-            country_code_node = get_first_child_element(
-                check_vat_response_node,
-                'ns2:countryCode'
-            )
-            result.business_country_code = get_text(country_code_node).strip() or None
-        except Exception:
-            pass
+            values = json.loads(content.decode('utf-8'))
+        except ValueError:
+            # Only error responses may have other bodies.
+            if status_code == 200:
+                raise
+            values = {}
+        if not isinstance(values, dict):
+            raise ValueError('expected response JSON to be an object')
+
+        # Check for server errors
+        error_wrappers = values.get('errorWrappers')
+        if error_wrappers:
+            raise ServerError(error_wrappers[0].get('error'))
+        user_error = values.get('userError')
+        if user_error and user_error not in self.VALIDITY_USER_ERRORS:
+            raise ServerError(user_error)
+
+        # Do not completely fail problematic requests.
+        if status_code != 200:
+            result.log(LOG_SUMMARY,
+                       u'< Response is nondeterministic due to invalid '
+                       u'response status code or MIME type')
+            return result
+
+        if 'valid' not in values:
+            result.log(LOG_SUMMARY,
+                       u'< Response is nondeterministic due to invalid '
+                       u'response body: no valid field was found')
+            return result
+
+        # Parse the validity of the business.
+        valid = values['valid']
+
+        if isinstance(valid, bool):
+            result.is_valid = valid
+        else:
+            result.log(LOG_SUMMARY,
+                       u'< Response is nondeterministic due to invalid '
+                       u'validity field: %r',
+                       valid)
+
+        # Parse the business fields asked for if possible.
+        for field, key in self.RESPONSE_FIELDS.items():
+            value = values.get(key)
+            if key in response_tags and isinstance(value, str):
+                setattr(result, field, value.strip() or None)
 
         return result
 
@@ -197,9 +1336,15 @@ class ViesRegistry(Registry):
 class HMRCRegistry(Registry):
     """HMRC registry.
 
-    Uses the HMRC API for validating VAT numbers.
+    Uses the HMRC API for validating VAT numbers. Without a token manager,
+    the unauthenticated version 1.0 of the API is used. With a token manager,
+    checks use version 2.0 of the API, authenticated by access tokens
+    obtained through the OAuth 2.0 client credentials grant.
     """
 
+    NAME = 'hmrc'
+    """Default name of the registry."""
+
     CHECK_VAT_SERVICE_URL = 'https://api.service.hmrc.gov.uk/organisations/' \
                             'vat/check-vat-number/lookup/'
     CHECK_VAT_SERVICE_TEST_URL = 'https://test-api.service.hmrc.gov.uk/organisations/' \
@@ -207,44 +1352,283 @@ class HMRCRegistry(Registry):
     """URL for the VAT checking service.
     """
 
-    DEFAULT_TIMEOUT = 8
-    """Timeout for the requests."""
+    TOKEN_URL = 'https://api.service.hmrc.gov.uk/oauth/token'
+    TOKEN_TEST_URL = 'https://test-api.service.hmrc.gov.uk/oauth/token'
+    """URL for obtaining access tokens.
+    """
 
-    def check_vat_number(self, vat_number, country_code, test):
-        # Request information about the VAT number.
-        result = VatNumberCheckResult()
-        result.is_valid = False
-        try:
-            url = self.CHECK_VAT_SERVICE_URL
-            if test:
-                url = self.CHECK_VAT_SERVICE_TEST_URL
-            response = requests.get(
-                url + vat_number,
-                timeout=self.DEFAULT_TIMEOUT
-            )
-        except Timeout as e:
-            result.log_lines.append(u'< Request to HMRC registry timed out:'
-                                    u' {}'.format(e))
-            return result
-        except Exception as exception:
-            # Do not completely fail problematic requests.
-            result.log_lines.append(u'< Request failed with exception: %r' %
-                                    (exception))
-            return result
+    API_VERSION_2_CONTENT_TYPE = 'application/vnd.hmrc.2.0+json'
+    """Accepted content type selecting version 2.0 of the API.
+    """
+
+    DEFAULT_BATCH_CONCURRENCY = 8
+    """Maximum number of concurrent checks in batches."""
+
+    def __init__(self, token_manager=None, test_token_manager=None, **kwargs):
+        """Initialize an HMRC registry.
+
+        :param token_manager:
+            Optional :class:`~pyvat.oauth.ClientCredentialsTokenManager`
+            obtaining access tokens from :attr:`TOKEN_URL`, enabling version
+            2.0 of the API. Default ``None``.
+        :param test_token_manager:
+            Optional token manager obtaining access tokens from
+            :attr:`TOKEN_TEST_URL` for test checks. Default ``None``.
+        """
+
+        super(HMRCRegistry, self).__init__(**kwargs)
+        self.token_manager = token_manager
+        self.test_token_manager = test_token_manager
+
+    def get_warm_up_urls(self):
+        return (self.CHECK_VAT_SERVICE_URL, )
+
+    def _get_headers(self, token):
+        """Get the headers of a lookup request.
+
+        :param token: Access token or ``None`` for the unauthenticated API.
+        :returns: a :class:`dict` of headers.
+        """
+
+        if token is None:
+            return {}
+        return {
+            'Accept': self.API_VERSION_2_CONTENT_TYPE,
+            'Authorization': 'Bearer %s' % (token),
+        }
+
+    def _handle_token_error(self, trace, result, exception):
+        """Log the failure to obtain an access token.
+
+        :returns: the attempt outcome.
+        """
+
+        result.log(LOG_SUMMARY,
+                   u'< Unable to obtain access token: %s',
+                   exception)
+        trace.emit('on_error',
+                   error=exception,
+                   reason=u'access token unavailable')
+        return retry.REQUEST_FAILED
+
+    def _is_token_rejected(self,
+                           token_manager,
+                           token,
+                           trace,
+                           result,
+                           status_code,
+                           token_attempt):
+        """Test if a request should be repeated with a new access token.
+
+        Rejected access tokens are invalidated, so that the next token is
+        obtained anew.
+
+        :param token_manager: Token manager or ``None``.
+        :param token: Access token of the request or ``None``.
+        :param trace: Trace of the attempt.
+        :param result: Result to log a rejected token to.
+        :param status_code: HTTP status code of the response.
+        :param token_attempt:
+            Number of previous requests of the attempt with rejected tokens.
+        :returns: whether the request should be repeated.
+        """
+
+        if status_code != 401 or token is None:
+            return False
+
+        token_manager.invalidate(token)
+        if token_attempt > 0:
+            return False
+
+        result.log(LOG_SUMMARY,
+                   u'< Access token rejected, retrying with a new token')
+        trace.emit('on_error',
+                   status_code=status_code,
+                   reason=u'access token rejected')
+        return True
+
+    def check_vat_number(self, vat_number, country_code, test, fields=None):
+        url = self._get_url(vat_number, test)
+        token_manager = self.test_token_manager if test \
+            else self.token_manager
+
+        def attempt(trace, result, timeout, deadline):
+            self._acquire_rate_limit(country_code, deadline)
+
+            # Retry once with a new access token if the token is rejected.
+            for token_attempt in range(2):
+                token = None
+                if token_manager is not None:
+                    try:
+                        token = token_manager.get_token()
+                    except TokenError as exception:
+                        return self._handle_token_error(trace,
+                                                        result,
+                                                        exception)
+
+                # Request information about the VAT number.
+                trace.emit('on_request_start')
+                try:
+                    response = self.session.get(
+                        url,
+                        headers=self._get_headers(token),
+                        timeout=timeout
+                    )
+                except Timeout as e:
+                    result.log(LOG_SUMMARY,
+                               u'< Request to HMRC registry timed out: %s',
+                               e)
+                    trace.emit('on_error', error=e, reason=retry.TIMEOUT)
+                    return retry.TIMEOUT
+                except Exception as exception:
+                    # Do not completely fail problematic requests.
+                    result.log(LOG_SUMMARY,
+                               u'< Request failed with exception: %r',
+                               exception)
+                    trace.emit('on_error',
+                               error=exception,
+                               reason=retry.REQUEST_FAILED)
+                    return retry.REQUEST_FAILED
+
+                if not self._is_token_rejected(token_manager,
+                                               token,
+                                               trace,
+                                               result,
+                                               response.status_code,
+                                               token_attempt):
+                    break
+
+            _process_traced(self._process_response,
+                            trace,
+                            result,
+                            response.status_code,
+                            response.headers['Content-Type'],
+                            response.text,
+                            fields)
+            return response.status_code
+
+        return self._check_with_retries(vat_number, country_code, attempt)
+
+    async def check_vat_number_async(self,
+                                     vat_number,
+                                     country_code,
+                                     test,
+                                     fields=None):
+        url = self._get_url(vat_number, test)
+        token_manager = self.test_token_manager if test \
+            else self.token_manager
+
+        async def attempt(trace, result, timeout, deadline):
+            await self._acquire_rate_limit_async(country_code, deadline)
+
+            # Retry once with a new access token if the token is rejected.
+            for token_attempt in range(2):
+                token = None
+                if token_manager is not None:
+                    try:
+                        token = await token_manager.get_token_async()
+                    except TokenError as exception:
+                        return self._handle_token_error(trace,
+                                                        result,
+                                                        exception)
+
+                # Request information about the VAT number.
+                trace.emit('on_request_start')
+                try:
+                    status_code, content_type, content = await aio.request(
+                        'GET',
+                        url,
+                        timeout[0],
+                        timeout[1],
+                        headers=self._get_headers(token)
+                    )
+                except asyncio.TimeoutError as e:
+                    result.log(LOG_SUMMARY,
+                               u'< Request to HMRC registry timed out: %s',
+                               e)
+                    trace.emit('on_error', error=e, reason=retry.TIMEOUT)
+                    return retry.TIMEOUT
+                except Exception as exception:
+                    # Do not completely fail problematic requests.
+                    result.log(LOG_SUMMARY,
+                               u'< Request failed with exception: %r',
+                               exception)
+                    trace.emit('on_error',
+                               error=exception,
+                               reason=retry.REQUEST_FAILED)
+                    return retry.REQUEST_FAILED
+
+                if not self._is_token_rejected(token_manager,
+                                               token,
+                                               trace,
+                                               result,
+                                               status_code,
+                                               token_attempt):
+                    break
+
+            _process_traced(self._process_response,
+                            trace,
+                            result,
+                            status_code,
+                            content_type,
+                            content.decode('utf-8'),
+                            fields)
+            return status_code
+
+        return await self._check_with_retries_async(vat_number,
+                                                    country_code,
+                                                    attempt)
+
+    def _get_url(self, vat_number, test):
+        """Get the lookup URL for a VAT number.
+
+        :param vat_number: VAT number without country code prefix.
+        :param test: Boolean to identify if test or not.
+        :returns: the lookup URL.
+        """
+
+        url = self.CHECK_VAT_SERVICE_URL
+        if test:
+            url = self.CHECK_VAT_SERVICE_TEST_URL
+        return url + vat_number
+
+    def _process_response(self,
+                          result,
+                          status_code,
+                          content_type,
+                          text,
+                          fields):
+        """Process a response from the VAT checking service.
+
+        :param result: Result to populate.
+        :type result: VatNumberCheckResult
+        :param status_code: HTTP status code of the response.
+        :param content_type: Content type of the response.
+        :param text: Decoded response body.
+        :param fields:
+            Names of the business fields to retrieve or ``None`` for all.
+        :returns: the populated result.
+        """
 
         # Log response information.
-        result.log_lines += [
-            u'< Response with status %d of content type %s:' %
-            (response.status_code, response.headers['Content-Type']),
-            response.text,
-        ]
+        result.log(LOG_SUMMARY,
+                   u'< Response with status %d of content type %s',
+                   status_code,
+                   content_type)
+        self._log_body(result, text)
+
+        # Only VAT numbers not found are invalid, other errors such as
+        # throttling or server errors leave the result nondeterministic.
+        if status_code == 404:
+            result.is_valid = False
+            return result
 
         # Do not completely fail problematic requests.
-        if response.status_code != 200 or \
-                not response.headers['Content-Type'].startswith('application/json'):
-            result.log_lines.append(u'< Response is nondeterministic due to '
-                                    u'invalid response status code or MIME '
-                                    u'type')
+        if status_code != 200 or \
+                not content_type.startswith('application/json'):
+            result.log(LOG_SUMMARY,
+                       u'< Response is nondeterministic due to invalid '
+                       u'response status code or MIME type')
             return result
 
         # Parse the DOM and validate as much as we can.
@@ -265,16 +1649,18 @@ class HMRCRegistry(Registry):
         #     "processingDate": "2022-09-29T12:08:48+01:00"
         # }
 
-        json_response = response.json()
+        json_response = json.loads(text)
         target = json_response.get('target', None)
+        result.is_valid = bool(target)
         if target:
-            result.is_valid = True
-            result.business_name = target.get('name', None)
-            address = target.get('address', {})
-            if address:
-                business_address = ', '.join(list(address.values()))
-                result.business_address = business_address
+            if fields is None or 'business_name' in fields:
+                result.business_name = target.get('name', None)
+            if fields is None or 'business_address' in fields:
+                address = target.get('address', {})
+                if address:
+                    business_address = ', '.join(list(address.values()))
+                    result.business_address = business_address
         return result
 
 
-__all__ = ('Registry', 'ViesRegistry', 'HMRCRegistry', )
+__all__ = ('Registry', 'ViesRegistry', 'ViesRestRegistry', 'HMRCRegistry', )
@@ -1,14 +1,48 @@
+BUSINESS_FIELDS = frozenset((
+    'business_name',
+    'business_address',
+    'business_country_code',
+))
+"""Names of the business information fields of check results.
+
+Registry checks can be limited to a subset of these fields, in which case
+the other fields are neither parsed nor stored.
+"""
+
+
+LOG_OFF = 0
+"""Log level recording no log lines."""
+
+LOG_SUMMARY = 1
+"""Log level recording a line per request, response, retry and outcome."""
+
+LOG_FULL = 2
+"""Log level additionally recording request and response bodies."""
+
+LOG_LINES_OMITTED = u'... further log lines omitted'
+"""Log line marking that the maximum number of log lines was reached."""
+
+
 class VatNumberCheckResult(object):
     """Result of a VAT number validation check.
 
+    Log lines recorded through :meth:`log` are only formatted once
+    :attr:`log_lines` is accessed.
+
     :ivar is_valid:
         Boolean value indicating if the checked VAT number was deemed to be
         valid. ``True`` if the VAT number is valid or ``False`` if the VAT
         number is positively invalid.
-    :ivar log_lines:
-        Check log lines.
     :ivar business_name: Optional business name retrieved for the VAT number.
     :ivar business_address: Optional address retrieved for the VAT number.
+    :ivar business_country_code:
+        Optional country code retrieved for the VAT number.
+    :ivar log_level:
+        Level up to which log lines are recorded through :meth:`log`, one of
+        :data:`LOG_OFF`, :data:`LOG_SUMMARY` and :data:`LOG_FULL`.
+    :ivar max_log_lines:
+        Optional maximum number of log lines recorded through :meth:`log`,
+        after which a single :data:`LOG_LINES_OMITTED` line is recorded.
     """
 
     def __init__(self,
@@ -16,9 +50,95 @@ class VatNumberCheckResult(object):
                  log_lines=None,
                  business_name=None,
                  business_address=None,
-                 business_country_code=None):
+                 business_country_code=None,
+                 log_level=LOG_FULL,
+                 max_log_lines=None):
         self.is_valid = is_valid
-        self.log_lines = log_lines or []
+        self._log_entries = log_lines if log_lines is not None else []
         self.business_name = business_name
         self.business_address = business_address
-        self.business_country_code = business_country_code
\ No newline at end of file
+        self.business_country_code = business_country_code
+        self.log_level = log_level
+        self.max_log_lines = max_log_lines
+
+    @property
+    def log_lines(self):
+        """Check log lines.
+        """
+
+        entries = self._log_entries
+        for index, entry in enumerate(entries):
+            if isinstance(entry, tuple):
+                message, args = entry
+                entries[index] = message % tuple(
+                    arg.decode('utf-8', 'replace')
+                    if isinstance(arg, bytes) else arg
+                    for arg in args
+                )
+        return entries
+
+    @log_lines.setter
+    def log_lines(self, log_lines):
+        self._log_entries = log_lines
+
+    def log(self, level, message, *args):
+        """Record a log line if the log level allows.
+
+        The line is formatted when the log lines are first accessed rather
+        than when recorded, so arguments should not be mutated afterwards.
+
+        :param level: Level of the line, :data:`LOG_SUMMARY` or
+            :data:`LOG_FULL`.
+        :param message:
+            Log line text, formatted with the arguments using ``%`` if any.
+        :param args: Formatting arguments. :class:`bytes` arguments are
+            decoded as UTF-8.
+        """
+
+        if level > self.log_level:
+            return
+
+        entries = self._log_entries
+        if self.max_log_lines is not None and \
+                len(entries) >= self.max_log_lines:
+            if len(entries) == self.max_log_lines:
+                entries.append(LOG_LINES_OMITTED)
+            return
+
+        entries.append((message, args) if args else message)
+
+    def clear(self):
+        """Clear the validity and business fields, keeping the log lines.
+        """
+
+        self.is_valid = None
+        for field in BUSINESS_FIELDS:
+            setattr(self, field, None)
+
+    def copy(self):
+        """Create a copy of the result.
+
+        :returns: a new :class:`VatNumberCheckResult` with its own log lines.
+        """
+
+        return VatNumberCheckResult(self.is_valid,
+                                    list(self._log_entries),
+                                    self.business_name,
+                                    self.business_address,
+                                    self.business_country_code,
+                                    self.log_level,
+                                    self.max_log_lines)
+
+    def project(self, fields):
+        """Create a copy of the result limited to a set of business fields.
+
+        :param fields:
+            Names of the business fields to keep from
+            :data:`BUSINESS_FIELDS`.
+        :returns: a new :class:`VatNumberCheckResult`.
+        """
+
+        result = self.copy()
+        for field in BUSINESS_FIELDS.difference(fields):
+            setattr(result, field, None)
+        return result
@@ -0,0 +1,136 @@
+import random
+import time
+
+from .exceptions import ServerError
+
+
+TIMEOUT = 'timeout'
+"""Attempt outcome of a request timing out."""
+
+REQUEST_FAILED = 'request failed'
+"""Attempt outcome of a request failing without a response."""
+
+
+class RetryPolicy(object):
+    """Retry policy for registry checks.
+
+    Attempts failing with a retryable outcome are retried after a jittered,
+    exponentially growing delay until either the maximum number of attempts
+    is reached or the next attempt would start after the deadline.
+
+    An attempt outcome is either a :class:`~pyvat.exceptions.ServerError`,
+    the HTTP status code of the response, :data:`TIMEOUT` or
+    :data:`REQUEST_FAILED`.
+
+    :ivar max_attempts: Maximum number of attempts, including the first.
+    :ivar base_delay: Delay in seconds before the first retry.
+    :ivar max_delay: Maximum delay in seconds between attempts.
+    :ivar jitter:
+        Whether delays should be drawn uniformly between ``0`` and the
+        exponential delay rather than be the exponential delay.
+    :ivar deadline:
+        Optional number of seconds all attempts of a check must complete
+        within. Attempt timeouts are shortened to honor the deadline.
+    :ivar retryable_fault_codes: Retryable fault codes.
+    :ivar retryable_status_codes: Retryable HTTP status codes.
+    :ivar retry_request_failures:
+        Whether timed out and failed requests are retryable.
+    """
+
+    DEFAULT_RETRYABLE_FAULT_CODES = frozenset((
+        'SERVICE_UNAVAILABLE',
+        'MS_MAX_CONCURRENT_REQ',
+        'GLOBAL_MAX_CONCURRENT_REQ',
+    ))
+    """Fault codes retried by default."""
+
+    DEFAULT_RETRYABLE_STATUS_CODES = frozenset((429, 500, 502, 503, 504))
+    """HTTP status codes retried by default."""
+
+    def __init__(self,
+                 max_attempts=3,
+                 base_delay=0.25,
+                 max_delay=4,
+                 jitter=True,
+                 deadline=None,
+                 retryable_fault_codes=None,
+                 retryable_status_codes=None,
+                 retry_request_failures=True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retryable_fault_codes = frozenset(
+            self.DEFAULT_RETRYABLE_FAULT_CODES
+            if retryable_fault_codes is None else retryable_fault_codes
+        )
+        self.retryable_status_codes = frozenset(
+            self.DEFAULT_RETRYABLE_STATUS_CODES
+            if retryable_status_codes is None else retryable_status_codes
+        )
+        self.retry_request_failures = retry_request_failures
+
+    def is_retryable(self, outcome):
+        """Test if an attempt outcome is retryable.
+
+        :param outcome: Attempt outcome.
+        :returns: ``True`` if the outcome is retryable.
+        """
+
+        if isinstance(outcome, ServerError):
+            return outcome.fault_code in self.retryable_fault_codes
+        if outcome in (TIMEOUT, REQUEST_FAILED):
+            return self.retry_request_failures
+        return outcome in self.retryable_status_codes
+
+    def get_deadline(self):
+        """Get the deadline of a check starting now.
+
+        :returns:
+            the deadline as a :func:`time.monotonic` timestamp or ``None``.
+        """
+
+        if self.deadline is None:
+            return None
+        return time.monotonic() + self.deadline
+
+    def get_delay(self, attempt, outcome, deadline):
+        """Get the delay before retrying an attempt.
+
+        :param attempt: Number of the completed attempt, starting at ``1``.
+        :param outcome: Outcome of the completed attempt.
+        :param deadline:
+            Deadline as returned by :meth:`get_deadline`.
+        :returns:
+            the delay in seconds or ``None`` if the attempt should not be
+            retried.
+        """
+
+        if attempt >= self.max_attempts or not self.is_retryable(outcome):
+            return None
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+
+def describe_outcome(outcome):
+    """Describe an attempt outcome for logging.
+
+    :param outcome: Attempt outcome.
+    :returns: the description as text.
+    """
+
+    if isinstance(outcome, ServerError):
+        return u'fault %s' % (outcome.fault_code)
+    if isinstance(outcome, int):
+        return u'status %d' % (outcome)
+    return outcome
+
+
+__all__ = ('RetryPolicy', 'TIMEOUT', 'REQUEST_FAILED', )
@@ -0,0 +1,68 @@
+import threading
+
+
+class _Call(object):
+    """In-flight call.
+    """
+
+    __slots__ = ('event', 'result', 'exception')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight(object):
+    """Coalesces concurrent calls sharing a key into a single call.
+
+    While a call for a key is in flight, further calls for the same key from
+    other threads wait for it to complete and share its result or exception
+    instead of performing the call themselves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    def do(self, key, function, *args, **kwargs):
+        """Call a function unless a call for the same key is in flight.
+
+        :param key: Hashable key identifying the call.
+        :param function: Function to call.
+        :returns:
+            a :class:`tuple` of the result of the call and whether the result
+            was shared from a call performed by another thread.
+        :raises Exception:
+            the exception raised by the call, if any.
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result, True
+
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as exception:
+            call.exception = exception
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.result, False
+
+
+__all__ = ('SingleFlight', )
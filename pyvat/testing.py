@@ -0,0 +1,699 @@
+import argparse
+import collections
+import json
+import math
+import random
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from xml.sax.saxutils import escape
+
+import requests
+
+from .registries import HMRCRegistry, ViesRegistry, ViesRestRegistry
+
+
+VIES = 'vies'
+"""Service name of the VIES SOAP interface."""
+
+VIES_REST = 'vies-rest'
+"""Service name of the VIES JSON interface."""
+
+VIES_STATUS = 'vies-status'
+"""Service name of the VIES member state availability interface."""
+
+HMRC = 'hmrc'
+"""Service name of the HMRC lookup interface."""
+
+TOKEN = 'token'
+"""Service name of the HMRC token interface."""
+
+HEAD = 'head'
+"""Service name counting ``HEAD`` requests, such as connection warm ups."""
+
+
+def constant_latency(seconds):
+    """Latency distribution of a constant latency.
+
+    :param seconds: Latency in seconds.
+    :returns: a function drawing a latency using a :class:`random.Random`.
+    """
+
+    return lambda random: seconds
+
+
+def uniform_latency(low, high):
+    """Latency distribution of uniformly distributed latencies.
+
+    :param low: Minimum latency in seconds.
+    :param high: Maximum latency in seconds.
+    :returns: a function drawing a latency using a :class:`random.Random`.
+    """
+
+    return lambda random: random.uniform(low, high)
+
+
+def lognormal_latency(median, sigma=0.5):
+    """Latency distribution of log-normally distributed latencies.
+
+    Log-normal distributions have the long tail typically observed for
+    registry response times.
+
+    :param median: Median latency in seconds.
+    :param sigma: Standard deviation of the latency's natural logarithm.
+    :returns: a function drawing a latency using a :class:`random.Random`.
+    """
+
+    mu = math.log(median)
+    return lambda random: random.lognormvariate(mu, sigma)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _StandInRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # Headers and body are written separately, which would otherwise delay
+    # responses on keep-alive connections.
+    disable_nagle_algorithm = True
+
+    def send_body(self, status_code, content_type, body):
+        body = body.encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.server.stand_in.count(HEAD)
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.send_body(*self.server.stand_in.respond('GET',
+                                                     self.path,
+                                                     self.headers,
+                                                     None))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_body(*self.server.stand_in.respond('POST',
+                                                     self.path,
+                                                     self.headers,
+                                                     body))
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(object):
+    """Local stand-in for the VIES and HMRC registries.
+
+    Serves the VIES SOAP and JSON interfaces, the VIES member state
+    availability interface, and the HMRC lookup and token interfaces over
+    HTTP on a local port, so registries can be tested and load tested
+    without reaching the real registries. Registries are pointed at the
+    server by :meth:`configure`.
+
+    Responses for a VAT number, including its country code prefix, are
+    given as one of:
+
+    - ``True`` for a valid VAT number with placeholder business information.
+    - A :class:`dict` with ``name`` and ``address`` keys for a valid VAT
+      number with the given business information. HMRC addresses can be
+      given as a :class:`dict` of address lines.
+    - ``False`` for an invalid VAT number.
+    - A fault code such as ``MS_UNAVAILABLE`` or ``MS_MAX_CONCURRENT_REQ``.
+    - An HTTP status code such as ``429`` or ``503``.
+    - A :class:`list` of the above, served in turn for consecutive requests
+      with the last one repeated.
+
+    The response to a request is looked up from the responses set by
+    :meth:`set_response`, followed by recorded responses, followed by faults
+    injected at random according to the fault rates. Failing that, the
+    request is forwarded to the real registry in record mode, recording the
+    response, or the default response is served.
+
+    :ivar latency:
+        Optional latency distribution, such as :func:`lognormal_latency`,
+        from which the latency added to each check is drawn.
+    :ivar fault_rates:
+        Mapping from responses, usually fault codes or HTTP status codes, to
+        the probability of serving them instead of the regular response.
+    :ivar default_response: Response for VAT numbers without one.
+    :ivar record:
+        Whether requests without a recorded response are forwarded to the
+        real registries, recording their responses.
+    :ivar upstream_urls:
+        Mapping from service names to the URLs requests are forwarded to in
+        record mode.
+    :ivar recordings:
+        Mapping from ``<service>:<VAT number>`` keys to recorded responses as
+        :class:`list` instances of the status code, content type and body.
+    :ivar unavailable_countries:
+        Country codes reported as unavailable by the member state
+        availability interface, using ``EL`` for Greece.
+    :ivar request_counts:
+        :class:`collections.Counter` of the requests received by service
+        name.
+    :ivar tokens: Access tokens issued and still accepted.
+    :ivar token_delay: Seconds each token request takes.
+    :ivar token_status:
+        HTTP status code of token responses. Anything but ``200`` fails.
+    :ivar token_expires_in: Lifetime of issued tokens in seconds.
+    """
+
+    VIES_PATH = '/vies/services/checkVatService'
+    """Path of the VIES SOAP interface."""
+
+    VIES_REST_PATH = '/vies/rest-api/check-vat-number'
+    """Path of the VIES JSON interface."""
+
+    VIES_STATUS_PATH = '/vies/rest-api/check-status'
+    """Path of the VIES member state availability interface."""
+
+    HMRC_PATH = '/hmrc/organisations/vat/check-vat-number/lookup/'
+    """Path prefix of the HMRC lookup interface."""
+
+    TOKEN_PATH = '/hmrc/oauth/token'
+    """Path of the HMRC token interface."""
+
+    VIES_COUNTRY_CODES = (
+        'AT', 'BE', 'BG', 'CY', 'CZ', 'DE', 'DK', 'EE', 'EL', 'ES', 'FI',
+        'FR', 'HR', 'HU', 'IE', 'IT', 'LT', 'LU', 'LV', 'MT', 'NL', 'PL',
+        'PT', 'RO', 'SE', 'SI', 'SK', 'XI',
+    )
+    """Country codes reported by the member state availability interface."""
+
+    def __init__(self,
+                 host='127.0.0.1',
+                 port=0,
+                 latency=None,
+                 fault_rates=None,
+                 default_response=True,
+                 record=False,
+                 upstream_urls=None,
+                 seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.fault_rates = dict(fault_rates or {})
+        self.default_response = default_response
+        self.record = record
+        self.upstream_urls = {
+            VIES: ViesRegistry.CHECK_VAT_SERVICE_URL,
+            VIES_REST: ViesRestRegistry.CHECK_VAT_SERVICE_URL,
+            HMRC: HMRCRegistry.CHECK_VAT_SERVICE_URL,
+        }
+        self.upstream_urls.update(upstream_urls or {})
+        self.recordings = {}
+        self.unavailable_countries = set()
+        self.request_counts = collections.Counter()
+        self.tokens = set()
+        self.token_delay = 0
+        self.token_status = 200
+        self.token_expires_in = 14400
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def url(self):
+        """Base URL of the running server.
+        """
+
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    @property
+    def token_url(self):
+        """URL of the HMRC token interface of the running server.
+        """
+
+        return self.url + self.TOKEN_PATH
+
+    def start(self):
+        """Start serving in a background thread.
+
+        :returns: the server.
+        """
+
+        self._server = _ThreadingHTTPServer((self.host, self.port),
+                                            _StandInRequestHandler)
+        self._server.stand_in = self
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  args=(0.05, ),
+                                  name='pyvat-stand-in-server')
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving.
+        """
+
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def configure(self, registry):
+        """Point a registry at the running server.
+
+        :param registry:
+            :class:`~pyvat.registries.ViesRegistry`,
+            :class:`~pyvat.registries.ViesRestRegistry` or
+            :class:`~pyvat.registries.HMRCRegistry` instance.
+        :returns: the registry.
+        """
+
+        if isinstance(registry, ViesRestRegistry):
+            registry.CHECK_VAT_SERVICE_URL = self.url + self.VIES_REST_PATH
+        elif isinstance(registry, ViesRegistry):
+            registry.CHECK_VAT_SERVICE_URL = self.url + self.VIES_PATH
+        elif isinstance(registry, HMRCRegistry):
+            registry.CHECK_VAT_SERVICE_URL = self.url + self.HMRC_PATH
+            registry.CHECK_VAT_SERVICE_TEST_URL = self.url + self.HMRC_PATH
+        else:
+            raise TypeError('cannot configure registry of type %s' %
+                            (type(registry).__name__))
+
+        if isinstance(registry, ViesRegistry):
+            registry.CHECK_STATUS_SERVICE_URL = \
+                self.url + self.VIES_STATUS_PATH
+        return registry
+
+    def set_response(self, vat_number, response):
+        """Set the response for a VAT number.
+
+        :param vat_number:
+            VAT number including its country code prefix, using ``EL`` for
+            Greece.
+        :param response: Response as described above.
+        """
+
+        with self._lock:
+            self._responses[vat_number] = \
+                list(response) if isinstance(response, list) else [response]
+
+    def load_recordings(self, path):
+        """Load recorded responses from a JSON file.
+
+        :param path: Path of the file.
+        """
+
+        with open(path) as f:
+            recordings = json.load(f)
+        with self._lock:
+            self.recordings.update(
+                (key, [recording['status'],
+                       recording['content_type'],
+                       recording['body']])
+                for key, recording in recordings.items()
+            )
+
+    def save_recordings(self, path):
+        """Save recorded responses to a JSON file.
+
+        :param path: Path of the file.
+        """
+
+        with self._lock:
+            recordings = dict(
+                (key, {
+                    'status': status,
+                    'content_type': content_type,
+                    'body': body,
+                })
+                for key, (status, content_type, body)
+                in self.recordings.items()
+            )
+        with open(path, 'w') as f:
+            json.dump(recordings, f, indent=2, sort_keys=True)
+
+    def count(self, service):
+        """Count a request to a service.
+
+        :param service: Service name.
+        """
+
+        with self._lock:
+            self.request_counts[service] += 1
+
+    def respond(self, method, path, headers, body):
+        """Respond to a request.
+
+        :param method: HTTP method.
+        :param path: Request path.
+        :param headers: Mapping of request headers.
+        :param body: Request body as bytes or ``None``.
+        :returns:
+            a :class:`tuple` of the status code, content type and body of the
+            response.
+        """
+
+        path = path.split('?')[0]
+
+        if method == 'POST' and path == self.TOKEN_PATH:
+            return self._respond_token()
+        elif method == 'GET' and path == self.VIES_STATUS_PATH:
+            self.count(VIES_STATUS)
+            return self._respond_status()
+        elif method == 'POST' and path == self.VIES_PATH:
+            service = VIES
+            country_code, vat_number = self._parse_vies_request(body)
+        elif method == 'POST' and path == self.VIES_REST_PATH:
+            service = VIES_REST
+            request = json.loads(body.decode('utf-8'))
+            country_code = request['countryCode']
+            vat_number = request['vatNumber']
+        elif method == 'GET' and path.startswith(self.HMRC_PATH):
+            service = HMRC
+            country_code = 'GB'
+            vat_number = path[len(self.HMRC_PATH):]
+        else:
+            return 404, 'text/plain', 'Not Found'
+
+        self.count(service)
+        if self.latency is not None:
+            with self._lock:
+                latency = self.latency(self._random)
+            time.sleep(latency)
+
+        if service == HMRC and headers.get('Accept') == \
+                HMRCRegistry.API_VERSION_2_CONTENT_TYPE:
+            token = headers.get('Authorization', '')[len('Bearer '):]
+            if token not in self.tokens:
+                return (401,
+                        'application/json',
+                        json.dumps({
+                            'code': 'INVALID_CREDENTIALS',
+                            'message': 'Invalid Authentication information '
+                                       'provided',
+                        }))
+
+        # Look up the response to serve.
+        key = '%s:%s%s' % (service, country_code, vat_number)
+        response = self._get_response(country_code + vat_number)
+        if response is None:
+            recording = self.recordings.get(key)
+            if recording is not None:
+                return tuple(recording)
+            response = self._draw_fault()
+        if response is None and self.record:
+            recording = self._forward(service, method, path, headers, body)
+            with self._lock:
+                self.recordings[key] = list(recording)
+            return recording
+        if response is None:
+            response = self.default_response
+
+        if service == VIES:
+            return self._render_vies(country_code, vat_number, response)
+        elif service == VIES_REST:
+            return self._render_vies_rest(country_code, vat_number, response)
+        return self._render_hmrc(vat_number, response)
+
+    def _get_response(self, vat_number):
+        with self._lock:
+            responses = self._responses.get(vat_number)
+            if not responses:
+                return None
+            if len(responses) > 1:
+                return responses.pop(0)
+            return responses[0]
+
+    def _draw_fault(self):
+        if not self.fault_rates:
+            return None
+
+        with self._lock:
+            draw = self._random.random()
+        for response, rate in self.fault_rates.items():
+            if draw < rate:
+                return response
+            draw -= rate
+        return None
+
+    def _forward(self, service, method, path, headers, body):
+        url = self.upstream_urls[service]
+        if service == HMRC:
+            url += path[len(self.HMRC_PATH):]
+
+        forwarded_headers = dict(
+            (name, headers[name])
+            for name in ('Accept', 'Authorization', 'Content-Type')
+            if headers.get(name)
+        )
+        response = requests.request(method,
+                                    url,
+                                    data=body,
+                                    headers=forwarded_headers,
+                                    timeout=(3.05, 30))
+        return (response.status_code,
+                response.headers.get('Content-Type', ''),
+                response.text)
+
+    def _parse_vies_request(self, body):
+        text = body.decode('utf-8')
+        country_code = re.search(r'countryCode>([^<]*)<', text).group(1)
+        vat_number = re.search(r'vatNumber>([^<]*)<', text).group(1)
+        return country_code, vat_number
+
+    def _get_business(self, country_code, vat_number, response):
+        if isinstance(response, dict):
+            return response.get('name'), response.get('address')
+        return (u'Business %s%s' % (country_code, vat_number),
+                u'Street 1\n1000 City')
+
+    def _render_status_error(self, status_code):
+        return (status_code,
+                'text/html',
+                u'<html><body><h1>%d</h1></body></html>' % (status_code))
+
+    def _render_vies(self, country_code, vat_number, response):
+        if isinstance(response, int) and not isinstance(response, bool):
+            return self._render_status_error(response)
+
+        if isinstance(response, str):
+            return (200, 'text/xml; charset=utf-8', (
+                u'<env:Envelope xmlns:env="http://schemas.xmlsoap.org/soap/'
+                u'envelope/"><env:Header/><env:Body><env:Fault><faultcode>'
+                u'env:Server</faultcode><faultstring>%s</faultstring>'
+                u'</env:Fault></env:Body></env:Envelope>' % (escape(response))
+            ))
+
+        business = u''
+        if response is not False:
+            name, address = self._get_business(country_code,
+                                               vat_number,
+                                               response)
+            business = u''.join(
+                u'<ns2:%s>%s</ns2:%s>' % (tag, escape(value), tag)
+                for tag, value in (('name', name), ('address', address))
+                if value is not None
+            )
+
+        return (200, 'text/xml; charset=utf-8', (
+            u'<env:Envelope xmlns:env="http://schemas.xmlsoap.org/soap/envelo'
+            u'pe/"><env:Header/><env:Body><ns2:checkVatResponse xmlns:ns2="ur'
+            u'n:ec.europa.eu:taxud:vies:services:checkVat:types"><ns2:country'
+            u'Code>%s</ns2:countryCode><ns2:vatNumber>%s</ns2:vatNumber><ns2:'
+            u'requestDate>%s+00:00</ns2:requestDate><ns2:valid>%s</ns2:valid>'
+            u'%s</ns2:checkVatResponse></env:Body></env:Envelope>' %
+            (escape(country_code),
+             escape(vat_number),
+             time.strftime('%Y-%m-%d', time.gmtime()),
+             'false' if response is False else 'true',
+             business)
+        ))
+
+    def _render_vies_rest(self, country_code, vat_number, response):
+        if isinstance(response, int) and not isinstance(response, bool):
+            return self._render_status_error(response)
+
+        if isinstance(response, str):
+            return (500, 'application/json', json.dumps({
+                'actionSucceed': False,
+                'errorWrappers': [{'error': response, 'message': response}],
+            }))
+
+        body = {
+            'countryCode': country_code,
+            'vatNumber': vat_number,
+            'requestDate': time.strftime('%Y-%m-%dT%H:%M:%S.000Z',
+                                         time.gmtime()),
+            'valid': response is not False,
+            'requestIdentifier': '',
+            'userError': 'INVALID' if response is False else 'VALID',
+        }
+        if response is not False:
+            name, address = self._get_business(country_code,
+                                               vat_number,
+                                               response)
+            for key, value in (('name', name), ('address', address)):
+                if value is not None:
+                    body[key] = value
+        return 200, 'application/json', json.dumps(body)
+
+    def _render_hmrc(self, vat_number, response):
+        if isinstance(response, int) and not isinstance(response, bool):
+            return (response, 'application/json', json.dumps({
+                'code': 'MESSAGE_THROTTLED_OUT' if response == 429
+                else 'SERVER_ERROR',
+            }))
+
+        if isinstance(response, str):
+            return (503, 'application/json', json.dumps({
+                'code': response,
+            }))
+
+        if response is False:
+            return (404, 'application/json', json.dumps({
+                'code': 'NOT_FOUND',
+                'reason': 'targetVrn does not match a registered company',
+            }))
+
+        name, address = self._get_business('GB', vat_number, response)
+        target = {'vatNumber': vat_number}
+        if name is not None:
+            target['name'] = name
+        if isinstance(address, dict):
+            target['address'] = address
+        elif address is not None:
+            target['address'] = collections.OrderedDict(
+                ('line%d' % (index + 1), line)
+                for index, line in enumerate(address.split('\n'))
+            )
+        return (200, 'application/json', json.dumps({
+            'target': target,
+            'processingDate': time.strftime('%Y-%m-%dT%H:%M:%S+00:00',
+                                            time.gmtime()),
+        }))
+
+    def _respond_status(self):
+        # Non-ISO code used for Greece.
+        return (200, 'application/json', json.dumps({
+            'vow': {'available': True},
+            'countries': [
+                {
+                    'countryCode': country_code,
+                    'availability': 'Unavailable'
+                    if country_code in self.unavailable_countries
+                    else 'Available',
+                }
+                for country_code in self.VIES_COUNTRY_CODES
+            ],
+        }))
+
+    def _respond_token(self):
+        with self._lock:
+            self.request_counts[TOKEN] += 1
+            token = 'token-%d' % (self.request_counts[TOKEN])
+        time.sleep(self.token_delay)
+
+        if self.token_status != 200:
+            return (self.token_status,
+                    'application/json',
+                    json.dumps({'error': 'invalid_client'}))
+
+        self.tokens.add(token)
+        return (200, 'application/json', json.dumps({
+            'access_token': token,
+            'token_type': 'bearer',
+            'expires_in': self.token_expires_in,
+        }))
+
+
+def _parse_fault_rate(value):
+    response, _, rate = value.rpartition('=')
+    if response.isdigit():
+        response = int(response)
+    return response, float(rate)
+
+
+def main(argv=None):
+    """Run a stand-in server until interrupted.
+
+    :param argv: Optional command line arguments.
+    """
+
+    parser = argparse.ArgumentParser(
+        prog='python -m pyvat.testing',
+        description='Run a local stand-in for the VIES and HMRC registries.',
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency',
+                        type=float,
+                        help='median latency in seconds of checks, drawn '
+                             'from a log-normal distribution')
+    parser.add_argument('--latency-sigma', type=float, default=0.5)
+    parser.add_argument('--fault-rate',
+                        action='append',
+                        type=_parse_fault_rate,
+                        default=[],
+                        metavar='RESPONSE=RATE',
+                        help='probability of responding with a fault code '
+                             'or HTTP status code, for example '
+                             'MS_UNAVAILABLE=0.01 or 429=0.05')
+    parser.add_argument('--replay',
+                        metavar='PATH',
+                        help='serve responses recorded in a file')
+    parser.add_argument('--record',
+                        metavar='PATH',
+                        help='forward requests to the real registries, '
+                             'recording responses to a file')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    latency = None
+    if args.latency:
+        latency = lognormal_latency(args.latency, args.latency_sigma)
+
+    server = StandInServer(host=args.host,
+                           port=args.port,
+                           latency=latency,
+                           fault_rates=dict(args.fault_rate),
+                           record=args.record is not None,
+                           seed=args.seed)
+    if args.replay:
+        server.load_recordings(args.replay)
+
+    with server:
+        print('Serving on %s' % (server.url))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if args.record:
+                server.save_recordings(args.record)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
+
+
+__all__ = (
+    'StandInServer',
+    'constant_latency',
+    'uniform_latency',
+    'lognormal_latency',
+)
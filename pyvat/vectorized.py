@@ -0,0 +1,154 @@
+"""Vectorized format validation of VAT numbers.
+
+Validates the formats of arrays of VAT numbers at once rather than calling
+:func:`pyvat.is_vat_number_format_valid` per VAT number: country code
+prefixes are resolved once per distinct prefix, and the expression of each
+country is applied to all VAT numbers of the country in a single pass.
+"""
+
+import bisect
+import collections
+import re
+
+from . import (
+    VAT_NUMBER_EXPRESSIONS,
+    WHITESPACE_EXPRESSION,
+    decompose_vat_number,
+)
+
+
+_multiline_expressions = {}
+"""Multiline variants of VAT number expressions by expression."""
+
+
+def _get_multiline_expression(expression):
+    multiline_expression = _multiline_expressions.get(expression)
+    if multiline_expression is None:
+        multiline_expression = _multiline_expressions[expression] = \
+            re.compile(expression.pattern, expression.flags | re.MULTILINE)
+    return multiline_expression
+
+
+def _match_lines(expression, lines):
+    """Match an expression against lines in a single pass.
+
+    Lines must not contain line breaks, which VAT numbers cleaned of
+    whitespace do not.
+
+    :returns: the indices of the matching lines.
+    """
+
+    starts = []
+    offset = 0
+    for line in lines:
+        starts.append(offset)
+        offset += len(line) + 1
+
+    return [bisect.bisect_right(starts, match.start()) - 1
+            for match in _get_multiline_expression(expression)
+            .finditer('\n'.join(lines))]
+
+
+def _clean(values):
+    """Clean VAT numbers like :func:`pyvat.decompose_vat_number`.
+
+    All VAT numbers are cleaned in a single pass unless they contain the
+    separator used.
+
+    :returns: the cleaned VAT numbers, ``None`` for missing VAT numbers.
+    """
+
+    strings = [value if isinstance(value, str) else u'' for value in values]
+    cleaned = WHITESPACE_EXPRESSION.sub('', u'\0'.join(strings)).upper() \
+        .split(u'\0')
+    if len(cleaned) != len(strings):
+        cleaned = [WHITESPACE_EXPRESSION.sub('', value).upper()
+                   for value in strings]
+    return [vat_number if isinstance(value, str) else None
+            for value, vat_number in zip(values, cleaned)]
+
+
+def _to_list(values):
+    return values.tolist() if hasattr(values, 'tolist') else list(values)
+
+
+def validate_formats(vat_numbers, country_codes=None):
+    """Test if the formats of an array of VAT numbers are valid.
+
+    Vectorized counterpart of :func:`pyvat.is_vat_number_format_valid`,
+    additionally returning the decomposed country code of each VAT number.
+    Accepts lists and other sequences as well as NumPy arrays and pandas
+    series, for which NumPy arrays and pandas series are returned, without
+    requiring either library otherwise. Missing VAT numbers are invalid, and
+    missing country codes prompt detection.
+
+    :param vat_numbers: Array of VAT numbers.
+    :param country_codes:
+        Optional array of country codes of the same length. Default ``None``
+        prompting detection for all VAT numbers.
+    :returns:
+        a :class:`tuple` of an array of whether the format of each VAT number
+        is valid and an array of the country code of each VAT number or
+        ``None`` if decomposition failed.
+    :raises ValueError: if the arrays differ in length.
+    """
+
+    values = _to_list(vat_numbers)
+    codes = _to_list(country_codes) if country_codes is not None \
+        else [None] * len(values)
+    if len(codes) != len(values):
+        raise ValueError('expected %d country codes, got %d' %
+                         (len(values), len(codes)))
+
+    valid = [False] * len(values)
+    decomposed_country_codes = [None] * len(values)
+    groups = collections.defaultdict(lambda: ([], []))
+    prefixes = {}
+
+    for index, (vat_number, country_code) in enumerate(
+        zip(_clean(values), codes)
+    ):
+        if vat_number is None:
+            continue
+
+        # Decompose the VAT number like decompose_vat_number(), resolving
+        # each distinct prefix once.
+        prefix = vat_number[0:2]
+        if not isinstance(country_code, str) or not country_code:
+            country_code = prefixes.get(prefix, False)
+            if country_code is False:
+                country_code = prefixes[prefix] = \
+                    decompose_vat_number(prefix)[1]
+            if country_code is None:
+                continue
+            vat_number = vat_number[2:]
+        elif prefix == country_code or \
+                (country_code == 'GR' and prefix == 'EL'):
+            vat_number = vat_number[2:]
+
+        decomposed_country_codes[index] = country_code
+        if vat_number and country_code in VAT_NUMBER_EXPRESSIONS:
+            indices, lines = groups[country_code]
+            indices.append(index)
+            lines.append(vat_number)
+
+    for country_code, (indices, lines) in groups.items():
+        for line in _match_lines(VAT_NUMBER_EXPRESSIONS[country_code], lines):
+            if any(c.isdigit() for c in lines[line]):
+                valid[indices[line]] = True
+
+    module = type(vat_numbers).__module__.split('.')[0]
+    if module == 'pandas':
+        import pandas
+        return (pandas.Series(valid, index=vat_numbers.index, dtype=bool),
+                pandas.Series(decomposed_country_codes,
+                              index=vat_numbers.index,
+                              dtype=object))
+    elif module == 'numpy':
+        import numpy
+        return (numpy.array(valid, dtype=bool),
+                numpy.array(decomposed_country_codes, dtype=object))
+    return valid, decomposed_country_codes
+
+
+__all__ = ('validate_formats', )
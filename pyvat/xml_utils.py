@@ -1,3 +1,6 @@
+from xml.parsers import expat
+
+
 class NodeNotFoundError(Exception):
     """XML node was not found.
     """
@@ -5,33 +8,120 @@ class NodeNotFoundError(Exception):
     pass
 
 
-def get_first_child_element(node, tag_name):
-    """Get the first child element node with a given tag name.
+class _StopParsing(Exception):
+    """Raised by parser handlers once everything of interest was read.
+    """
+
+    pass
 
-    :param node: Parent node.
-    :type node: xml.dom.Node
-    :returns: the first child element node with the given tag name.
-    :rtype: xml.dom.Node
-    :raises NodeNotFoundError:
-        if no child node with the given tag name was found.
+
+def _get_local_name(name):
+    """Get the local name of a namespace-qualified expat element name.
     """
 
-    for child in node.childNodes:
-        if child.nodeType == node.ELEMENT_NODE and \
-           child.tagName == tag_name:
-            return child
+    return name.rpartition(' ')[2]
 
-    raise NodeNotFoundError('no child element node with tag %s was found' %
-                            (tag_name))
 
+def parse_soap_response(data, response_tag, field_tags):
+    """Parse a SOAP response envelope incrementally.
 
-def get_text(node):
-    """Get text from a node.
+    The body is parsed by an event-based parser which stops as soon as all
+    fields or the fault element have been read. Elements are matched by local
+    name so that any namespace prefixes can be used.
 
-    :param node: Node.
-    :type node: xml.dom.Node
-    :returns: the node's text
+    :param data: Response body as bytes.
+    :param response_tag: Local name of the response element.
+    :param field_tags:
+        Local names of the child elements of the response element to get
+        the text of.
+    :returns:
+        a :class:`tuple` of the fault string, ``None`` unless the body is a
+        fault, and a :class:`dict` mapping the local names of the fields
+        found to their text, or ``None`` if the response element was not
+        found.
+    :raises xml.parsers.expat.ExpatError: if the body is malformed.
+    :raises ValueError: if the root element is not a SOAP envelope.
+    :raises NodeNotFoundError: if the envelope has no body element.
     """
 
-    return ''.join(child.data for child in node.childNodes
-                   if child.nodeType == node.TEXT_NODE)
+    # Local names of the open elements.
+    path = []
+    # Parse state: whether a body was found, the fault string and fields,
+    # and the text of the element currently collected, if any.
+    state = {
+        'body': False,
+        'fault': None,
+        'fields': None,
+        'text': None,
+    }
+    parser = expat.ParserCreate(namespace_separator=' ')
+    parser.buffer_text = True
+
+    def start_element(name, attributes):
+        name = _get_local_name(name)
+        depth = len(path)
+
+        if depth == 0:
+            if name != 'Envelope':
+                raise ValueError('expected response XML root element to be '
+                                 'a SOAP envelope')
+        elif depth == 1:
+            if name == 'Body':
+                state['body'] = True
+        elif path[1] == 'Body':
+            if depth == 2:
+                if name == 'Fault':
+                    state['fault'] = None
+                elif name == response_tag:
+                    state['fields'] = {}
+            elif path[2] == 'Fault':
+                if name == 'faultstring' and state['fault'] is None:
+                    state['text'] = (len(path), 'faultstring', [])
+            elif depth == 3 and path[2] == response_tag and \
+                    name in field_tags and name not in state['fields']:
+                state['text'] = (depth, name, [])
+
+        path.append(name)
+
+    def end_element(name):
+        name = path.pop()
+        depth = len(path)
+        text = state['text']
+
+        if text is not None and text[0] == depth:
+            state['text'] = None
+            if text[1] == 'faultstring':
+                state['fault'] = u''.join(text[2])
+            else:
+                state['fields'][text[1]] = u''.join(text[2])
+                if len(state['fields']) == len(field_tags):
+                    raise _StopParsing()
+
+        if depth == 2 and path[1] == 'Body':
+            if name == 'Fault':
+                if state['fault'] is None:
+                    state['fault'] = u''
+                raise _StopParsing()
+            if name == response_tag:
+                raise _StopParsing()
+        elif depth == 1 and name == 'Body':
+            raise _StopParsing()
+
+    def character_data(data):
+        if state['text'] is not None:
+            state['text'][2].append(data)
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+
+    try:
+        parser.Parse(data, True)
+    except _StopParsing:
+        pass
+
+    if not state['body']:
+        raise NodeNotFoundError('no child element node with tag Body was '
+                                'found')
+
+    return state['fault'], state['fields']
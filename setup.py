@@ -13,20 +13,23 @@ packages = [
 
 requires = [
     'requests>=1.0.0,<3.0',
-    'pycountry',
-    'enum34; python_version < "3.4"',
 ]
 
+extras_require = {
+    'async': ['aiohttp>=3.3'],
+}
+
 tests_require = [
     'nose',
     'rednose',
     'flake8',
+    'pycountry',
     'unittest2',
 ]
 
 setup(
     name='pyvat',
-    version='1.3.18',
+    version='1.4.0',
     description='VAT validation for Python',
     long_description=long_description,
     long_description_content_type="text/x-rst",
@@ -38,16 +41,16 @@ setup(
     },
     packages=packages,
     install_requires=requires,
+    extras_require=extras_require,
+    python_requires='>=3.5',
     classifiers=(
         'Development Status :: 5 - Production/Stable',
         'Intended Audience :: Developers',
         'Natural Language :: English',
         'License :: OSI Approved :: Apache Software License',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
         'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
     ),
 )
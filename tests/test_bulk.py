@@ -0,0 +1,294 @@
+import concurrent.futures
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from pyvat import bulk, is_vat_number_format_valid
+from pyvat.__main__ import main
+from unittest2 import TestCase
+
+from .test_validators import RecordingRegistryMixin
+
+
+class ReadRecordsTestCase(TestCase):
+    """Test case for :func:`bulk.read_records`.
+    """
+
+    def test_csv(self):
+        """read_records(.., CSV, ..)
+        """
+
+        f = io.StringIO(u'id,vat,country\n1,DK12345671,\n2,12345672,DK\n'
+                        u'3,,\n')
+        self.assertEqual(list(bulk.read_records(f, bulk.CSV, 'vat')), [
+            ('DK12345671', None),
+            ('12345672', None),
+            ('', None),
+        ])
+
+        f.seek(0)
+        self.assertEqual(
+            list(bulk.read_records(f, bulk.CSV, 'vat', 'country'))[1],
+            ('12345672', 'DK')
+        )
+
+        f.seek(0)
+        with self.assertRaises(ValueError):
+            list(bulk.read_records(f, bulk.CSV))
+
+    def test_json_lines(self):
+        """read_records(.., JSON_LINES, ..)
+        """
+
+        f = io.StringIO(u'{"vat_number": "12345671", "country": "DK"}\n'
+                        u'\n'
+                        u'"DK12345672"\n'
+                        u'{}\n')
+        self.assertEqual(
+            list(bulk.read_records(f,
+                                   bulk.JSON_LINES,
+                                   country_column='country')),
+            [('12345671', 'DK'), ('DK12345672', None), ('', None)]
+        )
+
+        with self.assertRaises(ValueError):
+            list(bulk.read_records(io.StringIO(u'[]\n'), bulk.JSON_LINES))
+
+    def test_detect_format(self):
+        """detect_format()
+        """
+
+        self.assertEqual(bulk.detect_format('export.CSV'), bulk.CSV)
+        self.assertEqual(bulk.detect_format('export.ndjson'), bulk.JSON_LINES)
+        self.assertIsNone(bulk.detect_format('export.txt'))
+
+
+class ValidateTestCase(RecordingRegistryMixin, TestCase):
+    """Test case for :func:`bulk.validate` and ``python -m pyvat validate``.
+    """
+
+    VAT_NUMBERS = ['DK1234%04d' % (n) for n in range(11, 31)]
+
+    def setUp(self):
+        super(ValidateTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.input_path = os.path.join(self.directory, 'export.csv')
+        self.output_path = os.path.join(self.directory, 'results.jsonl')
+        self.checkpoint_path = self.output_path + '.checkpoint'
+        with open(self.input_path, 'w') as f:
+            f.write('vat_number\n')
+            for vat_number in self.VAT_NUMBERS:
+                f.write(vat_number + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(ValidateTestCase, self).tearDown()
+
+    def read_output(self):
+        with open(self.output_path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_validate(self):
+        """validate()
+        """
+
+        output = io.BytesIO()
+        state = bulk.validate(
+            [('DK12345671', None), ('12345671', 'DK'), ('123456', None)],
+            output,
+            chunk_size=2
+        )
+        self.assertEqual(
+            (state['records'], state['valid'], state['invalid']),
+            (3, 2, 1)
+        )
+
+        results = [json.loads(line) for line in
+                   output.getvalue().decode('utf-8').splitlines()]
+        self.assertEqual([result['record'] for result in results], [0, 1, 2])
+        self.assertEqual(results[1], {
+            'record': 1,
+            'vat_number': '12345671',
+            'country_code': 'DK',
+            'is_valid': True,
+            'business_name': 'Business 12345671',
+            'business_address': None,
+            'business_country_code': None,
+        })
+        self.assertIs(results[2]['is_valid'], False)
+        self.assertEqual(len(self.registry.checks), 1)
+
+    def test_main(self):
+        """python -m pyvat validate
+        """
+
+        self.assertEqual(main(['validate',
+                               self.input_path,
+                               '-o', self.output_path,
+                               '--concurrency', '1',
+                               '--log',
+                               '-q']), 0)
+
+        results = self.read_output()
+        self.assertEqual([result['vat_number'] for result in results],
+                         self.VAT_NUMBERS)
+        self.assertIn('log_lines', results[0])
+        self.assertEqual(self.registry.max_concurrent, 1)
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_resume(self):
+        """python -m pyvat validate resumes from checkpoints
+        """
+
+        def records():
+            with open(self.input_path) as f:
+                for i, record in enumerate(bulk.read_records(f, bulk.CSV)):
+                    if i == 12:
+                        raise KeyboardInterrupt()
+                    yield record
+
+        with open(self.output_path, 'wb') as output:
+            with self.assertRaises(KeyboardInterrupt):
+                bulk.validate(records(),
+                              output,
+                              checkpoint={
+                                  'input': os.path.abspath(self.input_path),
+                              },
+                              checkpoint_path=self.checkpoint_path,
+                              checkpoint_interval=0,
+                              chunk_size=5)
+            output.write(b'{"record": 10, "partial')
+
+        self.assertEqual(bulk.load_checkpoint(self.checkpoint_path)['records'],
+                         10)
+        self.assertEqual(len(self.registry.checks), 10)
+
+        self.assertEqual(main(['validate',
+                               self.input_path,
+                               '-o', self.output_path,
+                               '--chunk-size', '5',
+                               '-q']), 0)
+
+        results = self.read_output()
+        self.assertEqual([result['record'] for result in results],
+                         list(range(len(self.VAT_NUMBERS))))
+        self.assertEqual([result['vat_number'] for result in results],
+                         self.VAT_NUMBERS)
+        self.assertEqual(len(self.registry.checks), len(self.VAT_NUMBERS))
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+
+    def test_resume_without_output(self):
+        """python -m pyvat validate starts over if the output is missing
+        """
+
+        # Output deleted or truncated since the checkpoint.
+        for output in (None, b'{"record": 0}\n'):
+            bulk.save_checkpoint(self.checkpoint_path, {
+                'version': bulk.CHECKPOINT_VERSION,
+                'input': os.path.abspath(self.input_path),
+                'records': 10,
+                'output_size': 1000,
+                'valid': 10,
+                'invalid': 0,
+                'nondeterministic': 0,
+            })
+            if output is not None:
+                with open(self.output_path, 'wb') as f:
+                    f.write(output)
+
+            self.assertEqual(main(['validate',
+                                   self.input_path,
+                                   '-o', self.output_path,
+                                   '-q']), 0)
+            self.assertEqual([result['record']
+                              for result in self.read_output()],
+                             list(range(len(self.VAT_NUMBERS))))
+
+
+class CheckVatNumberFormatsTestCase(TestCase):
+    """Test case for :func:`bulk.check_vat_number_formats`.
+    """
+
+    VAT_NUMBERS = [
+        'DK54562519',
+        ('54562519', 'DK'),
+        ('DK 5456 2519', 'DK'),
+        'DK5456251',
+        'EL123456789',
+        ('123456789', 'GR'),
+        'GB553557881',
+        'XX123',
+        '123456',
+        '',
+        u'DK5456\x002519',
+        u'FR\u00c5B123456789',
+    ] * 5
+
+    def assert_results(self, results):
+        self.assertEqual([item for item, _ in results], self.VAT_NUMBERS)
+        self.assertEqual(
+            [valid for _, valid in results],
+            [is_vat_number_format_valid(*(item if isinstance(item, tuple)
+                                          else (item, )))
+             for item in self.VAT_NUMBERS]
+        )
+
+    def test_processes(self):
+        """check_vat_number_formats() on a process pool
+        """
+
+        results = list(bulk.check_vat_number_formats(self.VAT_NUMBERS,
+                                                     processes=2,
+                                                     chunk_size=7))
+        self.assert_results(results)
+        self.assertTrue(results[0][1])
+        self.assertFalse(results[3][1])
+
+    def test_executor(self):
+        """check_vat_number_formats(executor=..)
+        """
+
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            submit = executor.submit
+            chunks = []
+
+            def record_submit(function, vat_numbers, country_codes):
+                chunks.append((vat_numbers, country_codes))
+                return submit(function, vat_numbers, country_codes)
+
+            executor.submit = record_submit
+            self.assert_results(list(bulk.check_vat_number_formats(
+                iter(self.VAT_NUMBERS),
+                executor=executor,
+                chunk_size=25,
+                max_pending=1
+            )))
+
+        self.assertEqual(len(chunks), 3)
+        self.assertIsInstance(chunks[0][0], bytes)
+        self.assertEqual(list(bulk.check_vat_number_formats(
+            [], executor=executor
+        )), [])
+
+    def test_invalid_items(self):
+        """check_vat_number_formats() with items other than text
+        """
+
+        for vat_number in (None, 54562519, b'DK54562519'):
+            with self.assertRaises(TypeError):
+                is_vat_number_format_valid(vat_number)
+
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            for item in (None, 54562519, b'DK54562519', ('54562519', 45)):
+                with self.assertRaises(TypeError):
+                    list(bulk.check_vat_number_formats(['DK54562519', item],
+                                                       executor=executor))
+
+
+__all__ = (
+    'ReadRecordsTestCase',
+    'ValidateTestCase',
+    'CheckVatNumberFormatsTestCase',
+)
@@ -0,0 +1,593 @@
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import pyvat
+from pyvat import check_vat_number, testing, VatNumberCheckResult
+from pyvat.cache import (
+    CacheEntry,
+    MemoryResultCache,
+    SharedMemoryResultCache,
+    SQLiteResultCache,
+)
+from pyvat.single_flight import SingleFlight
+from unittest2 import TestCase, skipUnless
+
+from .test_registries import (
+    CREDITE_SBERGER_DONAL,
+    RecordingHooks,
+    StandInServerMixin,
+)
+from .test_validators import RecordingRegistryMixin
+
+
+def wait_for(condition, timeout=5):
+    """Wait for a condition to become true.
+
+    :param condition: Function taking no arguments.
+    :param timeout: Maximum number of seconds to wait.
+    :returns: whether the condition became true.
+    """
+
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class ResultCacheTestMixin(object):
+    """Test cases shared by all result cache backends.
+    """
+
+    def create_cache(self, **kwargs):
+        raise NotImplementedError()
+
+    def test_get_set(self):
+        """ResultCache.get() and ResultCache.set()
+        """
+
+        cache = self.create_cache()
+        self.assertIsNone(cache.get('54562519', 'DK'))
+
+        cache.set('54562519', 'DK', VatNumberCheckResult(
+            True,
+            ['< Response'],
+            business_name=u'Lego A/S',
+            business_address=u'Åstvej 1\n7190 Billund',
+            business_country_code='DK',
+        ))
+        result = cache.get('54562519', 'DK')
+
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.business_name, u'Lego A/S')
+        self.assertEqual(result.business_address,
+                         u'Åstvej 1\n7190 Billund')
+        self.assertEqual(result.business_country_code, 'DK')
+        self.assertEqual(len(result.log_lines), 1)
+        self.assertIsNot(cache.get('54562519', 'DK'), result)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertAlmostEqual(cache.hit_ratio, 2.0 / 3)
+
+        cache.delete('54562519', 'DK')
+        self.assertIsNone(cache.get('54562519', 'DK'))
+
+    def test_greece(self):
+        """ResultCache treats EL and GR as the same country code
+        """
+
+        cache = self.create_cache()
+        cache.set('123456789', 'EL', VatNumberCheckResult(False))
+        self.assertIs(cache.get('123456789', 'GR').is_valid, False)
+
+    def test_ttl(self):
+        """ResultCache(valid_ttl=.., invalid_ttl=.., nondeterministic_ttl=..)
+        """
+
+        cache = self.create_cache(valid_ttl=60,
+                                  invalid_ttl=0.05,
+                                  nondeterministic_ttl=0)
+        cache.set('1', 'DK', VatNumberCheckResult(True))
+        cache.set('2', 'DK', VatNumberCheckResult(False))
+        cache.set('3', 'DK', VatNumberCheckResult(None))
+
+        self.assertIsNotNone(cache.get('2', 'DK'))
+        self.assertIsNone(cache.get('3', 'DK'))
+        time.sleep(0.1)
+        self.assertIsNotNone(cache.get('1', 'DK'))
+        self.assertIsNone(cache.get('2', 'DK'))
+
+        cache.clear()
+        self.assertIsNone(cache.get('1', 'DK'))
+
+    def test_expired_deleted(self):
+        """ResultCache.lookup() only deletes entries still expired
+        """
+
+        cache = self.create_cache(valid_ttl=60)
+        cache.set('1', 'DK', VatNumberCheckResult(True))
+
+        # Another thread or process refreshed the entry after it was loaded
+        # expired.
+        now = time.time()
+        cache._load = lambda key: CacheEntry(True, None, None, None,
+                                             now - 2, now - 1)
+        self.assertEqual(cache.lookup('1', 'DK'), (None, False))
+        del cache._load
+        self.assertTrue(cache.get('1', 'DK').is_valid)
+
+        cache._delete_expired(cache.make_key('1', 'DK'), now + 61)
+        self.assertIsNone(cache.get('1', 'DK'))
+
+    def test_refresh_ahead(self):
+        """ResultCache(refresh_ahead=.., stale_ttl=..).lookup()
+        """
+
+        cache = self.create_cache(valid_ttl=0.4,
+                                  refresh_ahead=0.5,
+                                  stale_ttl=0.4)
+        cache.set('1', 'DK', VatNumberCheckResult(True))
+
+        result, due = cache.lookup('1', 'DK')
+        self.assertTrue(result.is_valid)
+        self.assertFalse(due)
+
+        time.sleep(0.25)
+        result, due = cache.lookup('1', 'DK')
+        self.assertTrue(result.is_valid)
+        self.assertTrue(due)
+
+        time.sleep(0.25)
+        result, due = cache.lookup('1', 'DK')
+        self.assertTrue(result.is_valid)
+        self.assertTrue(due)
+
+        time.sleep(0.4)
+        self.assertEqual(cache.lookup('1', 'DK'), (None, False))
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+        with self.assertRaises(ValueError):
+            self.create_cache(refresh_ahead=1.5)
+
+    def test_revalidate(self):
+        """ResultCache.revalidate()
+        """
+
+        cache = self.create_cache(max_refreshes=1, refresh_backoff=0)
+        cache.set('1', 'DK', VatNumberCheckResult(True))
+        release = threading.Event()
+
+        def check(result):
+            release.wait(5)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.assertTrue(cache.revalidate(
+            '1', 'DK', lambda: check(VatNumberCheckResult(False))
+        ))
+        self.assertFalse(cache.revalidate('1', 'DK', check))
+        self.assertFalse(cache.revalidate('2', 'DK', check))
+        self.assertTrue(cache.get('1', 'DK').is_valid)
+        release.set()
+        self.assertTrue(wait_for(
+            lambda: cache.get('1', 'DK').is_valid is False
+        ))
+
+        # Nondeterministic results and errors keep the cached result.
+        for result in (VatNumberCheckResult(None), RuntimeError('failed')):
+            self.assertTrue(wait_for(lambda: cache.revalidate(
+                '1', 'DK', lambda result=result: check(result)
+            )))
+        self.assertTrue(wait_for(
+            lambda: cache.revalidate('1', 'DK', lambda: None)
+        ))
+        self.assertIs(cache.get('1', 'DK').is_valid, False)
+        self.assertEqual(cache.refreshes, 4)
+
+        # Results checked while revalidating are not replaced.
+        release.clear()
+        self.assertTrue(wait_for(lambda: cache.revalidate(
+            '1', 'DK', lambda: check(VatNumberCheckResult(False))
+        )))
+        time.sleep(0.01)
+        cache.set('1', 'DK', VatNumberCheckResult(True))
+        release.set()
+        self.assertTrue(wait_for(lambda: cache.revalidate(
+            '1', 'DK', lambda: None
+        )))
+        self.assertTrue(cache.get('1', 'DK').is_valid)
+
+    def test_refresh_backoff(self):
+        """ResultCache(refresh_backoff=..).revalidate()
+        """
+
+        cache = self.create_cache(refresh_backoff=0.2)
+        cache.set('1', 'DK', VatNumberCheckResult(True))
+
+        # Failed revalidations are not repeated within the backoff.
+        for result in (VatNumberCheckResult(None), RuntimeError('failed')):
+            def check(result=result):
+                if isinstance(result, Exception):
+                    raise result
+                return result
+
+            self.assertTrue(cache.revalidate('1', 'DK', check))
+            self.assertTrue(wait_for(lambda: not cache._refreshing))
+            self.assertFalse(cache.revalidate('1', 'DK', check))
+            time.sleep(0.25)
+
+        # Successful revalidations do not back off.
+        self.assertTrue(cache.revalidate(
+            '1', 'DK', lambda: VatNumberCheckResult(False)
+        ))
+        self.assertTrue(wait_for(lambda: not cache._refreshing))
+        self.assertTrue(cache.revalidate(
+            '1', 'DK', lambda: VatNumberCheckResult(False)
+        ))
+        self.assertEqual(cache.refreshes, 4)
+
+
+class MemoryResultCacheTestCase(ResultCacheTestMixin, TestCase):
+    """Test case for :class:`MemoryResultCache`.
+    """
+
+    def create_cache(self, **kwargs):
+        return MemoryResultCache(**kwargs)
+
+    def test_max_size(self):
+        """MemoryResultCache(max_size=..)
+        """
+
+        cache = self.create_cache(max_size=2)
+        cache.set('1', 'DK', VatNumberCheckResult(True))
+        cache.set('2', 'DK', VatNumberCheckResult(True))
+        cache.get('1', 'DK')
+        cache.set('3', 'DK', VatNumberCheckResult(True))
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get('1', 'DK'))
+        self.assertIsNone(cache.get('2', 'DK'))
+        self.assertIsNotNone(cache.get('3', 'DK'))
+
+
+def fill_sqlite_cache(path, offset):
+    cache = SQLiteResultCache(path)
+    for n in range(50):
+        cache.set('%08d' % (offset + n), 'DK', VatNumberCheckResult(True))
+
+
+class SQLiteResultCacheTestCase(ResultCacheTestMixin, TestCase):
+    """Test case for :class:`SQLiteResultCache`.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_cache(self, **kwargs):
+        return SQLiteResultCache(self.path, **kwargs)
+
+    def test_persistence(self):
+        """SQLiteResultCache results survive reopening the database
+        """
+
+        self.create_cache().set('54562519', 'DK', VatNumberCheckResult(
+            True,
+            business_name=u'Lego A/S',
+        ))
+
+        result = self.create_cache().get('54562519', 'DK')
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.business_name, u'Lego A/S')
+
+    def test_compact(self):
+        """SQLiteResultCache.compact()
+        """
+
+        cache = self.create_cache(invalid_ttl=0.05)
+        cache.set('1', 'DK', VatNumberCheckResult(True))
+        cache.set('2', 'DK', VatNumberCheckResult(False))
+        time.sleep(0.1)
+
+        self.assertEqual(cache.compact(vacuum=True), 1)
+        self.assertEqual(len(cache), 1)
+
+    def test_processes(self):
+        """SQLiteResultCache shared between processes
+        """
+
+        cache = self.create_cache()
+        processes = [
+            multiprocessing.Process(target=fill_sqlite_cache,
+                                    args=(self.path, offset))
+            for offset in range(0, 200, 50)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        self.assertEqual(len(cache), 200)
+        self.assertIsNotNone(cache.get('00000199', 'DK'))
+
+
+def fill_shared_memory_cache(path, offset):
+    cache = SharedMemoryResultCache(path, capacity=1024)
+    for n in range(50):
+        cache.set('%08d' % (offset + n), 'DK', VatNumberCheckResult(True))
+
+
+def count_shared_memory_cache_files(cache):
+    cache.get('54562519', 'DK')
+    sys.exit(count_open_files(cache.path))
+
+
+def count_open_files(path):
+    path = os.path.realpath(path)
+    return len([fd for fd in os.listdir('/proc/self/fd')
+                if os.path.realpath('/proc/self/fd/%s' % (fd)) == path])
+
+
+class SharedMemoryResultCacheTestCase(ResultCacheTestMixin, TestCase):
+    """Test case for :class:`SharedMemoryResultCache`.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.shm')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_cache(self, **kwargs):
+        kwargs.setdefault('capacity', 1024)
+        return SharedMemoryResultCache(self.path, **kwargs)
+
+    def test_oversized(self):
+        """SharedMemoryResultCache ignores results exceeding record fields
+        """
+
+        cache = self.create_cache()
+        cache.set('1', 'DK', VatNumberCheckResult(True,
+                                                  business_name=u'x' * 129))
+        cache.set('1' * 15, 'DK', VatNumberCheckResult(True))
+        self.assertIsNone(cache.get('1', 'DK'))
+        self.assertIsNone(cache.get('1' * 15, 'DK'))
+
+    def test_eviction(self):
+        """SharedMemoryResultCache evicts records when probing is exhausted
+        """
+
+        cache = self.create_cache(capacity=4)
+        for n in range(8):
+            cache.set(str(n), 'DK', VatNumberCheckResult(True))
+
+        cached = [cache.get(str(n), 'DK') for n in range(8)]
+        self.assertEqual(len([result for result in cached if result]), 4)
+        self.assertIsNotNone(cached[-1])
+
+    def test_processes(self):
+        """SharedMemoryResultCache shared between processes
+        """
+
+        cache = self.create_cache()
+        cache.set('54562519', 'DK', VatNumberCheckResult(True))
+        processes = [
+            multiprocessing.Process(target=fill_shared_memory_cache,
+                                    args=(self.path, offset))
+            for offset in range(0, 200, 50)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        for n in range(200):
+            self.assertIsNotNone(cache.get('%08d' % (n), 'DK'))
+        self.assertIsNotNone(cache.get('54562519', 'DK'))
+
+    @skipUnless(os.path.isdir('/proc/self/fd'), 'requires /proc')
+    def test_fork(self):
+        """SharedMemoryResultCache releases files inherited when forked
+        """
+
+        cache = self.create_cache()
+        cache.set('54562519', 'DK', VatNumberCheckResult(True))
+        open_files = count_open_files(self.path)
+
+        process = multiprocessing.get_context('fork').Process(
+            target=count_shared_memory_cache_files,
+            args=(cache, )
+        )
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, open_files)
+
+
+class CheckVatNumberCacheTestCase(RecordingRegistryMixin, TestCase):
+    """Test case for :func:`check_vat_number` with a result cache.
+    """
+
+    def setUp(self):
+        super(CheckVatNumberCacheTestCase, self).setUp()
+        pyvat.VAT_RESULT_CACHE = MemoryResultCache()
+
+    def tearDown(self):
+        pyvat.VAT_RESULT_CACHE = None
+        super(CheckVatNumberCacheTestCase, self).tearDown()
+
+    def test_cached(self):
+        """check_vat_number() consults VAT_RESULT_CACHE
+        """
+
+        self.assertTrue(check_vat_number('DK12345671').is_valid)
+        self.assertTrue(check_vat_number('DK 1234 5671').is_valid)
+        self.assertTrue(check_vat_number('12345671', 'DK').is_valid)
+        self.assertEqual(len(self.registry.checks), 1)
+
+        check_vat_number('EL123456781')
+        check_vat_number('GR123456781')
+        self.assertEqual(len(self.registry.checks), 2)
+
+        check_vat_number('DK12345671', test=True)
+        self.assertEqual(len(self.registry.checks), 3)
+
+    def test_fields(self):
+        """check_vat_number() only caches results with all fields
+        """
+
+        result = check_vat_number('DK12345671', fields=())
+        self.assertTrue(result.is_valid)
+        self.assertIsNone(result.business_name)
+        self.assertEqual(len(self.registry.checks), 1)
+
+        result = check_vat_number('DK12345671')
+        self.assertEqual(result.business_name, u'Business 12345671')
+        self.assertEqual(len(self.registry.checks), 2)
+
+        result = check_vat_number('DK12345671', fields=())
+        self.assertTrue(result.is_valid)
+        self.assertIsNone(result.business_name)
+        result = check_vat_number('DK12345671', fields=['business_name'])
+        self.assertEqual(result.business_name, u'Business 12345671')
+        self.assertEqual(len(self.registry.checks), 2)
+
+        with self.assertRaises(ValueError):
+            check_vat_number('DK12345671', fields=('business_phone', ))
+
+    def test_hooks(self):
+        """check_vat_number() reports cache hits to registry hooks
+        """
+
+        hooks = RecordingHooks()
+        self.registry.hooks.append(hooks)
+
+        check_vat_number('DK12345671')
+        self.assertEqual(hooks.names, [])
+
+        check_vat_number('DK12345671')
+        self.assertEqual(hooks.names, ['cache_hit'])
+        event = hooks.events[0][1]
+        self.assertEqual(event.registry, 'RecordingRegistry')
+        self.assertEqual(event.vat_number, '12345671')
+        self.assertEqual(event.country_code, 'DK')
+        self.assertIs(event.is_valid, True)
+        self.assertIsNone(event.attempt)
+        self.assertGreaterEqual(event.duration, 0)
+
+    def test_revalidation(self):
+        """check_vat_number() revalidates stale results in the background
+        """
+
+        pyvat.VAT_RESULT_CACHE = MemoryResultCache(valid_ttl=0.2,
+                                                   stale_ttl=60)
+        self.registry.delay = 0.2
+        self.assertTrue(check_vat_number('DK12345671').is_valid)
+        self.assertEqual(len(self.registry.checks), 1)
+
+        time.sleep(0.25)
+        started_at = time.monotonic()
+        result = check_vat_number('DK12345671')
+        self.assertLess(time.monotonic() - started_at, 0.1)
+        self.assertTrue(result.is_valid)
+        self.assertIn('> Result is due for revalidation, revalidating in '
+                      'the background', result.log_lines)
+
+        result = check_vat_number('DK12345671')
+        self.assertTrue(result.is_valid)
+        self.assertEqual(len(result.log_lines), 1)
+
+        self.assertTrue(wait_for(
+            lambda: not pyvat.VAT_RESULT_CACHE.lookup('12345671', 'DK')[1]
+        ))
+        self.assertEqual(len(check_vat_number('DK12345671').log_lines), 1)
+        self.assertEqual(len(self.registry.checks), 2)
+        self.assertEqual(pyvat.VAT_RESULT_CACHE.refreshes, 1)
+
+
+class CheckVatNumberRegistryCacheTestCase(StandInServerMixin, TestCase):
+    """Test case for caching the results of registry checks.
+    """
+
+    def setUp(self):
+        super(CheckVatNumberRegistryCacheTestCase, self).setUp()
+        self.registry = pyvat.VAT_REGISTRIES['GB']
+        pyvat.VAT_REGISTRIES['GB'] = self.create_hmrc_registry()
+        pyvat.VAT_RESULT_CACHE = MemoryResultCache()
+
+        # Never share checks still in flight from other tests.
+        self.registry_checks = pyvat._REGISTRY_CHECKS
+        pyvat._REGISTRY_CHECKS = SingleFlight()
+
+    def tearDown(self):
+        # Let background revalidations finish before the server stops.
+        executor = pyvat.VAT_RESULT_CACHE._refresh_executor
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+        pyvat._REGISTRY_CHECKS = self.registry_checks
+        pyvat.VAT_RESULT_CACHE = None
+        pyvat.VAT_REGISTRIES['GB'] = self.registry
+        super(CheckVatNumberRegistryCacheTestCase, self).tearDown()
+
+    def test_server_error(self):
+        """check_vat_number() does not cache server errors as invalid
+        """
+
+        self.server.set_response('GB553557881', [503, 503, False])
+        self.assertIsNone(check_vat_number('GB553557881').is_valid)
+        self.assertIsNone(check_vat_number('GB553557881').is_valid)
+        self.assertIsNone(pyvat.VAT_RESULT_CACHE.get('553557881', 'GB'))
+
+        self.assertIs(check_vat_number('GB553557881').is_valid, False)
+        self.assertIs(check_vat_number('GB553557881').is_valid, False)
+        self.assertEqual(self.server.request_counts[testing.HMRC], 3)
+
+    def test_failed_revalidation(self):
+        """check_vat_number() keeps valid results when revalidation fails
+        """
+
+        pyvat.VAT_RESULT_CACHE = MemoryResultCache(valid_ttl=1,
+                                                   refresh_ahead=0.5)
+        self.server.set_response('GB553557881', [CREDITE_SBERGER_DONAL, 503])
+        self.assertTrue(check_vat_number('GB553557881').is_valid)
+
+        time.sleep(0.6)
+        result = check_vat_number('GB553557881')
+        self.assertTrue(result.is_valid)
+        self.assertIn('> Result is due for revalidation, revalidating in '
+                      'the background', result.log_lines)
+        self.assertTrue(wait_for(
+            lambda: self.server.request_counts[testing.HMRC] == 2 and
+            not pyvat.VAT_RESULT_CACHE._refreshing
+        ))
+
+        result = pyvat.VAT_RESULT_CACHE.get('553557881', 'GB')
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.business_name, 'Credite Sberger Donal Inc.')
+
+        # The result is not revalidated again right away.
+        result = check_vat_number('GB553557881')
+        self.assertTrue(result.is_valid)
+        self.assertEqual(len(result.log_lines), 1)
+        self.assertEqual(self.server.request_counts[testing.HMRC], 2)
+
+
+__all__ = (
+    'MemoryResultCacheTestCase',
+    'SQLiteResultCacheTestCase',
+    'SharedMemoryResultCacheTestCase',
+    'CheckVatNumberCacheTestCase',
+    'CheckVatNumberRegistryCacheTestCase',
+)
@@ -0,0 +1,196 @@
+import pyvat
+from pyvat import check_vat_number
+from pyvat.cache import MemoryResultCache
+from pyvat.exceptions import ServerError
+from pyvat.metrics import CONTENT_TYPE, Histogram, Metrics
+from pyvat.retry import RetryPolicy
+from unittest2 import TestCase
+
+from .test_registries import StandInServerMixin
+
+
+class HistogramTestCase(TestCase):
+    """Test case for :class:`Histogram`.
+    """
+
+    def test_observe(self):
+        """Histogram.observe()
+        """
+
+        histogram = Histogram((0.1, 1, 10))
+        for value in (0.05, 0.1, 0.5, 0.5, 5, 50):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.count, 6)
+        self.assertAlmostEqual(histogram.sum, 56.15)
+        self.assertEqual(histogram.get_cumulative_counts(), [
+            (0.1, 2),
+            (1, 4),
+            (10, 5),
+            (float('inf'), 6),
+        ])
+
+    def test_quantiles(self):
+        """Histogram.get_quantile()
+        """
+
+        histogram = Histogram((1, 2, 4))
+        self.assertIsNone(histogram.get_quantile(0.5))
+
+        for value in (0.5, 1.5, 1.5, 3):
+            histogram.observe(value)
+        self.assertAlmostEqual(histogram.get_quantile(0.25), 1)
+        self.assertAlmostEqual(histogram.get_quantile(0.5), 1.5)
+        self.assertAlmostEqual(histogram.get_quantile(1), 4)
+
+        histogram.observe(100)
+        self.assertEqual(histogram.get_quantile(1), 4)
+
+
+class MetricsTestCase(StandInServerMixin, TestCase):
+    """Test case for :class:`Metrics`.
+    """
+
+    def setUp(self):
+        super(MetricsTestCase, self).setUp()
+        self.metrics = Metrics()
+        self.registries = dict(pyvat.VAT_REGISTRIES)
+        self.vies_registry = self.create_vies_registry(
+            hooks=[self.metrics],
+            retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01),
+        )
+        self.hmrc_registry = self.create_hmrc_registry(hooks=[self.metrics])
+        for country_code, registry in self.registries.items():
+            pyvat.VAT_REGISTRIES[country_code] = \
+                self.hmrc_registry if country_code == 'GB' \
+                else self.vies_registry
+        pyvat.VAT_METRICS = self.metrics
+
+    def tearDown(self):
+        pyvat.VAT_METRICS = None
+        pyvat.VAT_RESULT_CACHE = None
+        pyvat.VAT_REGISTRIES.clear()
+        pyvat.VAT_REGISTRIES.update(self.registries)
+        super(MetricsTestCase, self).tearDown()
+
+    def get_values(self, snapshot, name):
+        return dict((tuple(sorted(sample['labels'].values())),
+                     sample['value'])
+                    for sample in snapshot[name])
+
+    def test_registry_metrics(self):
+        """Metrics as registry hooks
+        """
+
+        self.assertTrue(check_vat_number('DK54562519').is_valid)
+        self.assertTrue(check_vat_number('DK11111111').is_valid)
+        self.assertFalse(check_vat_number('DK22222222').is_valid)
+        self.assertIsNone(check_vat_number('DK99999999').is_valid)
+        with self.assertRaises(ServerError):
+            check_vat_number('DK00000000')
+        self.assertTrue(check_vat_number('GB553557881').is_valid)
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(
+            self.get_values(snapshot, 'pyvat_registry_requests_total'),
+            {('DK', 'vies'): 9, ('GB', 'hmrc'): 1}
+        )
+        self.assertEqual(
+            self.get_values(snapshot, 'pyvat_registry_retries_total'),
+            {('DK', 'vies'): 4}
+        )
+        self.assertEqual(
+            self.get_values(snapshot, 'pyvat_registry_outcomes_total'),
+            {
+                ('DK', 'valid', 'vies'): 2,
+                ('DK', 'invalid', 'vies'): 1,
+                ('DK', 'nondeterministic', 'vies'): 3,
+                ('DK', 'MS_MAX_CONCURRENT_REQ', 'vies'): 2,
+                ('DK', 'MS_UNAVAILABLE', 'vies'): 1,
+                ('GB', 'hmrc', 'valid'): 1,
+            }
+        )
+
+        request_durations = snapshot[
+            'pyvat_registry_request_duration_seconds'
+        ]
+        self.assertEqual(
+            sorted(sample['labels']['registry']
+                   for sample in request_durations),
+            ['hmrc', 'vies']
+        )
+        for sample in request_durations:
+            self.assertEqual(sample['buckets'][-1][1], sample['count'])
+            self.assertGreater(sample['sum'], 0)
+            self.assertGreater(sample['p99'], 0)
+
+        check_durations = dict(
+            (sample['labels']['registry'], sample['count'])
+            for sample in snapshot['pyvat_check_duration_seconds']
+        )
+        self.assertEqual(check_durations, {'vies': 5, 'hmrc': 1})
+
+    def test_check_metrics(self):
+        """pyvat.VAT_METRICS
+        """
+
+        pyvat.VAT_RESULT_CACHE = MemoryResultCache()
+        self.assertIsNone(self.metrics.snapshot()['cache_hit_ratio'])
+
+        for _ in range(4):
+            check_vat_number('DK54562519')
+        check_vat_number('DK123')
+        check_vat_number('123456')
+        del pyvat.VAT_REGISTRIES['SE']
+        check_vat_number('SE123456789012')
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['cache_hit_ratio'], 0.75)
+        self.assertEqual(
+            self.get_values(snapshot, 'pyvat_cache_lookups_total'),
+            {('hit', ): 3, ('miss', ): 1}
+        )
+        self.assertEqual(
+            self.get_values(snapshot, 'pyvat_checks_skipped_total'),
+            {
+                ('invalid_format', ): 1,
+                ('undecomposable', ): 1,
+                ('no_registry', ): 1,
+            }
+        )
+
+        self.metrics.reset()
+        self.assertEqual(self.metrics.snapshot()['pyvat_checks_skipped_total'],
+                         [])
+
+    def test_render_text(self):
+        """Metrics.render_text()
+        """
+
+        self.assertEqual(CONTENT_TYPE,
+                         'text/plain; version=0.0.4; charset=utf-8')
+        check_vat_number('DK54562519')
+        check_vat_number('DK123')
+        text = self.metrics.render_text()
+        lines = text.splitlines()
+
+        self.assertTrue(text.endswith('\n'))
+        self.assertIn('# TYPE pyvat_registry_requests_total counter', lines)
+        self.assertIn('pyvat_registry_requests_total{registry="vies",'
+                      'country_code="DK"} 1', lines)
+        self.assertIn('pyvat_checks_skipped_total{reason="invalid_format"} 1',
+                      lines)
+        self.assertIn('# TYPE pyvat_registry_request_duration_seconds '
+                      'histogram', lines)
+        self.assertIn('pyvat_registry_request_duration_seconds_bucket{'
+                      'registry="vies",country_code="DK",le="+Inf"} 1', lines)
+        self.assertIn('pyvat_registry_request_duration_seconds_count{'
+                      'registry="vies",country_code="DK"} 1', lines)
+        self.assertIn('pyvat_registry_parse_duration_seconds_bucket{'
+                      'registry="vies",le="10"} 1', lines)
+
+
+__all__ = (
+    'HistogramTestCase',
+    'MetricsTestCase',
+)
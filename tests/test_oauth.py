@@ -0,0 +1,229 @@
+import threading
+import time
+
+import requests
+
+from pyvat import testing
+from pyvat.exceptions import TokenError
+from pyvat.oauth import ClientCredentialsTokenManager
+from unittest2 import TestCase
+
+from .test_registries import StandInServerMixin
+
+
+class ClientCredentialsTokenManagerTestCase(StandInServerMixin, TestCase):
+    """Test case for :class:`ClientCredentialsTokenManager`.
+    """
+
+    def create_token_manager(self, **kwargs):
+        return ClientCredentialsTokenManager(self.server.token_url,
+                                             'client-id',
+                                             'client-secret',
+                                             **kwargs)
+
+    def test_get_token(self):
+        """ClientCredentialsTokenManager.get_token() caches tokens
+        """
+
+        token_manager = self.create_token_manager()
+        self.assertIsNone(token_manager.get_cached_token())
+        self.assertEqual(token_manager.get_token(), 'token-1')
+        self.assertEqual(token_manager.get_token(), 'token-1')
+        self.assertEqual(token_manager.get_cached_token(), 'token-1')
+        self.assertEqual(self.server.request_counts[testing.TOKEN], 1)
+
+        self.assertEqual(token_manager.refresh(), 'token-2')
+        self.assertEqual(token_manager.get_token(), 'token-2')
+
+    def test_concurrent_requests(self):
+        """ClientCredentialsTokenManager.get_token() coalesces token requests
+        """
+
+        self.server.token_delay = 0.1
+        token_manager = self.create_token_manager()
+        tokens = []
+        threads = [threading.Thread(target=lambda: tokens.append(
+            token_manager.get_token())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(tokens, ['token-1'] * 8)
+        self.assertEqual(self.server.request_counts[testing.TOKEN], 1)
+
+    def test_refresh_in_background(self):
+        """ClientCredentialsTokenManager.get_token() refreshes ahead of expiry
+        """
+
+        self.server.token_delay = 0.1
+        self.server.token_expires_in = 1
+        token_manager = self.create_token_manager(refresh_margin=0.5)
+        self.assertEqual(token_manager.get_token(), 'token-1')
+
+        # Tokens due for refresh are handed out while refreshing.
+        time.sleep(0.45)
+        started = time.monotonic()
+        self.assertEqual(token_manager.get_token(), 'token-1')
+        self.assertEqual(token_manager.get_token(), 'token-1')
+        self.assertLess(time.monotonic() - started, 0.05)
+
+        time.sleep(0.2)
+        self.assertEqual(self.server.request_counts[testing.TOKEN], 2)
+        self.assertEqual(token_manager.get_cached_token(), 'token-2')
+
+    def test_short_lived_tokens(self):
+        """ClientCredentialsTokenManager refreshes short-lived tokens halfway
+        """
+
+        self.server.token_expires_in = 0.4
+        token_manager = self.create_token_manager()
+        self.assertEqual(token_manager.get_token(), 'token-1')
+        for _ in range(10):
+            self.assertEqual(token_manager.get_token(), 'token-1')
+        self.assertEqual(self.server.request_counts[testing.TOKEN], 1)
+
+        time.sleep(0.25)
+        self.assertEqual(token_manager.get_token(), 'token-1')
+        time.sleep(0.1)
+        self.assertEqual(self.server.request_counts[testing.TOKEN], 2)
+        self.assertEqual(token_manager.get_cached_token(), 'token-2')
+
+    def test_session(self):
+        """ClientCredentialsTokenManager(session=..)
+        """
+
+        token_manager = self.create_token_manager()
+        self.assertIs(token_manager.session, token_manager.session)
+
+        session = requests.Session()
+        token_manager = self.create_token_manager(session=session)
+        self.assertIs(token_manager.session, session)
+        self.assertEqual(token_manager.get_token(), 'token-1')
+
+    def test_start_refreshing(self):
+        """ClientCredentialsTokenManager.start_refreshing()
+        """
+
+        self.server.token_expires_in = 1.5
+        token_manager = self.create_token_manager(refresh_margin=0.5)
+        token_manager.start_refreshing()
+        try:
+            time.sleep(0.1)
+            self.assertEqual(token_manager.get_cached_token(), 'token-1')
+            time.sleep(1.1)
+            self.assertEqual(token_manager.get_cached_token(), 'token-2')
+        finally:
+            token_manager.stop_refreshing()
+
+    def test_errors(self):
+        """ClientCredentialsTokenManager.get_token() with failing requests
+        """
+
+        self.server.token_status = 401
+        token_manager = self.create_token_manager()
+        with self.assertRaises(TokenError):
+            token_manager.get_token()
+
+        token_manager = ClientCredentialsTokenManager('http://127.0.0.1:1/',
+                                                      'client-id',
+                                                      'client-secret')
+        with self.assertRaises(TokenError):
+            token_manager.get_token()
+
+    def test_invalidate(self):
+        """ClientCredentialsTokenManager.invalidate()
+        """
+
+        token_manager = self.create_token_manager()
+        token_manager.get_token()
+        token_manager.invalidate('token-0')
+        self.assertEqual(token_manager.get_cached_token(), 'token-1')
+        token_manager.invalidate('token-1')
+        self.assertIsNone(token_manager.get_cached_token())
+        self.assertEqual(token_manager.get_token(), 'token-2')
+
+
+class RevokedTokens(set):
+    """Tokens of a stand-in server revoking tokens as soon as issued.
+    """
+
+    def add(self, token):
+        pass
+
+
+class HMRCRegistryTokenTestCase(StandInServerMixin, TestCase):
+    """Test case for checks against version 2.0 of the HMRC API.
+    """
+
+    def create_registry(self):
+        token_manager = ClientCredentialsTokenManager(self.server.token_url,
+                                                      'client-id',
+                                                      'client-secret')
+        return self.create_hmrc_registry(token_manager=token_manager)
+
+    def test_check(self):
+        """HMRCRegistry.check_vat_number() with a token manager
+        """
+
+        registry = self.create_registry()
+        for _ in range(3):
+            result = registry.check_vat_number('553557881', 'GB', False)
+            self.assertTrue(result.is_valid)
+            self.assertEqual(result.business_name,
+                             'Credite Sberger Donal Inc.')
+
+        result = self.run_async(
+            registry.check_vat_number_async('553557881', 'GB', False)
+        )
+        self.assertTrue(result.is_valid)
+        self.assertEqual(self.server.request_counts[testing.TOKEN], 1)
+
+    def test_rejected_token(self):
+        """HMRCRegistry.check_vat_number() discards rejected tokens
+        """
+
+        registry = self.create_registry()
+        self.assertTrue(
+            registry.check_vat_number('553557881', 'GB', False).is_valid
+        )
+
+        # Rejected tokens are replaced by a new token once.
+        self.server.tokens.clear()
+        result = registry.check_vat_number('553557881', 'GB', False)
+        self.assertTrue(result.is_valid)
+        self.assertIn(u'< Access token rejected, retrying with a new token',
+                      result.log_lines)
+        self.assertEqual(registry.token_manager.get_cached_token(), 'token-2')
+        self.assertEqual(self.server.request_counts[testing.TOKEN], 2)
+        self.assertEqual(self.server.request_counts[testing.HMRC], 3)
+
+        self.server.tokens = RevokedTokens()
+        result = self.run_async(
+            registry.check_vat_number_async('553557881', 'GB', False)
+        )
+        self.assertIsNone(result.is_valid)
+        self.assertIsNone(registry.token_manager.get_cached_token())
+        self.assertEqual(self.server.request_counts[testing.TOKEN], 3)
+
+        result = registry.check_vat_number('553557881', 'GB', False)
+        self.assertIsNone(result.is_valid)
+        self.assertEqual(self.server.request_counts[testing.TOKEN], 5)
+        self.assertEqual(self.server.request_counts[testing.HMRC], 7)
+
+    def test_token_error(self):
+        """HMRCRegistry.check_vat_number() without an access token
+        """
+
+        self.server.token_status = 500
+        result = self.create_registry().check_vat_number('553557881',
+                                                         'GB',
+                                                         False)
+        self.assertIsNone(result.is_valid)
+        self.assertIn(u'Unable to obtain access token', result.log_lines[-1])
+
+
+__all__ = (
+    'ClientCredentialsTokenManagerTestCase',
+    'HMRCRegistryTokenTestCase',
+)
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+
+from pyvat.circuit_breaker import CircuitBreaker, CircuitBreakers
+from pyvat.exceptions import RateLimitError
+from pyvat.rate_limit import RateLimiter, TokenBucket
+from pyvat.retry import RetryPolicy
+from unittest2 import TestCase
+
+from .test_registries import StandInServerMixin
+
+
+class TokenBucketTestCase(TestCase):
+    """Test case for :class:`TokenBucket`.
+    """
+
+    def test_reserve(self):
+        """TokenBucket.reserve()
+        """
+
+        bucket = TokenBucket(10, capacity=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.01)
+        self.assertIsNone(bucket.reserve(timeout=0.15))
+        self.assertAlmostEqual(bucket.reserve(timeout=0.25), 0.2, delta=0.01)
+
+        bucket.cancel()
+        self.assertAlmostEqual(bucket.reserve(), 0.2, delta=0.01)
+
+
+class RateLimiterTestCase(StandInServerMixin, TestCase):
+    """Test case for :class:`RateLimiter`.
+    """
+
+    def test_fail_fast(self):
+        """RateLimiter(timeout=0)
+        """
+
+        limiter = RateLimiter(rate=100, key_rates={'DK': (1, 1)}, timeout=0)
+        limiter.acquire('DK')
+        limiter.acquire('SE')
+        with self.assertRaises(RateLimitError) as context:
+            limiter.acquire('DK')
+        self.assertEqual(context.exception.key, 'DK')
+
+        limiter = RateLimiter(rate=1, timeout=0)
+        limiter.acquire('DK')
+        with self.assertRaises(RateLimitError) as context:
+            limiter.acquire('SE')
+        self.assertIsNone(context.exception.key)
+
+    def test_blocking(self):
+        """RateLimiter.acquire() blocks and exposes its queue depth
+        """
+
+        limiter = RateLimiter(key_rates={'DK': (20, 1)})
+        depths = []
+
+        def acquire():
+            limiter.acquire('DK')
+
+        threads = [threading.Thread(target=acquire) for _ in range(5)]
+        started_at = time.time()
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        depths.append(limiter.get_queue_depth('DK'))
+        for thread in threads:
+            thread.join()
+
+        self.assertGreaterEqual(time.time() - started_at, 0.19)
+        self.assertGreater(depths[0], 0)
+        self.assertEqual(limiter.queue_depth, 0)
+
+    def test_async(self):
+        """RateLimiter.acquire_async()
+        """
+
+        limiter = RateLimiter(rate=20, capacity=1, timeout=1)
+
+        async def acquire():
+            await asyncio.gather(*[limiter.acquire_async('DK')
+                                   for _ in range(5)])
+
+        started_at = time.time()
+        self.run_async(acquire())
+        self.assertGreaterEqual(time.time() - started_at, 0.19)
+
+    def test_registry(self):
+        """Registry(rate_limiter=..)
+        """
+
+        registry = self.create_vies_registry(
+            rate_limiter=RateLimiter(key_rates={'DK': 1}, timeout=0)
+        )
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'DK', False).is_valid
+        )
+        with self.assertRaises(RateLimitError):
+            registry.check_vat_number('54562519', 'DK', False)
+        self.assertEqual(self.vies_requests, 1)
+
+        with self.assertRaises(RateLimitError):
+            self.run_async(
+                registry.check_vat_number_async('54562519', 'DK', False)
+            )
+
+    def test_registry_circuit_breaker(self):
+        """Registry(rate_limiter=..) with open circuit breakers
+        """
+
+        limiter = RateLimiter(key_rates={'DK': 1}, timeout=0)
+        registry = self.create_vies_registry(
+            rate_limiter=limiter,
+            circuit_breakers=CircuitBreakers(recovery_timeout=0.1)
+        )
+        breaker = registry.circuit_breakers['DK']
+        breaker.force_open()
+        for _ in range(3):
+            self.assertIsNone(
+                registry.check_vat_number('54562519', 'DK', False).is_valid
+            )
+
+        # Half-open breakers let another request through if rate limited.
+        time.sleep(0.1)
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'DK', False).is_valid
+        )
+        breaker.force_open(0)
+        with self.assertRaises(RateLimitError):
+            registry.check_vat_number('54562519', 'DK', False)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(self.vies_requests, 1)
+
+    def test_registry_deadline(self):
+        """Registry(rate_limiter=.., retry_policy=..) honors the deadline
+        """
+
+        registry = self.create_vies_registry(
+            rate_limiter=RateLimiter(key_rates={'DK': 1}),
+            retry_policy=RetryPolicy(deadline=0.2)
+        )
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'DK', False).is_valid
+        )
+
+        started_at = time.monotonic()
+        with self.assertRaises(RateLimitError):
+            registry.check_vat_number('54562519', 'DK', False)
+        self.assertLess(time.monotonic() - started_at, 0.1)
+        self.assertEqual(self.vies_requests, 1)
+
+
+__all__ = ('TokenBucketTestCase', 'RateLimiterTestCase', )
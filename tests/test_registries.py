@@ -0,0 +1,1191 @@
+import asyncio
+import collections
+import threading
+import time
+
+import requests
+
+from pyvat import aio, check_vat_number_async, testing
+from pyvat.circuit_breaker import CircuitBreaker, CircuitBreakers
+from pyvat.exceptions import ServerError
+from pyvat.hedging import HedgingPolicy
+from pyvat.hooks import RegistryHooks
+from pyvat.registries import ViesRegistry, ViesRestRegistry, HMRCRegistry
+from pyvat.retry import RetryPolicy, TIMEOUT
+from pyvat.result import (
+    LOG_FULL,
+    LOG_LINES_OMITTED,
+    LOG_OFF,
+    LOG_SUMMARY,
+    VatNumberCheckResult,
+)
+from pyvat.testing import StandInServer
+from pyvat.xml_utils import NodeNotFoundError
+from unittest2 import TestCase, skipUnless
+from xml.parsers.expat import ExpatError
+
+VIES_RESPONSE = (
+    u'<env:Envelope xmlns:env="http://schemas.xmlsoap.org/soap/envelope/">'
+    u'<env:Header/><env:Body><ns2:checkVatResponse xmlns:ns2="urn:ec.europa.'
+    u'eu:taxud:vies:services:checkVat:types"><ns2:countryCode>DK</ns2:countr'
+    u'yCode><ns2:vatNumber>54562519</ns2:vatNumber><ns2:requestDate>2022-08-'
+    u'12+02:00</ns2:requestDate><ns2:valid>true</ns2:valid><ns2:name>Lego A/'
+    u'S</ns2:name><ns2:address>\u00c5stvej 1\n7190 Billund</ns2:address></n'
+    u's2:checkVatResponse></env:Body></env:Envelope>'
+)
+"""Canned VIES response for a valid VAT number.
+"""
+
+VIES_FAULT_RESPONSE = (
+    u'<env:Envelope xmlns:env="http://schemas.xmlsoap.org/soap/envelope/">'
+    u'<env:Header/><env:Body><env:Fault><faultcode>env:Server</faultcode>'
+    u'<faultstring>%s</faultstring></env:Fault></env:Body>'
+    u'</env:Envelope>'
+)
+"""Canned VIES fault response template.
+"""
+
+LEGO = {
+    'name': u'Lego A/S',
+    'address': u'\u00c5stvej 1\n7190 Billund',
+}
+"""Stand-in response for a valid Danish VAT number.
+"""
+
+CREDITE_SBERGER_DONAL = {
+    'name': 'Credite Sberger Donal Inc.',
+    'address': collections.OrderedDict([
+        ('line1', '131B Barton Hamlet'),
+        ('postcode', 'SW97 5CK'),
+        ('countryCode', 'GB'),
+    ]),
+}
+"""Stand-in response for a valid UK VAT number.
+"""
+
+
+class StandInServerMixin(object):
+    """Mixin running a local stand-in registry server during each test.
+    """
+
+    def setUp(self):
+        self.server = StandInServer(default_response=LEGO).start()
+        self.server.set_response('DK00000000', 'MS_UNAVAILABLE')
+        self.server.set_response('DK11111111', [
+            'MS_MAX_CONCURRENT_REQ',
+            'MS_MAX_CONCURRENT_REQ',
+            LEGO,
+        ])
+        self.server.set_response('DK22222222', False)
+        self.server.set_response('DK99999999', 503)
+        self.server.set_response('GB123456789', False)
+        self.server.set_response('GB429429429', 429)
+        self.server.set_response('GB553557881', CREDITE_SBERGER_DONAL)
+
+    def tearDown(self):
+        self.server.stop()
+
+    @property
+    def vies_requests(self):
+        return self.server.request_counts[testing.VIES] + \
+            self.server.request_counts[testing.VIES_REST]
+
+    def create_vies_registry(self, **kwargs):
+        return self.server.configure(ViesRegistry(**kwargs))
+
+    def create_vies_rest_registry(self, **kwargs):
+        return self.server.configure(ViesRestRegistry(**kwargs))
+
+    def create_hmrc_registry(self, **kwargs):
+        return self.server.configure(HMRCRegistry(**kwargs))
+
+    def run_async(self, coroutine):
+        """Run a coroutine to completion on a new event loop.
+
+        The client session shared on the event loop is closed afterwards.
+        """
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.run_until_complete(aio.close_client_session())
+            loop.close()
+
+
+class RecordingHooks(RegistryHooks):
+    """Registry hooks recording the events emitted.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def on_request_start(self, event):
+        self.events.append(('request_start', event))
+
+    def on_response(self, event):
+        self.events.append(('response', event))
+
+    def on_parse_done(self, event):
+        self.events.append(('parse_done', event))
+
+    def on_error(self, event):
+        self.events.append(('error', event))
+
+    def on_cache_hit(self, event):
+        self.events.append(('cache_hit', event))
+
+    @property
+    def names(self):
+        return [name for name, _ in self.events]
+
+
+class RegistrySessionTestCase(StandInServerMixin, TestCase):
+    """Test case for the pooled HTTP sessions of registries.
+    """
+
+    def test_session_is_shared(self):
+        """Registry.session is created once and shared between threads
+        """
+
+        registry = ViesRegistry()
+        sessions = []
+        threads = [threading.Thread(target=lambda: sessions.append(
+            registry.session)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(id(session) for session in sessions)), 1)
+        registry.close()
+        self.assertIsNot(registry.session, sessions[0])
+
+    def test_configuration(self):
+        """Registry(pool_size=.., keep_alive=.., connect_timeout=..)
+        """
+
+        registry = HMRCRegistry(pool_size=3,
+                                keep_alive=False,
+                                connect_timeout=1,
+                                read_timeout=2)
+        self.assertEqual(registry.timeout, (1, 2))
+        self.assertEqual(registry.session.headers['Connection'], 'close')
+        adapter = registry.session.get_adapter('https://example.com/')
+        self.assertEqual(adapter._pool_maxsize, 3)
+
+        self.assertEqual(ViesRegistry().timeout,
+                         (ViesRegistry.DEFAULT_CONNECT_TIMEOUT,
+                          ViesRegistry.DEFAULT_TIMEOUT))
+
+    def test_warm_up(self):
+        """Registry.warm_up()
+        """
+
+        registry = self.create_vies_registry(pool_size=2)
+        self.assertEqual(registry.warm_up(connections=5), 2)
+        self.assertEqual(self.server.request_counts[testing.HEAD], 2)
+
+    @skipUnless(hasattr(asyncio, 'run'), 'requires asyncio.run()')
+    def test_client_sessions_of_closed_loops(self):
+        """aio.get_client_session() discards sessions of closed event loops
+        """
+
+        registry = self.create_vies_registry()
+        for _ in range(3):
+            result = asyncio.run(
+                registry.check_vat_number_async('54562519', 'DK', False)
+            )
+            self.assertTrue(result.is_valid)
+            self.assertLessEqual(len(aio._client_sessions), 1)
+
+
+class RegistryCheckTestCase(StandInServerMixin, TestCase):
+    """Test case for checking VAT numbers against stand-in registries.
+    """
+
+    def assert_valid_vies_result(self, result):
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.business_name, u'Lego A/S')
+        self.assertEqual(result.business_address,
+                         u'\u00c5stvej 1\n7190 Billund')
+        self.assertEqual(result.business_country_code, u'DK')
+
+    def assert_valid_hmrc_result(self, result):
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.business_name, 'Credite Sberger Donal Inc.')
+        self.assertEqual(result.business_address,
+                         '131B Barton Hamlet, SW97 5CK, GB')
+
+    def test_vies(self):
+        """ViesRegistry.check_vat_number()
+        """
+
+        registry = self.create_vies_registry()
+        self.assert_valid_vies_result(
+            registry.check_vat_number('54562519', 'DK', False)
+        )
+
+    def test_hmrc(self):
+        """HMRCRegistry.check_vat_number()
+        """
+
+        registry = self.create_hmrc_registry()
+        self.assert_valid_hmrc_result(
+            registry.check_vat_number('553557881', 'GB', False)
+        )
+        self.assertFalse(
+            registry.check_vat_number('123456789', 'GB', False).is_valid
+        )
+
+    def test_fields(self):
+        """Registry.check_vat_number() with a subset of fields
+        """
+
+        for registry, vat_number, country_code in [
+            (self.create_vies_registry(), '54562519', 'DK'),
+            (self.create_hmrc_registry(), '553557881', 'GB'),
+        ]:
+            result = registry.check_vat_number(vat_number,
+                                               country_code,
+                                               False,
+                                               ('business_name', ))
+            self.assertTrue(result.is_valid)
+            self.assertIsNotNone(result.business_name)
+            self.assertIsNone(result.business_address)
+
+            result = self.run_async(registry.check_vat_number_async(
+                vat_number, country_code, False, ()
+            ))
+            self.assertTrue(result.is_valid)
+            self.assertIsNone(result.business_name)
+            self.assertIsNone(result.business_address)
+
+    def test_vies_async(self):
+        """ViesRegistry.check_vat_number_async()
+        """
+
+        registry = self.create_vies_registry()
+
+        async def check():
+            return await asyncio.gather(*[
+                registry.check_vat_number_async('54562519', 'DK', False)
+                for _ in range(20)
+            ])
+
+        for result in self.run_async(check()):
+            self.assert_valid_vies_result(result)
+
+    def test_hmrc_async(self):
+        """HMRCRegistry.check_vat_number_async()
+        """
+
+        registry = self.create_hmrc_registry()
+        self.assert_valid_hmrc_result(self.run_async(
+            registry.check_vat_number_async('553557881', 'GB', False)
+        ))
+
+    def test_check_vat_number_async(self):
+        """check_vat_number_async() with an invalid VAT number format
+        """
+
+        result = self.run_async(check_vat_number_async('DK99999O99'))
+        self.assertIs(result.is_valid, False)
+
+    def test_async_timeout(self):
+        """ViesRegistry.check_vat_number_async() with unreachable registry
+        """
+
+        registry = ViesRegistry(connect_timeout=0.5)
+        registry.CHECK_VAT_SERVICE_URL = 'http://127.0.0.1:1/vies'
+        result = self.run_async(
+            registry.check_vat_number_async('54562519', 'DK', False)
+        )
+        self.assertIsNone(result.is_valid)
+        self.assertIn(u'< Request failed with exception', result.log_lines[-1])
+
+
+class ViesRegistryContractTestMixin(StandInServerMixin):
+    """Contract test suite all VIES registry backends must pass.
+
+    Test cases define :meth:`create_registry`, creating the registry under
+    test against the stand-in server.
+    """
+
+    def create_registry(self, **kwargs):
+        raise NotImplementedError()
+
+    def assert_valid_result(self, result):
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.business_name, u'Lego A/S')
+        self.assertEqual(result.business_address,
+                         u'\u00c5stvej 1\n7190 Billund')
+        self.assertEqual(result.business_country_code, u'DK')
+
+    def test_valid(self):
+        """Registry.check_vat_number() with a valid VAT number
+        """
+
+        registry = self.create_registry()
+        self.assert_valid_result(
+            registry.check_vat_number('54562519', 'DK', False)
+        )
+        self.assert_valid_result(self.run_async(
+            registry.check_vat_number_async('54562519', 'DK', False)
+        ))
+
+    def test_invalid(self):
+        """Registry.check_vat_number() with an invalid VAT number
+        """
+
+        result = self.create_registry().check_vat_number('22222222',
+                                                         'DK',
+                                                         False)
+        self.assertIs(result.is_valid, False)
+
+    def test_fields(self):
+        """Registry.check_vat_number() with a subset of fields
+        """
+
+        registry = self.create_registry()
+        result = registry.check_vat_number('54562519', 'DK', False, ())
+        self.assertTrue(result.is_valid)
+        self.assertIsNone(result.business_name)
+        self.assertIsNone(result.business_address)
+        self.assertIsNone(result.business_country_code)
+
+        result = self.run_async(registry.check_vat_number_async(
+            '54562519', 'DK', False, ('business_address', )
+        ))
+        self.assertIsNone(result.business_name)
+        self.assertEqual(result.business_address,
+                         u'\u00c5stvej 1\n7190 Billund')
+
+    def test_fault(self):
+        """Registry.check_vat_number() raises faults
+        """
+
+        with self.assertRaises(ServerError) as context:
+            self.create_registry().check_vat_number('00000000', 'DK', False)
+        self.assertEqual(context.exception.fault_code, 'MS_UNAVAILABLE')
+
+        with self.assertRaises(ServerError) as context:
+            self.run_async(self.create_registry().check_vat_number_async(
+                '00000000', 'DK', False
+            ))
+        self.assertEqual(context.exception.fault_code, 'MS_UNAVAILABLE')
+
+    def test_nondeterministic(self):
+        """Registry.check_vat_number() with an unavailable service
+        """
+
+        result = self.create_registry().check_vat_number('99999999',
+                                                         'DK',
+                                                         False)
+        self.assertIsNone(result.is_valid)
+        self.assertIn(u'Response is nondeterministic', result.log_lines[-1])
+
+    def test_retries(self):
+        """Registry.check_vat_number() retries retryable faults
+        """
+
+        registry = self.create_registry(
+            retry_policy=RetryPolicy(max_attempts=3, base_delay=0)
+        )
+        self.assert_valid_result(
+            registry.check_vat_number('11111111', 'DK', False)
+        )
+        self.assertEqual(self.vies_requests, 3)
+
+    def test_circuit_breaker(self):
+        """Registry.check_vat_number() opens circuit breakers on faults
+        """
+
+        registry = self.create_registry(
+            circuit_breakers=CircuitBreakers(failure_threshold=2)
+        )
+        for _ in range(2):
+            with self.assertRaises(ServerError):
+                registry.check_vat_number('00000000', 'DK', False)
+        result = registry.check_vat_number('00000000', 'DK', False)
+        self.assertIsNone(result.is_valid)
+        self.assertEqual(self.vies_requests, 2)
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'SE', False).is_valid
+        )
+
+
+class ViesRegistryContractTestCase(ViesRegistryContractTestMixin, TestCase):
+    """Contract test case for :class:`ViesRegistry`.
+    """
+
+    def create_registry(self, **kwargs):
+        return self.create_vies_registry(**kwargs)
+
+
+class ViesRestRegistryContractTestCase(ViesRegistryContractTestMixin,
+                                       TestCase):
+    """Contract test case for :class:`ViesRestRegistry`.
+    """
+
+    def create_registry(self, **kwargs):
+        return self.create_vies_rest_registry(**kwargs)
+
+
+class ViesResponseParsingTestCase(TestCase):
+    """Test case for parsing VIES responses.
+    """
+
+    def process(self,
+                content,
+                content_type='text/xml; charset=utf-8',
+                fields=None):
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        registry = ViesRegistry()
+        return registry._process_response(VatNumberCheckResult(),
+                                          200,
+                                          content_type,
+                                          content,
+                                          registry._get_response_tags(fields))
+
+    def test_response(self):
+        """ViesRegistry._process_response() with a valid response
+        """
+
+        result = self.process(VIES_RESPONSE)
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.business_name, u'Lego A/S')
+        self.assertEqual(result.business_address,
+                         u'\u00c5stvej 1\n7190 Billund')
+        self.assertEqual(result.business_country_code, u'DK')
+        self.assertEqual(result.log_lines[1], VIES_RESPONSE)
+
+    def test_namespace_prefixes(self):
+        """ViesRegistry._process_response() with other namespace prefixes
+        """
+
+        result = self.process(
+            VIES_RESPONSE
+            .replace(u'env:', u'soap:')
+            .replace(u'xmlns:env', u'xmlns:soap')
+            .replace(u'ns2:', u'')
+            .replace(u'xmlns:ns2', u'xmlns')
+        )
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.business_name, u'Lego A/S')
+        self.assertEqual(result.business_country_code, u'DK')
+
+    def test_declared_encoding(self):
+        """ViesRegistry._process_response() with a declared encoding
+        """
+
+        result = self.process(
+            (u'<?xml version="1.0" encoding="ISO-8859-1"?>' +
+             VIES_RESPONSE).encode('iso-8859-1')
+        )
+        self.assertEqual(result.business_address,
+                         u'\u00c5stvej 1\n7190 Billund')
+
+    def test_stops_after_response(self):
+        """ViesRegistry._process_response() stops after the response element
+        """
+
+        result = self.process(VIES_RESPONSE.replace(u'</env:Envelope>',
+                                                    u'<trailing'))
+        self.assertTrue(result.is_valid)
+
+    def test_fields(self):
+        """ViesRegistry._process_response() with a subset of fields
+        """
+
+        # Parsing stops once the validity is read, ignoring the rest.
+        result = self.process(
+            VIES_RESPONSE.replace(u'<ns2:name>', u'<trailing'),
+            fields=()
+        )
+        self.assertTrue(result.is_valid)
+        self.assertIsNone(result.business_name)
+        self.assertIsNone(result.business_address)
+        self.assertIsNone(result.business_country_code)
+
+        result = self.process(VIES_RESPONSE, fields=('business_name', ))
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.business_name, u'Lego A/S')
+        self.assertIsNone(result.business_address)
+        self.assertIsNone(result.business_country_code)
+
+    def test_fault(self):
+        """ViesRegistry._process_response() with a fault
+        """
+
+        with self.assertRaises(ServerError) as context:
+            self.process(VIES_FAULT_RESPONSE % (u'MS_UNAVAILABLE'))
+        self.assertEqual(context.exception.fault_code, 'MS_UNAVAILABLE')
+
+        # Faults without a fault string raise with an empty fault code.
+        for content in [
+            VIES_FAULT_RESPONSE % (u''),
+            VIES_FAULT_RESPONSE.replace(u'<faultstring>%s</faultstring>',
+                                        u''),
+        ]:
+            with self.assertRaises(ServerError) as context:
+                self.process(content)
+            self.assertEqual(context.exception.fault_code, u'')
+
+    def test_nondeterministic(self):
+        """ViesRegistry._process_response() with nondeterministic responses
+        """
+
+        for content in [
+            VIES_RESPONSE.replace(u'true', u'maybe'),
+            VIES_RESPONSE.replace(u'ns2:valid', u'ns2:invalid'),
+            VIES_RESPONSE.replace(u'ns2:checkVatResponse',
+                                  u'ns2:checkVatRejection'),
+        ]:
+            result = self.process(content)
+            self.assertIsNone(result.is_valid)
+            self.assertIn(u'Response is nondeterministic',
+                          result.log_lines[-1])
+
+        result = self.process(VIES_RESPONSE, 'text/html')
+        self.assertIsNone(result.is_valid)
+
+    def test_malformed(self):
+        """ViesRegistry._process_response() with malformed bodies
+        """
+
+        with self.assertRaises(ExpatError):
+            self.process(u'<env:Envelope')
+        with self.assertRaises(ExpatError):
+            self.process(b'\xff\xfe')
+        with self.assertRaises(ValueError):
+            self.process(u'<html><body/></html>')
+        with self.assertRaises(NodeNotFoundError):
+            self.process(u'<env:Envelope xmlns:env="http://schemas.xmlsoap.o'
+                         u'rg/soap/envelope/"><env:Header/></env:Envelope>')
+
+
+class RegistryLoggingTestCase(StandInServerMixin, TestCase):
+    """Test case for logging of registry checks.
+    """
+
+    def test_levels(self):
+        """Registry log levels
+        """
+
+        registry = self.create_vies_registry()
+        result = registry.check_vat_number('54562519', 'DK', False)
+        self.assertEqual(result.log_lines, [
+            u'> POST %s with payload of content type text/xml; '
+            u'charset=utf-8' % (registry.CHECK_VAT_SERVICE_URL),
+            u'< Response with status 200 of content type text/xml; '
+            u'charset=utf-8',
+        ])
+
+        result = self.create_vies_registry(log_level=LOG_FULL) \
+            .check_vat_number('54562519', 'DK', False)
+        self.assertEqual(len(result.log_lines), 4)
+        self.assertIn(u'<ns0:vatNumber>54562519</ns0:vatNumber>',
+                      result.log_lines[1])
+        self.assertIn(u'<ns2:name>Lego A/S</ns2:name>', result.log_lines[3])
+
+        result = self.create_vies_registry(log_level=LOG_OFF) \
+            .check_vat_number('54562519', 'DK', False)
+        self.assertTrue(result.is_valid)
+        self.assertEqual(result.log_lines, [])
+
+    def test_limits(self):
+        """Registry log line and body size limits
+        """
+
+        result = self.create_hmrc_registry(log_level=LOG_FULL,
+                                           max_log_body_size=10) \
+            .check_vat_number('553557881', 'GB', False)
+        self.assertRegex(result.log_lines[-1],
+                         r'^\{"target":\.\.\. \(truncated from \d+\)$')
+
+        result = self.create_vies_registry(
+            max_log_lines=2,
+            retry_policy=RetryPolicy(max_attempts=3, base_delay=0),
+        ).check_vat_number('11111111', 'DK', False)
+        self.assertTrue(result.is_valid)
+        self.assertEqual(len(result.log_lines), 3)
+        self.assertEqual(result.log_lines[-1], LOG_LINES_OMITTED)
+
+    def test_lazy_formatting(self):
+        """VatNumberCheckResult.log() formats lines on access
+        """
+
+        class Argument(object):
+            formatted = 0
+
+            def __str__(self):
+                self.formatted += 1
+                return 'argument'
+
+        argument = Argument()
+        result = VatNumberCheckResult(log_level=LOG_SUMMARY)
+        result.log(LOG_SUMMARY, u'> Line with %s', argument)
+        result.log(LOG_FULL, u'> Line with %s', argument)
+        result.log(LOG_SUMMARY, u'> Line with 100%')
+        result.log(LOG_SUMMARY, u'> Line with %s', b'bytes')
+        self.assertEqual(argument.formatted, 0)
+
+        self.assertEqual(result.log_lines, [
+            u'> Line with argument',
+            u'> Line with 100%',
+            u'> Line with bytes',
+        ])
+        self.assertEqual(result.log_lines, [
+            u'> Line with argument',
+            u'> Line with 100%',
+            u'> Line with bytes',
+        ])
+        self.assertEqual(argument.formatted, 1)
+
+
+class CircuitBreakerTestCase(StandInServerMixin, TestCase):
+    """Test case for circuit breaking in :class:`ViesRegistry`.
+    """
+
+    def test_circuit_breaker(self):
+        """CircuitBreaker state transitions
+        """
+
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertTrue(breaker.is_degraded)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        time.sleep(0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow_request())
+        self.assertFalse(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertFalse(breaker.is_degraded)
+
+    def test_faults(self):
+        """ViesRegistry(circuit_breakers=..) opens on faults per member state
+        """
+
+        registry = self.create_vies_registry(
+            circuit_breakers=CircuitBreakers(failure_threshold=2)
+        )
+        for _ in range(2):
+            with self.assertRaises(ServerError):
+                registry.check_vat_number('00000000', 'DK', False)
+
+        result = registry.check_vat_number('54562519', 'DK', False)
+        self.assertIsNone(result.is_valid)
+        self.assertIn('circuit breaker for DK is open', result.log_lines[-1])
+        self.assertEqual(self.vies_requests, 2)
+
+        self.assertTrue(
+            registry.check_vat_number('12345678', 'SE', False).is_valid
+        )
+
+    def test_timeouts(self):
+        """ViesRegistry(circuit_breakers=..) opens on failed requests
+        """
+
+        registry = ViesRegistry(
+            circuit_breakers=CircuitBreakers(failure_threshold=1),
+            connect_timeout=0.5,
+        )
+        registry.CHECK_VAT_SERVICE_URL = 'http://127.0.0.1:1/vies'
+        registry.check_vat_number('54562519', 'DK', False)
+        self.assertEqual(registry.circuit_breakers['DK'].state,
+                         CircuitBreaker.OPEN)
+
+    def test_malformed_response(self):
+        """ViesRegistry(circuit_breakers=..) opens on malformed responses
+        """
+
+        self.server.recordings['vies:DK33333333'] = [200, 'text/xml', '<']
+        registry = self.create_vies_registry(
+            circuit_breakers=CircuitBreakers(failure_threshold=1)
+        )
+        with self.assertRaises(ExpatError):
+            registry.check_vat_number('33333333', 'DK', False)
+        self.assertEqual(registry.circuit_breakers['DK'].state,
+                         CircuitBreaker.OPEN)
+
+    def test_trial_without_content_type(self):
+        """ViesRegistry(circuit_breakers=..) trials without a content type
+        """
+
+        def post(*args):
+            response = requests.Response()
+            response.status_code = 502
+            response._content = b''
+            return response
+
+        registry = self.create_vies_registry(
+            circuit_breakers=CircuitBreakers(failure_threshold=1,
+                                             recovery_timeout=0.05)
+        )
+        breaker = registry.circuit_breakers['DK']
+        breaker.record_failure()
+        time.sleep(0.1)
+        registry._post = post
+
+        result = registry.check_vat_number('54562519', 'DK', False)
+        self.assertIsNone(result.is_valid)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        time.sleep(0.1)
+        del registry._post
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'DK', False).is_valid
+        )
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_status_polling(self):
+        """ViesRegistry.start_status_polling()
+        """
+
+        self.server.unavailable_countries.add('EL')
+        registry = self.create_vies_registry(
+            circuit_breakers=CircuitBreakers()
+        )
+        self.assertEqual(registry.update_status(), ['GR'])
+
+        registry.start_status_polling(interval=60)
+        registry.stop_status_polling()
+
+        result = registry.check_vat_number('123456789', 'GR', False)
+        self.assertIsNone(result.is_valid)
+        self.assertEqual(self.vies_requests, 0)
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'DK', False).is_valid
+        )
+
+
+class RetryPolicyTestCase(StandInServerMixin, TestCase):
+    """Test case for retrying registry checks.
+    """
+
+    def test_policy(self):
+        """RetryPolicy.get_delay()
+        """
+
+        policy = RetryPolicy(max_attempts=4,
+                             base_delay=1,
+                             max_delay=3,
+                             jitter=False)
+        self.assertEqual(policy.get_delay(1, 503, None), 1)
+        self.assertEqual(policy.get_delay(2, 503, None), 2)
+        self.assertEqual(policy.get_delay(3, TIMEOUT, None), 3)
+        self.assertIsNone(policy.get_delay(4, 503, None))
+        self.assertIsNone(policy.get_delay(1, 200, None))
+        self.assertIsNone(policy.get_delay(1, 404, None))
+        self.assertIsNone(
+            policy.get_delay(1, ServerError('INVALID_INPUT'), None)
+        )
+        self.assertEqual(
+            policy.get_delay(1, ServerError('MS_MAX_CONCURRENT_REQ'), None), 1
+        )
+
+        policy = RetryPolicy(base_delay=1, jitter=False, deadline=0.5)
+        self.assertIsNone(policy.get_delay(1, 503, policy.get_deadline()))
+
+        policy = RetryPolicy(base_delay=1, jitter=True, deadline=10)
+        for _ in range(20):
+            self.assertTrue(0 <= policy.get_delay(1, 503, None) <= 1)
+        self.assertIsNotNone(policy.get_delay(1, 503, policy.get_deadline()))
+
+    def test_vies(self):
+        """ViesRegistry(retry_policy=..) retries retryable faults
+        """
+
+        registry = self.create_vies_registry(
+            retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01)
+        )
+        result = registry.check_vat_number('11111111', 'DK', False)
+
+        self.assertTrue(result.is_valid)
+        self.assertEqual(self.vies_requests, 3)
+        retries = [line for line in result.log_lines
+                   if line.startswith('> Attempt')]
+        self.assertEqual(len(retries), 2)
+        self.assertIn('fault MS_MAX_CONCURRENT_REQ', retries[0])
+
+        with self.assertRaises(ServerError):
+            registry.check_vat_number('00000000', 'DK', False)
+        self.assertEqual(self.vies_requests, 4)
+
+    def test_vies_exhausted(self):
+        """ViesRegistry(retry_policy=..) raises when attempts are exhausted
+        """
+
+        registry = self.create_vies_registry(
+            retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01)
+        )
+        with self.assertRaises(ServerError):
+            registry.check_vat_number('11111111', 'DK', False)
+        self.assertEqual(self.vies_requests, 2)
+
+    def test_hmrc(self):
+        """HMRCRegistry(retry_policy=..) retries retryable status codes
+        """
+
+        registry = self.create_hmrc_registry(
+            retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01)
+        )
+        result = registry.check_vat_number('429429429', 'GB', False)
+        self.assertIsNone(result.is_valid)
+        self.assertEqual(self.server.request_counts[testing.HMRC], 3)
+
+    def test_hmrc_exhausted(self):
+        """HMRCRegistry(retry_policy=..) is nondeterministic when attempts are
+        exhausted
+        """
+
+        self.server.set_response('GB553557881', [503, 502, 503, 500,
+                                                 CREDITE_SBERGER_DONAL])
+        registry = self.create_hmrc_registry(
+            retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01)
+        )
+        result = registry.check_vat_number('553557881', 'GB', False)
+        self.assertIsNone(result.is_valid)
+        self.assertIn(u'< Response is nondeterministic due to invalid '
+                      u'response status code or MIME type',
+                      result.log_lines)
+
+        result = self.run_async(
+            registry.check_vat_number_async('553557881', 'GB', False)
+        )
+        self.assertIsNone(result.is_valid)
+        self.assertEqual(self.server.request_counts[testing.HMRC], 4)
+
+        self.assertTrue(
+            registry.check_vat_number('553557881', 'GB', False).is_valid
+        )
+
+    def test_async(self):
+        """ViesRegistry.check_vat_number_async() with retry policy
+        """
+
+        registry = self.create_vies_registry(
+            retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01)
+        )
+        result = self.run_async(
+            registry.check_vat_number_async('11111111', 'DK', False)
+        )
+
+        self.assertTrue(result.is_valid)
+        self.assertEqual(self.vies_requests, 3)
+
+    def test_deadline(self):
+        """Registry(retry_policy=RetryPolicy(deadline=..))
+        """
+
+        registry = ViesRegistry(
+            connect_timeout=5,
+            retry_policy=RetryPolicy(max_attempts=100,
+                                     base_delay=0.05,
+                                     deadline=0.3),
+        )
+        registry.CHECK_VAT_SERVICE_URL = 'http://127.0.0.1:1/vies'
+
+        started_at = time.time()
+        result = registry.check_vat_number('54562519', 'DK', False)
+        self.assertLess(time.time() - started_at, 1)
+        self.assertIsNone(result.is_valid)
+
+
+class RegistryHooksTestCase(StandInServerMixin, TestCase):
+    """Test case for registry hooks.
+    """
+
+    def test_vies(self):
+        """ViesRegistry(hooks=..)
+        """
+
+        hooks = RecordingHooks()
+        registry = self.create_vies_registry(hooks=[hooks])
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'DK', False).is_valid
+        )
+
+        self.assertEqual(hooks.names,
+                         ['request_start', 'response', 'parse_done'])
+        started_at = hooks.events[0][1].started_at
+        elapsed = 0
+        for _, event in hooks.events:
+            self.assertEqual(event.registry, 'vies')
+            self.assertEqual(event.vat_number, '54562519')
+            self.assertEqual(event.country_code, 'DK')
+            self.assertEqual(event.attempt, 1)
+            self.assertEqual(event.started_at, started_at)
+            self.assertGreaterEqual(event.duration, 0)
+            self.assertGreaterEqual(event.elapsed, elapsed)
+            elapsed = event.elapsed
+        self.assertIsNone(hooks.events[0][1].status_code)
+        self.assertEqual(hooks.events[1][1].status_code, 200)
+        self.assertEqual(hooks.events[2][1].status_code, 200)
+        self.assertIs(hooks.events[2][1].is_valid, True)
+
+        registry = self.create_vies_rest_registry(hooks=[hooks],
+                                                  name='vies-json')
+        registry.check_vat_number('54562519', 'DK', False)
+        self.assertEqual(hooks.events[-1][1].registry, 'vies-json')
+
+    def test_errors(self):
+        """Registry(hooks=..) on errors
+        """
+
+        hooks = RecordingHooks()
+        registry = self.create_vies_registry(
+            hooks=[hooks],
+            retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01),
+            circuit_breakers=CircuitBreakers(failure_threshold=3),
+        )
+        registry.check_vat_number('11111111', 'DK', False)
+        self.assertEqual(hooks.names, [
+            'request_start', 'response', 'error',
+            'request_start', 'response', 'error',
+            'request_start', 'response', 'parse_done',
+        ])
+        errors = [event for name, event in hooks.events if name == 'error']
+        self.assertEqual([event.attempt for event in errors], [1, 2])
+        self.assertEqual(errors[0].fault_code, 'MS_MAX_CONCURRENT_REQ')
+        self.assertEqual(errors[0].reason, 'fault MS_MAX_CONCURRENT_REQ')
+        self.assertEqual(errors[0].status_code, 200)
+        self.assertIsInstance(errors[0].error, ServerError)
+
+        del hooks.events[:]
+        with self.assertRaises(ServerError):
+            registry.check_vat_number('00000000', 'DK', False)
+        self.assertEqual(hooks.names, ['request_start', 'response', 'error'])
+
+        del hooks.events[:]
+        registry.circuit_breakers['DK'].force_open()
+        self.assertIsNone(
+            registry.check_vat_number('00000000', 'DK', False).is_valid
+        )
+        self.assertEqual(hooks.names, ['error'])
+        self.assertEqual(hooks.events[0][1].reason, 'circuit breaker open')
+
+        del hooks.events[:]
+        registry = ViesRegistry(hooks=[hooks])
+        registry.CHECK_VAT_SERVICE_URL = 'http://127.0.0.1:1/vies'
+        registry.check_vat_number('54562519', 'DK', False)
+        self.assertEqual(hooks.names, ['request_start', 'error'])
+        self.assertEqual(hooks.events[1][1].reason, 'request failed')
+        self.assertIsNotNone(hooks.events[1][1].error)
+
+    def test_hmrc_async(self):
+        """HMRCRegistry.check_vat_number_async() with hooks
+        """
+
+        hooks = RecordingHooks()
+        registry = self.create_hmrc_registry(hooks=[hooks])
+        result = self.run_async(
+            registry.check_vat_number_async('123456789', 'GB', False)
+        )
+
+        self.assertFalse(result.is_valid)
+        self.assertEqual(hooks.names,
+                         ['request_start', 'response', 'parse_done'])
+        self.assertEqual(hooks.events[1][1].registry, 'hmrc')
+        self.assertEqual(hooks.events[1][1].status_code, 404)
+
+    def test_failing_hooks(self):
+        """Registry(hooks=..) ignores exceptions raised by hooks
+        """
+
+        class FailingHooks(RegistryHooks):
+            def on_response(self, event):
+                raise RuntimeError('failing hook')
+
+        hooks = RecordingHooks()
+        registry = self.create_vies_registry(hooks=[FailingHooks(), hooks])
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'DK', False).is_valid
+        )
+        self.assertEqual(hooks.names,
+                         ['request_start', 'response', 'parse_done'])
+
+
+class HedgingTestCase(StandInServerMixin, TestCase):
+    """Test case for hedging requests in :class:`ViesRegistry`.
+    """
+
+    def set_latencies(self, *latencies):
+        latencies = iter(latencies)
+        self.server.latency = lambda random: next(latencies, 0)
+
+    def test_policy(self):
+        """HedgingPolicy.get_delay()
+        """
+
+        policy = HedgingPolicy(percentile=0.9,
+                               initial_delay=2,
+                               min_delay=0.1,
+                               max_delay=5,
+                               min_samples=10)
+        self.assertEqual(policy.get_delay('DK'), 2)
+
+        for i in range(1, 11):
+            policy.record_latency('DK', i / 10.0)
+        self.assertAlmostEqual(policy.get_delay('DK'), 0.9)
+        self.assertAlmostEqual(policy.get_delay('SE'), 0.9)
+
+        for _ in range(10):
+            policy.record_latency('SE', 0.01)
+        self.assertEqual(policy.get_delay('SE'), 0.1)
+        for _ in range(10):
+            policy.record_latency('FR', 10)
+        self.assertEqual(policy.get_delay('FR'), 5)
+
+        with self.assertRaises(ValueError):
+            HedgingPolicy(percentile=1)
+
+    def test_budget(self):
+        """HedgingPolicy.reserve_hedge()
+        """
+
+        policy = HedgingPolicy(budget=0.5, max_tokens=1)
+        self.assertTrue(policy.reserve_hedge())
+        self.assertFalse(policy.reserve_hedge())
+        policy.record_request()
+        self.assertFalse(policy.reserve_hedge())
+        for _ in range(3):
+            policy.record_request()
+        self.assertTrue(policy.reserve_hedge())
+        self.assertFalse(policy.reserve_hedge())
+        self.assertEqual((policy.requests, policy.hedges), (4, 2))
+
+    def test_vies(self):
+        """ViesRegistry(hedging_policy=..) hedges slow requests
+        """
+
+        policy = HedgingPolicy(initial_delay=0.1)
+        registry = self.create_vies_registry(hedging_policy=policy)
+        self.set_latencies(1)
+
+        started_at = time.monotonic()
+        result = registry.check_vat_number('54562519', 'DK', False)
+        self.assertLess(time.monotonic() - started_at, 0.9)
+        self.assertTrue(result.is_valid)
+        self.assertIn(u'> Hedging request unanswered after 0.100 seconds',
+                      result.log_lines)
+        self.assertEqual(self.vies_requests, 2)
+        self.assertEqual((policy.requests, policy.hedges), (1, 1))
+
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'DK', False).is_valid
+        )
+        self.assertEqual(self.vies_requests, 3)
+        self.assertEqual((policy.requests, policy.hedges), (2, 1))
+
+    def test_request_workers(self):
+        """ViesRegistry(hedging_policy=..) reuses its request workers
+        """
+
+        registry = self.create_vies_registry(hedging_policy=HedgingPolicy(),
+                                             pool_size=1)
+        threads = threading.active_count()
+        for _ in range(10):
+            self.assertTrue(
+                registry.check_vat_number('54562519', 'DK', False).is_valid
+            )
+        self.assertLessEqual(threading.active_count(), threads + 2)
+
+        executor = registry._request_executor
+        registry.close()
+        self.assertIsNone(registry._request_executor)
+        self.assertTrue(executor._shutdown)
+
+    def test_failures(self):
+        """ViesRegistry(hedging_policy=..) fails if all requests fail
+        """
+
+        policy = HedgingPolicy(initial_delay=0.1)
+        registry = ViesRegistry(hedging_policy=policy, read_timeout=0.5)
+        registry.CHECK_VAT_SERVICE_URL = 'http://127.0.0.1:1/vies'
+        result = registry.check_vat_number('54562519', 'DK', False)
+        self.assertIsNone(result.is_valid)
+        self.assertIn('Request failed with exception', result.log_lines[-1])
+
+    def test_budget_exhausted(self):
+        """ViesRegistry(hedging_policy=..) does not hedge beyond the budget
+        """
+
+        policy = HedgingPolicy(initial_delay=0.05, budget=0, max_tokens=0)
+        registry = self.create_vies_registry(hedging_policy=policy)
+        self.set_latencies(0.2)
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'DK', False).is_valid
+        )
+        self.assertEqual(self.vies_requests, 1)
+        self.assertEqual(policy.hedges, 0)
+
+    def test_degraded(self):
+        """ViesRegistry(hedging_policy=..) does not hedge degraded states
+        """
+
+        policy = HedgingPolicy(initial_delay=0.05)
+        registry = self.create_vies_rest_registry(
+            circuit_breakers=CircuitBreakers(failure_threshold=3),
+            hedging_policy=policy
+        )
+        registry.circuit_breakers['DK'].record_failure()
+        self.set_latencies(0.2)
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'DK', False).is_valid
+        )
+        self.assertEqual(self.vies_requests, 1)
+        self.assertEqual((policy.requests, policy.hedges), (1, 0))
+
+        self.set_latencies(0.2)
+        self.assertTrue(
+            registry.check_vat_number('54562519', 'SE', False).is_valid
+        )
+        self.assertEqual(self.vies_requests, 3)
+        self.assertEqual(policy.hedges, 1)
+
+    def test_async(self):
+        """ViesRegistry(hedging_policy=..).check_vat_number_async()
+        """
+
+        policy = HedgingPolicy(initial_delay=0.1)
+        registry = self.create_vies_registry(hedging_policy=policy)
+        self.set_latencies(1)
+
+        started_at = time.monotonic()
+        result = self.run_async(
+            registry.check_vat_number_async('54562519', 'DK', False)
+        )
+        self.assertLess(time.monotonic() - started_at, 0.9)
+
+        self.assertTrue(result.is_valid)
+        self.assertEqual(self.vies_requests, 2)
+        self.assertEqual(policy.hedges, 1)
+
+
+__all__ = (
+    'RegistrySessionTestCase',
+    'RegistryCheckTestCase',
+    'ViesRegistryContractTestCase',
+    'ViesRestRegistryContractTestCase',
+    'ViesResponseParsingTestCase',
+    'RegistryLoggingTestCase',
+    'CircuitBreakerTestCase',
+    'RetryPolicyTestCase',
+    'RegistryHooksTestCase',
+    'HedgingTestCase',
+)
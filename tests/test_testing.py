@@ -0,0 +1,171 @@
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from pyvat import testing
+from pyvat.exceptions import ServerError
+from pyvat.registries import HMRCRegistry, ViesRegistry, ViesRestRegistry
+from pyvat.testing import (
+    StandInServer,
+    constant_latency,
+    lognormal_latency,
+    uniform_latency,
+)
+from unittest2 import TestCase
+
+
+class LatencyTestCase(TestCase):
+    """Test case for latency distributions.
+    """
+
+    def test_distributions(self):
+        """Latency distributions
+        """
+
+        generator = random.Random(1)
+        self.assertEqual(constant_latency(0.5)(generator), 0.5)
+        for _ in range(100):
+            self.assertTrue(0.1 <= uniform_latency(0.1, 0.2)(generator) <= 0.2)
+
+        latencies = sorted(lognormal_latency(0.1)(generator)
+                           for _ in range(1001))
+        self.assertAlmostEqual(latencies[500], 0.1, delta=0.02)
+        self.assertGreater(latencies[990], 0.2)
+
+
+class StandInServerTestCase(TestCase):
+    """Test case for :class:`StandInServer`.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_responses(self):
+        """StandInServer.set_response()
+        """
+
+        with StandInServer() as server:
+            server.set_response('DK12345678', False)
+            server.set_response('DK87654321', ['MS_UNAVAILABLE', True])
+            server.set_response('GB123456789', {
+                'name': 'Business',
+                'address': 'Street 1\nCity',
+            })
+
+            for registry in [server.configure(ViesRegistry()),
+                             server.configure(ViesRestRegistry())]:
+                result = registry.check_vat_number('11111111', 'DK', False)
+                self.assertTrue(result.is_valid)
+                self.assertEqual(result.business_name, u'Business DK11111111')
+                self.assertIs(
+                    registry.check_vat_number('12345678', 'DK', False)
+                    .is_valid,
+                    False
+                )
+
+            # Sequences are served in turn, repeating the last response.
+            registry = server.configure(ViesRegistry())
+            with self.assertRaises(ServerError):
+                registry.check_vat_number('87654321', 'DK', False)
+            for _ in range(2):
+                self.assertTrue(
+                    registry.check_vat_number('87654321', 'DK', False)
+                    .is_valid
+                )
+
+            result = server.configure(HMRCRegistry()).check_vat_number(
+                '123456789', 'GB', True
+            )
+            self.assertTrue(result.is_valid)
+            self.assertEqual(result.business_address, 'Street 1, City')
+
+            self.assertEqual(server.request_counts[testing.VIES], 5)
+            self.assertEqual(server.request_counts[testing.VIES_REST], 2)
+            self.assertEqual(server.request_counts[testing.HMRC], 1)
+
+    def test_faults(self):
+        """StandInServer(fault_rates=..)
+        """
+
+        with StandInServer(fault_rates={'MS_MAX_CONCURRENT_REQ': 1}) \
+                as server:
+            with self.assertRaises(ServerError) as context:
+                server.configure(ViesRegistry()).check_vat_number('12345678',
+                                                                  'DK',
+                                                                  False)
+            self.assertEqual(context.exception.fault_code,
+                             'MS_MAX_CONCURRENT_REQ')
+
+        with StandInServer(fault_rates={429: 0.5}, seed=1) as server:
+            registry = server.configure(HMRCRegistry())
+            results = [registry.check_vat_number('123456789', 'GB', False)
+                       for _ in range(100)]
+            valid = sum(1 for result in results if result.is_valid)
+            self.assertTrue(25 < valid < 75)
+
+    def test_latency(self):
+        """StandInServer(latency=..)
+        """
+
+        with StandInServer(latency=constant_latency(0.1)) as server:
+            registry = server.configure(ViesRegistry())
+            started_at = time.time()
+            registry.check_vat_number('12345678', 'DK', False)
+            self.assertGreaterEqual(time.time() - started_at, 0.1)
+
+    def test_record_replay(self):
+        """StandInServer(record=True) and StandInServer.load_recordings()
+        """
+
+        path = os.path.join(self.directory, 'recordings.json')
+
+        with StandInServer() as upstream:
+            upstream.set_response('DK12345678', False)
+            with StandInServer(record=True, upstream_urls={
+                testing.VIES: upstream.url + StandInServer.VIES_PATH,
+                testing.HMRC: upstream.url + StandInServer.HMRC_PATH,
+            }) as server:
+                registry = server.configure(ViesRegistry())
+                self.assertTrue(
+                    registry.check_vat_number('11111111', 'DK', False)
+                    .is_valid
+                )
+                self.assertIs(
+                    registry.check_vat_number('12345678', 'DK', False)
+                    .is_valid,
+                    False
+                )
+                self.assertTrue(
+                    server.configure(HMRCRegistry())
+                    .check_vat_number('123456789', 'GB', False)
+                    .is_valid
+                )
+                server.save_recordings(path)
+            self.assertEqual(upstream.request_counts[testing.VIES], 2)
+
+        with StandInServer(default_response=False) as server:
+            server.load_recordings(path)
+            self.assertEqual(sorted(server.recordings), [
+                'hmrc:GB123456789',
+                'vies:DK11111111',
+                'vies:DK12345678',
+            ])
+            registry = server.configure(ViesRegistry())
+            result = registry.check_vat_number('11111111', 'DK', False)
+            self.assertTrue(result.is_valid)
+            self.assertEqual(result.business_name, u'Business DK11111111')
+            self.assertIs(
+                registry.check_vat_number('12345678', 'DK', False).is_valid,
+                False
+            )
+
+
+__all__ = (
+    'LatencyTestCase',
+    'StandInServerTestCase',
+)
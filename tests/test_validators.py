@@ -1,9 +1,37 @@
+import subprocess
+import sys
+import threading
+import time
+
+import pyvat
 from pyvat import (
     check_vat_number,
+    check_vat_numbers,
+    decompose_vat_number,
     is_vat_number_format_valid,
     VatNumberCheckResult,
 )
-from unittest2 import TestCase
+from pyvat.countries import ISO_3166_COUNTRY_CODES
+from pyvat.exceptions import ServerError
+from pyvat.registries import HMRCRegistry, Registry, ViesRegistry
+from pyvat.testing import StandInServer
+from pyvat.vectorized import validate_formats
+from unittest2 import TestCase, skipUnless
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+try:
+    import pandas
+except ImportError:  # pragma: no cover
+    pandas = None
+
+try:
+    import pycountry
+except ImportError:  # pragma: no cover
+    pycountry = None
 
 VAT_NUMBER_FORMAT_CASES = {
     '': [
@@ -177,6 +205,49 @@ Mapping of VAT number prefix to a list of tuples of:
 """
 
 
+class DecomposeVatNumberTestCase(TestCase):
+    """Test case for :func:`decompose_vat_number`.
+    """
+
+    def test_country_codes(self):
+        """decompose_vat_number('..', country_code=None)
+        """
+
+        self.assertEqual(decompose_vat_number('dk 5456 2519'),
+                         ('54562519', 'DK'))
+        self.assertEqual(decompose_vat_number('EL123456789'),
+                         ('123456789', 'GR'))
+        self.assertEqual(decompose_vat_number('NO123456789MVA'),
+                         ('123456789MVA', 'NO'))
+        self.assertEqual(decompose_vat_number('CHE123456789'),
+                         ('E123456789', 'CH'))
+        for vat_number in ('ZZ123456789', 'UK123456789', 'D', '',
+                           '1A23456789'):
+            self.assertEqual(decompose_vat_number(vat_number),
+                             (vat_number, None))
+
+    def test_no_pycountry(self):
+        """decompose_vat_number() does not load pycountry
+        """
+
+        output = subprocess.check_output([
+            sys.executable,
+            '-c',
+            'import sys, pyvat; pyvat.decompose_vat_number("ZZ123"); '
+            'print("pycountry" in sys.modules)',
+        ])
+        self.assertEqual(output.strip(), b'False')
+
+    @skipUnless(pycountry, 'requires pycountry')
+    def test_iso_3166_country_codes(self):
+        """ISO_3166_COUNTRY_CODES matches pycountry
+        """
+
+        self.assertEqual(ISO_3166_COUNTRY_CODES,
+                         frozenset(country.alpha_2
+                                   for country in pycountry.countries))
+
+
 class IsVatNumberFormatValidTestCase(TestCase):
     """Test case for :func:`is_vat_number_format_valid`.
     """
@@ -230,10 +301,124 @@ class IsVatNumberFormatValidTestCase(TestCase):
                 )
 
 
+class ValidateFormatsTestCase(TestCase):
+    """Test case for :func:`pyvat.vectorized.validate_formats`.
+    """
+
+    def get_cases(self):
+        vat_numbers = []
+        country_codes = []
+        for country_code, cases in VAT_NUMBER_FORMAT_CASES.items():
+            for vat_number, _ in cases:
+                vat_numbers += ['%s%s' % (country_code, vat_number),
+                                vat_number,
+                                '%s %s' % (country_code, vat_number)]
+                country_codes += [None, country_code, country_code]
+        vat_numbers += ['EL123456789', '123456789', 'DK 5456-2519', 'XX123',
+                        '', None, 12345678]
+        country_codes += [None, 'GR', 'dk', None, 'DK', 'DK', 'DK']
+        return vat_numbers, country_codes
+
+    def test_lists(self):
+        """validate_formats([..], [..])
+        """
+
+        vat_numbers, country_codes = self.get_cases()
+        valid, decomposed_country_codes = validate_formats(vat_numbers,
+                                                           country_codes)
+
+        for vat_number, country_code, result, decomposed_country_code in \
+                zip(vat_numbers[:-2],
+                    country_codes,
+                    valid,
+                    decomposed_country_codes):
+            self.assertEqual(
+                result,
+                is_vat_number_format_valid(vat_number, country_code),
+                'expected %r (%s)' % (vat_number, country_code)
+            )
+            self.assertEqual(
+                decomposed_country_code,
+                pyvat.decompose_vat_number(vat_number, country_code)[1]
+            )
+        self.assertEqual(valid[-2:], [False, False])
+        self.assertEqual(decomposed_country_codes[-2:], [None, None])
+        self.assertEqual(decomposed_country_codes[-7], 'GR')
+
+        valid, _ = validate_formats(vat_numbers[:-2])
+        self.assertEqual(valid, [is_vat_number_format_valid(vat_number)
+                                 for vat_number in vat_numbers[:-2]])
+
+        self.assertEqual(validate_formats([]), ([], []))
+        self.assertEqual(validate_formats([u'DK5456\x002519', 'DK54562519']),
+                         ([False, True], ['DK', 'DK']))
+        with self.assertRaises(ValueError):
+            validate_formats(['DK54562519'], [])
+
+    @skipUnless(numpy, 'requires NumPy')
+    def test_numpy(self):
+        """validate_formats(numpy.array(..), ..)
+        """
+
+        valid, country_codes = validate_formats(
+            numpy.array(['DK54562519', '54562519', 'DK5456251']),
+            numpy.array(['', 'DK', ''])
+        )
+        self.assertEqual(valid.dtype, numpy.bool_)
+        self.assertEqual(valid.tolist(), [True, True, False])
+        self.assertEqual(country_codes.tolist(), ['DK', 'DK', 'DK'])
+
+    @skipUnless(pandas, 'requires pandas')
+    def test_pandas(self):
+        """validate_formats(pandas.Series(..), ..)
+        """
+
+        frame = pandas.DataFrame({
+            'vat_number': ['DK54562519', '54562519', None],
+            'country_code': [None, 'DK', None],
+        }, index=[3, 5, 7])
+        valid, country_codes = validate_formats(frame['vat_number'],
+                                                frame['country_code'])
+        self.assertEqual(valid.to_dict(), {3: True, 5: True, 7: False})
+        self.assertEqual(country_codes.to_dict(), {3: 'DK', 5: 'DK', 7: None})
+
+
 class CheckVatNumberTestCase(TestCase):
     """Test case for :func:`check_vat_number`.
+
+    Checks are performed against a stand-in server responding as the
+    registries do for the check cases.
     """
 
+    def setUp(self):
+        self.server = StandInServer(default_response=False).start()
+        for country_code, cases in VAT_NUMBER_CHECK_CASES.items():
+            for vat_number, expected in cases:
+                if expected.is_valid:
+                    self.server.set_response(
+                        '%s%s' % (country_code, vat_number),
+                        {
+                            'name': expected.business_name,
+                            'address': expected.business_address.replace(
+                                ', ', '\n'
+                            ) if country_code == 'GB'
+                            else expected.business_address,
+                        }
+                    )
+
+        self.registries = dict(pyvat.VAT_REGISTRIES)
+        vies_registry = self.server.configure(ViesRegistry())
+        hmrc_registry = self.server.configure(HMRCRegistry())
+        for country_code, registry in self.registries.items():
+            pyvat.VAT_REGISTRIES[country_code] = \
+                hmrc_registry if registry is pyvat.HMRC_REGISTRY \
+                else vies_registry
+
+    def tearDown(self):
+        pyvat.VAT_REGISTRIES.clear()
+        pyvat.VAT_REGISTRIES.update(self.registries)
+        self.server.stop()
+
     def assert_result_equals(self, expected, actual):
         self.assertIsInstance(actual, VatNumberCheckResult)
         self.assertEqual(expected.is_valid, actual.is_valid)
@@ -274,4 +459,194 @@ class CheckVatNumberTestCase(TestCase):
                 )
 
 
-__all__ = ('IsVatNumberFormatValidTestCase', 'CheckVatNumberTestCase',)
+class RecordingRegistry(Registry):
+    """Registry recording checks and deeming VAT numbers ending in 1 valid.
+    """
+
+    def __init__(self, delay=0.01, **kwargs):
+        super(RecordingRegistry, self).__init__(**kwargs)
+        self.delay = delay
+        self.checks = []
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self.lock = threading.Lock()
+
+    def check_vat_number(self, vat_number, country_code, test, fields=None):
+        with self.lock:
+            self.checks.append((vat_number, country_code))
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        try:
+            time.sleep(self.delay)
+            if vat_number.endswith('0'):
+                raise ServerError('MS_UNAVAILABLE')
+            result = VatNumberCheckResult(vat_number.endswith('1'))
+            if fields is None or 'business_name' in fields:
+                result.business_name = u'Business %s' % (vat_number)
+            return result
+        finally:
+            with self.lock:
+                self.concurrent -= 1
+
+
+class RecordingRegistryMixin(object):
+    """Mixin replacing the DK and GR registries with recording registries.
+    """
+
+    def setUp(self):
+        self.registries = dict(pyvat.VAT_REGISTRIES)
+        self.registry = RecordingRegistry(batch_concurrency=2)
+        pyvat.VAT_REGISTRIES['DK'] = self.registry
+        pyvat.VAT_REGISTRIES['GR'] = self.registry
+
+    def tearDown(self):
+        pyvat.VAT_REGISTRIES.clear()
+        pyvat.VAT_REGISTRIES.update(self.registries)
+
+
+class CheckVatNumbersTestCase(RecordingRegistryMixin, TestCase):
+    """Test case for :func:`check_vat_numbers`.
+    """
+
+    VAT_NUMBERS = [
+        'DK12345671',
+        ('12 34 56 71', 'DK'),
+        '123456',
+        'DK12345672',
+        'EL123456781',
+        ('GR123456781', 'GR'),
+        'DK99999O99',
+        'DK12345670',
+    ] + ['DK1234%04d' % (n) for n in range(11, 31)]
+
+    def get_fields(self, result):
+        return (result.is_valid,
+                result.business_name,
+                result.business_address,
+                result.log_lines)
+
+    def test_ordered(self):
+        """check_vat_numbers(.., ordered=True)
+        """
+
+        results = list(check_vat_numbers(self.VAT_NUMBERS))
+
+        self.assertEqual([item for item, _ in results], self.VAT_NUMBERS)
+        self.assertEqual([result.is_valid for _, result in results[:8]],
+                         [True, True, False, False, True, True, False, None])
+        self.assertIsNot(results[0][1], results[1][1])
+        self.assertEqual(self.get_fields(results[0][1]),
+                         self.get_fields(results[1][1]))
+        self.assertIn('MS_UNAVAILABLE', results[7][1].log_lines[0])
+
+        self.assertEqual(len(self.registry.checks),
+                         len(set(self.registry.checks)))
+        self.assertEqual(len(self.registry.checks), 24)
+        self.assertLessEqual(self.registry.max_concurrent, 2)
+
+    def test_unordered(self):
+        """check_vat_numbers(.., ordered=False)
+        """
+
+        results = list(check_vat_numbers(self.VAT_NUMBERS, ordered=False))
+
+        self.assertEqual(sorted(map(repr, (item for item, _ in results))),
+                         sorted(map(repr, self.VAT_NUMBERS)))
+        self.assertEqual(results[0], ('123456', results[0][1]))
+        self.assertIs(results[0][1].is_valid, False)
+
+        duplicates = [result for item, result in results
+                      if item in ('DK12345671', ('12 34 56 71', 'DK'))]
+        self.assertIsNot(duplicates[0], duplicates[1])
+        self.assertEqual(self.get_fields(duplicates[0]),
+                         self.get_fields(duplicates[1]))
+
+    def test_concurrency(self):
+        """check_vat_numbers(.., executor=.., concurrency=..)
+        """
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(check_vat_numbers(
+                self.VAT_NUMBERS,
+                executor=executor,
+                concurrency={self.registry: 5},
+            ))
+
+        self.assertEqual(len(results), len(self.VAT_NUMBERS))
+        self.assertGreater(self.registry.max_concurrent, 2)
+        self.assertLessEqual(self.registry.max_concurrent, 5)
+
+    def test_invalid_concurrency(self):
+        """check_vat_numbers(.., concurrency=..) with caps less than 1
+        """
+
+        for cap in (0, -1):
+            with self.assertRaises(ValueError):
+                list(check_vat_numbers(self.VAT_NUMBERS,
+                                       concurrency={self.registry: cap}))
+
+        self.registry.batch_concurrency = 0
+        with self.assertRaises(ValueError):
+            list(check_vat_numbers(self.VAT_NUMBERS))
+        self.assertEqual(self.registry.checks, [])
+
+        # Registries without VAT numbers to check are not concerned.
+        self.assertEqual(len(list(check_vat_numbers(['DK123']))), 1)
+
+
+class CheckVatNumberCoalescingTestCase(RecordingRegistryMixin, TestCase):
+    """Test case for coalescing concurrent :func:`check_vat_number` calls.
+    """
+
+    def check_concurrently(self, vat_numbers):
+        self.registry.delay = 0.2
+        results = [None] * len(vat_numbers)
+
+        def check(index):
+            try:
+                results[index] = check_vat_number(vat_numbers[index])
+            except Exception as exception:
+                results[index] = exception
+
+        threads = [threading.Thread(target=check, args=(index, ))
+                   for index in range(len(vat_numbers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_coalescing(self):
+        """check_vat_number() coalesces concurrent checks
+        """
+
+        results = self.check_concurrently(['DK12345671'] * 8 +
+                                          ['DK12345672'] * 4)
+
+        self.assertEqual(sorted(self.registry.checks),
+                         [('12345671', 'DK'), ('12345672', 'DK')])
+        self.assertEqual([result.is_valid for result in results],
+                         [True] * 8 + [False] * 4)
+        self.assertEqual(len(set(map(id, results))), 12)
+
+    def test_exceptions(self):
+        """check_vat_number() shares exceptions of coalesced checks
+        """
+
+        results = self.check_concurrently(['DK12345670'] * 4)
+
+        self.assertEqual(len(self.registry.checks), 1)
+        for result in results:
+            self.assertIsInstance(result, ServerError)
+
+
+__all__ = (
+    'DecomposeVatNumberTestCase',
+    'IsVatNumberFormatValidTestCase',
+    'ValidateFormatsTestCase',
+    'CheckVatNumberTestCase',
+    'CheckVatNumbersTestCase',
+    'CheckVatNumberCoalescingTestCase',
+)